@@ -1,12 +1,24 @@
 #!/usr/bin/env python
 
 
-def main():
+def _add_module_path():
+    import os
     import sys
 
-    if len(sys.argv) == 1:
-        exit("Usage: nes file")
-    print(sys.argv[1])
+    # The emulator modules import each other as top level modules
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    _add_module_path()
+    from headless import main as headless_main
+    return headless_main()
+
+
+def batch_main():
+    _add_module_path()
+    from batch import main as batch_main
+    return batch_main()
 
 
 if __name__ == "__main__":
@@ -1,5 +1,10 @@
 from typing import List, Tuple
 
+import numpy as np
+
+# Colour channels darkened when a PPUMask emphasis bit (red, green, blue) is set
+_EMPHASIS_ATTENUATION = 0.75
+
 
 def _create_palette() -> List[Tuple[int, int, int]]:
     pal = [0x00] * 0x40
@@ -72,3 +77,16 @@ def _create_palette() -> List[Tuple[int, int, int]]:
     pal[0x3F] = (0, 0, 0)
     return pal
 
+
+def _create_emphasis_palette(pal: List[Tuple[int, int, int]]) -> np.ndarray:
+    # RGB for every combination of the 3 emphasis bits (PPUMask >> 5) and the
+    # 64 colours; emphasising a channel darkens the other two
+    colors = np.array(pal, dtype=np.float64)
+    lut = np.empty((8, 0x40, 3), dtype=np.uint8)
+    for emphasis in range(8):
+        scale = np.ones(3)
+        for channel in range(3):
+            if emphasis & (1 << channel):
+                scale[np.arange(3) != channel] *= _EMPHASIS_ATTENUATION
+        lut[emphasis] = np.round(colors * scale)
+    return lut
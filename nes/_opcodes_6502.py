@@ -121,8 +121,7 @@ def _add(cpu, fetched):
     carry = cpu.state.get_flag(Flags6502.C)
     temp = (a & 0xffff) + (fetched & 0xffff) + (carry & 0xffff)
     cpu.state.set_flag(Flags6502.C, temp > 0xff)
-    cpu.state.set_flag(Flags6502.Z, (temp & 0x00ff) == 0)
-    cpu.state.set_flag(Flags6502.N, temp & 0x80)
+    cpu.state._nz = temp & 0x00ff
     overflow = ~(a ^ fetched) & (a ^ temp) & 0x0080
     cpu.state.set_flag(Flags6502.V, overflow)
     cpu.state.a = temp & 0x00ff
@@ -147,8 +146,7 @@ def ANC(cpu: CPU6502):
 def AND(cpu: CPU6502):
     fetched = cpu.fetch()
     cpu.state.a = cpu.state.a & fetched
-    cpu.state.set_flag(Flags6502.Z, cpu.state.a == 0x00)
-    cpu.state.set_flag(Flags6502.N, cpu.state.a & 0x80)
+    cpu.state._nz = cpu.state.a
     return 1
 
 
@@ -157,8 +155,7 @@ def ASL(cpu: CPU6502):
     fetched = cpu.fetch()
     cpu.state.set_flag(Flags6502.C, fetched & 0x80)
     fetched = (fetched << 1) & 0xFF
-    cpu.state.set_flag(Flags6502.Z, fetched == 0x00)
-    cpu.state.set_flag(Flags6502.N, fetched & 0x80)
+    cpu.state._nz = fetched
 
     if lookup[cpu.state.opcode].addr_mode == IMP:
         cpu.state.a = fetched
@@ -178,21 +175,21 @@ def _branch(cpu: CPU6502):
 
 # branch on carry clear
 def BCC(cpu: CPU6502):
-    if not cpu.state.get_flag(Flags6502.C):
+    if not cpu.state._status & Flags6502.C:
         _branch(cpu)
     return 0
 
 
 # branch on carry set
 def BCS(cpu: CPU6502):
-    if cpu.state.get_flag(Flags6502.C):
+    if cpu.state._status & Flags6502.C:
         _branch(cpu)
     return 0
 
 
 # branch on equal (zero set)
 def BEQ(cpu: CPU6502):
-    if cpu.state.get_flag(Flags6502.Z):
+    if not cpu.state._nz & 0xFF:
         _branch(cpu)
     return 0
 
@@ -201,29 +198,30 @@ def BEQ(cpu: CPU6502):
 def BIT(cpu: CPU6502):
     fetched = cpu.fetch()
     temp = cpu.state.a & fetched
-    cpu.state.set_flag(Flags6502.Z, (temp & 0x00FF) == 0x00)
-    cpu.state.set_flag(Flags6502.N, fetched & (1 << 7))
+    # Z comes from the AND result while N is bit 7 of the operand
+    n = fetched & (1 << 7)
+    cpu.state._nz = n | 0x01 if temp & 0x00FF else n << 1
     cpu.state.set_flag(Flags6502.V, fetched & (1 << 6))
     return 0
 
 
 # branch on minus (negative set)
 def BMI(cpu: CPU6502):
-    if cpu.state.get_flag(Flags6502.N):
+    if cpu.state._nz & 0x180:
         _branch(cpu)
     return 0
 
 
 # branch on not equal (zero clear)
 def BNE(cpu: CPU6502):
-    if not cpu.state.get_flag(Flags6502.Z):
+    if cpu.state._nz & 0xFF:
         _branch(cpu)
     return 0
 
 
 # branch on plus (negative clear)
 def BPL(cpu: CPU6502):
-    if cpu.state.get_flag(Flags6502.N) == 0:
+    if not cpu.state._nz & 0x180:
         _branch(cpu)
     return 0
 
@@ -239,14 +237,14 @@ def BRK(cpu: CPU6502):
 
 # branch on overflow clear
 def BVC(cpu: CPU6502):
-    if not cpu.state.get_flag(Flags6502.V):
+    if not cpu.state._status & Flags6502.V:
         _branch(cpu)
     return 0
 
 
 # branch on overflow set
 def BVS(cpu: CPU6502):
-    if cpu.state.get_flag(Flags6502.V):
+    if cpu.state._status & Flags6502.V:
         _branch(cpu)
     return 0
 
@@ -281,8 +279,7 @@ def CMP(cpu: CPU6502):
 
     temp = cpu.state.a - fetched
     cpu.state.set_flag(Flags6502.C, (cpu.state.a & 0xFF) >= fetched)
-    cpu.state.set_flag(Flags6502.Z, (temp & 0x00ff) == 0x00)
-    cpu.state.set_flag(Flags6502.N, temp & 0x80)
+    cpu.state._nz = temp & 0x00ff
     return 1
 
 
@@ -291,8 +288,7 @@ def CPX(cpu: CPU6502):
     fetched = cpu.fetch()
     temp = cpu.state.x - fetched
     cpu.state.set_flag(Flags6502.C, cpu.state.x >= fetched)
-    cpu.state.set_flag(Flags6502.Z, (temp & 0x00ff) == 0x00)
-    cpu.state.set_flag(Flags6502.N, temp & 0x80)
+    cpu.state._nz = temp & 0x00ff
     return 1
 
 
@@ -301,8 +297,7 @@ def CPY(cpu: CPU6502):
     fetched = cpu.fetch()
     temp = cpu.state.y - fetched
     cpu.state.set_flag(Flags6502.C, cpu.state.y >= fetched)
-    cpu.state.set_flag(Flags6502.Z, (temp & 0x00ff) == 0x00)
-    cpu.state.set_flag(Flags6502.N, temp & 0x80)
+    cpu.state._nz = temp & 0x00ff
     return 1
 
 
@@ -318,24 +313,21 @@ def DEC(cpu: CPU6502):
     value = cpu.fetch()
     value -= 1
     cpu.cpu_write(cpu.state.addr_abs, value & 0xff)
-    cpu.state.set_flag(Flags6502.Z, (value & 0xff) == 0x00)
-    cpu.state.set_flag(Flags6502.N, value & 0x0080)
+    cpu.state._nz = value & 0xff
     return 0
 
 
 # decrement X
 def DEX(cpu: CPU6502):
     cpu.state.x = (cpu.state.x - 0x01) & 0xff
-    cpu.state.set_flag(Flags6502.Z, cpu.state.x == 0x00)
-    cpu.state.set_flag(Flags6502.N, cpu.state.x & 0x80)
+    cpu.state._nz = cpu.state.x
     return 0
 
 
 # decrement Y
 def DEY(cpu: CPU6502):
     cpu.state.y = (cpu.state.y - 0x01) & 0xff
-    cpu.state.set_flag(Flags6502.Z, cpu.state.y == 0x00)
-    cpu.state.set_flag(Flags6502.N, cpu.state.y & 0x80)
+    cpu.state._nz = cpu.state.y
     return 0
 
 
@@ -343,8 +335,7 @@ def DEY(cpu: CPU6502):
 def EOR(cpu: CPU6502):
     m = cpu.fetch()
     cpu.state.a ^= (m & 0xff)
-    cpu.state.set_flag(Flags6502.Z, cpu.state.a == 0x00)
-    cpu.state.set_flag(Flags6502.N, cpu.state.a & 0x80)
+    cpu.state._nz = cpu.state.a
     return 1
 
 
@@ -353,24 +344,21 @@ def INC(cpu: CPU6502):
     value = cpu.fetch()
     value += 1
     cpu.cpu_write(cpu.state.addr_abs, value & 0xff)
-    cpu.state.set_flag(Flags6502.Z, (value & 0xff) == 0x00)
-    cpu.state.set_flag(Flags6502.N, value & 0x0080)
+    cpu.state._nz = value & 0xff
     return 0
 
 
 # increment X
 def INX(cpu: CPU6502):
     cpu.state.x = (cpu.state.x + 0x01) & 0xFF
-    cpu.state.set_flag(Flags6502.Z, cpu.state.x == 0x00)
-    cpu.state.set_flag(Flags6502.N, cpu.state.x & 0x80)
+    cpu.state._nz = cpu.state.x
     return 0
 
 
 # increment Y
 def INY(cpu: CPU6502):
     cpu.state.y = (cpu.state.y + 0x01) & 0xFF
-    cpu.state.set_flag(Flags6502.Z, cpu.state.y == 0x00)
-    cpu.state.set_flag(Flags6502.N, cpu.state.y & 0x80)
+    cpu.state._nz = cpu.state.y
     return 0
 
 
@@ -404,32 +392,28 @@ def LAX(cpu: CPU6502):
     value = cpu.fetch() & 0xFF
     cpu.state.a = value
     cpu.state.x = value
-    cpu.state.set_flag(Flags6502.Z, value == 0x00)
-    cpu.state.set_flag(Flags6502.N, value & 0x80)
+    cpu.state._nz = value
     return 1
 
 
 # load accumulator
 def LDA(cpu: CPU6502):
     cpu.state.a = cpu.fetch() & 0xFF
-    cpu.state.set_flag(Flags6502.Z, cpu.state.a == 0x00)
-    cpu.state.set_flag(Flags6502.N, cpu.state.a & 0x80)
+    cpu.state._nz = cpu.state.a
     return 1
 
 
 # load X
 def LDX(cpu: CPU6502):
     cpu.state.x = cpu.fetch() & 0xFF
-    cpu.state.set_flag(Flags6502.Z, cpu.state.x == 0x00)
-    cpu.state.set_flag(Flags6502.N, cpu.state.x & 0x80)
+    cpu.state._nz = cpu.state.x
     return 1
 
 
 # load Y
 def LDY(cpu: CPU6502):
     cpu.state.y = cpu.fetch() & 0xFF
-    cpu.state.set_flag(Flags6502.Z, cpu.state.y == 0x00)
-    cpu.state.set_flag(Flags6502.N, cpu.state.y & 0x80)
+    cpu.state._nz = cpu.state.y
     return 1
 
 
@@ -438,8 +422,7 @@ def LSR(cpu: CPU6502):
     fetched = cpu.fetch() & 0xFF
     cpu.state.set_flag(Flags6502.C, fetched & 0x01)
     fetched = (fetched >> 1) & 0xFF
-    cpu.state.set_flag(Flags6502.Z, fetched == 0x00)
-    cpu.state.set_flag(Flags6502.N, 0)
+    cpu.state._nz = fetched
 
     if lookup[cpu.state.opcode].addr_mode == IMP:
         cpu.state.a = fetched
@@ -459,8 +442,7 @@ def NOP(cpu: CPU6502):
 def ORA(cpu: CPU6502):
     m = cpu.fetch()
     cpu.state.a |= (m & 0xff)
-    cpu.state.set_flag(Flags6502.Z, cpu.state.a == 0x00)
-    cpu.state.set_flag(Flags6502.N, cpu.state.a & 0x80)
+    cpu.state._nz = cpu.state.a
     return 1
 
 
@@ -479,8 +461,7 @@ def PHP(cpu: CPU6502):
 # pull accumulator
 def PLA(cpu: CPU6502):
     cpu.state.a = cpu.pop_value_from_stack()
-    cpu.state.set_flag(Flags6502.Z, cpu.state.a == 0x00)
-    cpu.state.set_flag(Flags6502.N, cpu.state.a & 0x80)
+    cpu.state._nz = cpu.state.a
     return 0
 
 
@@ -498,8 +479,7 @@ def RLA(cpu: CPU6502):
     fetched = (fetched << 1) | cpu.state.get_flag(Flags6502.C)
     cpu.state.set_flag(Flags6502.C, fetched & 0xFF00)
     cpu.state.a = cpu.state.a & fetched
-    cpu.state.set_flag(Flags6502.Z, cpu.state.a == 0x00)
-    cpu.state.set_flag(Flags6502.N, cpu.state.a & 0x80)
+    cpu.state._nz = cpu.state.a
     cpu.cpu_write(cpu.state.addr_abs, fetched & 0xFF)
     return 0
 
@@ -510,8 +490,7 @@ def ROL(cpu: CPU6502):
     fetched = (fetched << 1) | cpu.state.get_flag(Flags6502.C)
     cpu.state.set_flag(Flags6502.C, fetched & 0xFF00)
     fetched &= 0xFF
-    cpu.state.set_flag(Flags6502.Z, fetched == 0x00)
-    cpu.state.set_flag(Flags6502.N, fetched & 0x80)
+    cpu.state._nz = fetched
 
     if lookup[cpu.state.opcode].addr_mode == IMP:
         cpu.state.a = fetched
@@ -527,8 +506,7 @@ def ROR(cpu: CPU6502):
     fetched = (cpu.state.get_flag(Flags6502.C) << 7) | (fetched >> 1)
     fetched &= 0xFF
     cpu.state.set_flag(Flags6502.C, carry)
-    cpu.state.set_flag(Flags6502.Z, fetched == 0x00)
-    cpu.state.set_flag(Flags6502.N, fetched & 0x80)
+    cpu.state._nz = fetched
 
     if lookup[cpu.state.opcode].addr_mode == IMP:
         cpu.state.a = fetched
@@ -606,8 +584,7 @@ def SLO(cpu: CPU6502):
 
     cpu.state.a |= (m & 0xff)
     cpu.state.set_flag(Flags6502.C, m & 0xFF00)
-    cpu.state.set_flag(Flags6502.Z, cpu.state.a == 0x00)
-    cpu.state.set_flag(Flags6502.N, cpu.state.a & 0x80)
+    cpu.state._nz = cpu.state.a
 
     cpu.cpu_write(cpu.state.addr_abs, m & 0xFF)
     return 0
@@ -620,8 +597,7 @@ def SRE(cpu: CPU6502):
     m = (m >> 1) & 0xFF
 
     cpu.state.a ^= m
-    cpu.state.set_flag(Flags6502.Z, cpu.state.a == 0x00)
-    cpu.state.set_flag(Flags6502.N, cpu.state.a & 0x80)
+    cpu.state._nz = cpu.state.a
 
     cpu.cpu_write(cpu.state.addr_abs, m & 0xFF)
     return 0
@@ -648,32 +624,28 @@ def STY(cpu: CPU6502):
 # transfer accumulator to X
 def TAX(cpu: CPU6502):
     cpu.state.x = cpu.state.a
-    cpu.state.set_flag(Flags6502.Z, cpu.state.x == 0x00)
-    cpu.state.set_flag(Flags6502.N, cpu.state.x & 0x80)
+    cpu.state._nz = cpu.state.x
     return 0
 
 
 # transfer accumulator to Y
 def TAY(cpu: CPU6502):
     cpu.state.y = cpu.state.a
-    cpu.state.set_flag(Flags6502.Z, cpu.state.y == 0x00)
-    cpu.state.set_flag(Flags6502.N, cpu.state.y & 0x80)
+    cpu.state._nz = cpu.state.y
     return 0
 
 
 # transfer stack pointer to X
 def TSX(cpu: CPU6502):
     cpu.state.x = cpu.state.stkp
-    cpu.state.set_flag(Flags6502.Z, cpu.state.x == 0x00)
-    cpu.state.set_flag(Flags6502.N, cpu.state.x & 0x80)
+    cpu.state._nz = cpu.state.x
     return 0
 
 
 # transfer X to accumulator
 def TXA(cpu: CPU6502):
     cpu.state.a = cpu.state.x
-    cpu.state.set_flag(Flags6502.Z, cpu.state.a == 0x00)
-    cpu.state.set_flag(Flags6502.N, cpu.state.a & 0x80)
+    cpu.state._nz = cpu.state.a
     return 0
 
 
@@ -686,8 +658,7 @@ def TXS(cpu: CPU6502):
 # transfer Y to accumulator
 def TYA(cpu: CPU6502):
     cpu.state.a = cpu.state.y
-    cpu.state.set_flag(Flags6502.Z, cpu.state.a == 0x00)
-    cpu.state.set_flag(Flags6502.N, cpu.state.a & 0x80)
+    cpu.state._nz = cpu.state.a
     return 0
 
 
@@ -989,6 +960,24 @@ lookup = [
 ]
 
 
+def _fuse(instruction: Instruction):
+    # Bind addressing mode, operation and base cycle count into one callable
+    # so that the CPU only has to do a single indexed call per instruction.
+    addr_mode = instruction.addr_mode
+    operate = instruction.operate
+    cycles = instruction.cycles
+
+    def execute(cpu: CPU6502):
+        return cycles + (addr_mode(cpu) & operate(cpu))
+
+    execute.__name__ = f'{operate.__name__}_{addr_mode.__name__}'
+    return execute
+
+
+# Fused callables indexed by opcode, each returns the cycles consumed
+dispatch = [_fuse(instruction) for instruction in lookup]
+
+
 class AsmCPU:
     def __init__(self, addr, bus):
         self.bus = bus
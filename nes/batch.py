@@ -0,0 +1,100 @@
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Sequence, Union
+
+from headless import create_nes, run
+from rom_info import RomCache
+
+# nestest leaves its result codes in $02 and $03, blargg's tests in $6000
+DEFAULT_STATUS = (0x0002, 0x0003, 0x6000)
+
+
+def find_roms(paths: Iterable[str]) -> List[str]:
+    # Files are taken as they are, directories are searched for .nes files
+    roms = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                roms.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith('.nes'))
+        else:
+            roms.append(path)
+    return roms
+
+
+def run_rom(rom: str, frames: int, recompile=False, scanline_renderer=False,
+            status: Sequence[int] = DEFAULT_STATUS, rom_cache: Union[str, None] = None) -> Dict:
+    """
+    Run one ROM on a fresh machine and describe where it ended up. Runs in a
+    worker process, so failures are reported in the result instead of raised.
+    With a ROM cache directory the result also identifies the ROM by its
+    hashes.
+    """
+    result = {'rom': rom}
+    try:
+        # The emulator's diagnostics must not end up in the JSON lines
+        with contextlib.redirect_stdout(sys.stderr):
+            nes = create_nes(rom, recompile, scanline_renderer,
+                             rom_cache=RomCache(rom_cache) if rom_cache is not None else None)
+            run_result = run(nes, frames=frames)
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+        return result
+
+    if rom_cache is not None:
+        result['crc32'] = nes.cart.info.crc32
+        result['sha1'] = nes.cart.info.sha1
+    result.update(run_result.as_dict())
+    result['frame_hash'] = hashlib.sha1(nes.ppu.frame_buffer.tobytes()).hexdigest()
+    result['status'] = {f'${addr:04X}': nes.cpu_read(addr, read_only=True) for addr in status}
+    return result
+
+
+def run_batch(roms: Sequence[str], frames: int, workers: Union[int, None] = None, recompile=False,
+              scanline_renderer=False, status: Sequence[int] = DEFAULT_STATUS,
+              rom_cache: Union[str, None] = None) -> Iterator[Dict]:
+    # Yield the result of every ROM as soon as its worker is done with it
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_rom, rom, frames, recompile, scanline_renderer, tuple(status), rom_cache)
+                   for rom in roms]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='nes-batch',
+                                     description='Run many NES ROMs in parallel and print a JSON line per ROM.')
+    parser.add_argument('paths', nargs='+', help='iNES ROM files or directories to search for them')
+    parser.add_argument('-f', '--frames', type=int, default=60, help='frames to run every ROM for (default 60)')
+    parser.add_argument('-j', '--workers', type=int, help='worker processes (default: one per CPU)')
+    parser.add_argument('--status', metavar='ADDR', type=lambda addr: int(addr, 0), action='append',
+                        help='CPU address to report at the end, may be repeated (default $0002, $0003, $6000)')
+    parser.add_argument('--recompile', action='store_true', help='run the CPU through the block recompiler')
+    parser.add_argument('--scanline-renderer', action='store_true', help='render whole scanlines at once')
+    parser.add_argument('--rom-cache', metavar='DIR', help='keep ROM metadata in DIR and report ROM hashes')
+    return parser
+
+
+def main(argv: Union[List[str], None] = None):
+    parser = create_parser()
+    args = parser.parse_args(argv)
+    if args.workers is not None and args.workers < 1:
+        parser.error('--workers must be at least 1')
+
+    roms = find_roms(args.paths)
+    status = args.status or DEFAULT_STATUS
+    failed = 0
+    for result in run_batch(roms, args.frames, args.workers, args.recompile, args.scanline_renderer, status,
+                            args.rom_cache):
+        failed += 'error' in result
+        print(json.dumps(result), flush=True)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
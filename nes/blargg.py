@@ -0,0 +1,89 @@
+import argparse
+import sys
+from dataclasses import dataclass
+from typing import List, Union
+
+from bus import Bus
+from headless import create_nes
+
+# blargg's test ROMs report through PRG RAM: a status byte at $6000, the
+# signature DE B0 61 at $6001 once the status is valid and a zero
+# terminated message from $6004 on
+STATUS_RUNNING = 0x80
+STATUS_NEEDS_RESET = 0x81
+SIGNATURE = b'\xDE\xB0\x61'
+
+# A ROM asking for a reset wants the button held for at least 100 ms
+RESET_DELAY = 6
+
+
+@dataclass
+class BlarggResult:
+    rom: str
+    status: Union[int, None]  # None if the ROM never reported a status
+    message: str
+    frames: int
+    timed_out: bool
+
+    @property
+    def passed(self) -> bool:
+        return not self.timed_out and self.status == 0
+
+
+def read_status(nes: Bus) -> Union[int, None]:
+    ram = nes.cart.prg_ram
+    if ram[1:4] != SIGNATURE:
+        return None
+    return ram[0]
+
+
+def read_message(nes: Bus) -> str:
+    text = nes.cart.prg_ram[4:].split(b'\x00', 1)[0]
+    return text.decode('ascii', errors='replace').strip()
+
+
+def run_blargg(rom: str, max_frames=3600, recompile=False) -> BlarggResult:
+    """
+    Run a test ROM until it reports a result, resetting the machine when it
+    asks for that, or give up after max_frames. Nothing is drawn, the result
+    is read from PRG RAM.
+    """
+    nes = create_nes(rom, recompile, timing_only=True)
+    status = None
+    reset_frame = None
+    for frame in range(1, max_frames + 1):
+        nes.run_frame()
+        status = read_status(nes)
+        if status == STATUS_NEEDS_RESET:
+            if reset_frame is None:
+                reset_frame = frame + RESET_DELAY
+            elif frame >= reset_frame:
+                nes.reset()
+                reset_frame = None
+        elif status is not None and status != STATUS_RUNNING:
+            return BlarggResult(rom, status, read_message(nes), frame, timed_out=False)
+        else:
+            reset_frame = None
+    return BlarggResult(rom, status, read_message(nes), max_frames, timed_out=True)
+
+
+def main(argv: Union[List[str], None] = None):
+    parser = argparse.ArgumentParser(prog='blargg', description="Run blargg's NES test ROMs.")
+    parser.add_argument('roms', nargs='+', help='test ROM files')
+    parser.add_argument('-m', '--max-frames', type=int, default=3600, help='give up after this many frames')
+    parser.add_argument('--recompile', action='store_true', help='run the CPU through the block recompiler')
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for rom in args.roms:
+        result = run_blargg(rom, args.max_frames, args.recompile)
+        failed += not result.passed
+        outcome = 'passed' if result.passed else 'timed out' if result.timed_out else f'failed ({result.status})'
+        print(f'{rom}: {outcome} after {result.frames} frames')
+        if result.message:
+            print(result.message)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
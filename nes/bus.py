@@ -1,36 +1,206 @@
+import heapq
+import itertools
+import struct
+
 from cpu_6502 import CPU6502
 from ppu_2C02 import PPU2C02
 from cartridge import Cartridge
+from recompiler_6502 import BlockCompiler
+
+STATE_MAGIC = b'NESS'
+STATE_VERSION = 5
+
+_STATE_HEADER = struct.Struct('<4sB')
+_SECTION = struct.Struct('<I')
+# System clock, controllers and DMA, followed by CPU RAM
+_STATE = struct.Struct('<Q4BB?Q')
+
+# The time of the next event when nothing is scheduled
+_NEVER = 1 << 62
 
 
 class Bus:
-    def __init__(self):
+    def __init__(self, recompile=False, scanline_renderer=False):
         self.cpu = CPU6502(self)
-        self.ppu = PPU2C02(self)
+        self.ppu = PPU2C02(self, scanline_renderer)
         self.cart: Cartridge = None
-        self.cpu_ram = [0x00] * 2048
+        self.recompile = recompile
+        self.compiler: BlockCompiler = None
+        self._cpu_step = self.cpu.step
+        self.cpu_ram = bytearray(2048)
+        self.cpu_ram_view = memoryview(self.cpu_ram)
         self.system_clock_counter = 0
 
+        self._read_page = [None] * 256
+        self._write_page = [None] * 256
+
         self.controller_state = [0x00, 0x00]
         self.controller = [0x00, 0x00]
 
         self._dma_page = 0x00
-        self._dma_addr = 0x00
-        self._dma_data = 0x00
         self._dma_transfer = False
-        self._dma_dummy = True
+        self._dma_cycle = 0  # the CPU cycle after the write to $4014
+
+        # Things due at a master clock cycle, kept as [cycle, order, callback]
+        self._events = []
+        self._event_order = itertools.count()
+        self._next_event = _NEVER
+        self._irq_sources = set()
+        self._irq_poll = None
+
+    def schedule(self, cycle: int, callback) -> list:
+        """
+        Call callback once the master clock reaches cycle, after the CPU
+        instruction running then. Events due at the same cycle run in the
+        order they were scheduled. The returned event can be cancelled.
+        """
+        event = [cycle, next(self._event_order), callback]
+        heapq.heappush(self._events, event)
+        if cycle < self._next_event:
+            self._next_event = cycle
+        return event
+
+    def cancel(self, event: list):
+        # Cancelled events stay queued and are dropped when they are due
+        event[2] = None
+
+    def _run_events(self):
+        events = self._events
+        while events and events[0][0] <= self.system_clock_counter:
+            callback = heapq.heappop(events)[2]
+            if callback is not None:
+                callback()
+        self._next_event = events[0][0] if events else _NEVER
+
+    def _restore_events(self):
+        # Queue again what the saved flags say is pending
+        self._events.clear()
+        self._next_event = _NEVER
+        if self._dma_transfer:
+            self.schedule(self._dma_cycle, self._run_dma)
+        if self.ppu.nmi:
+            self.request_nmi()
+        self._irq_sources.clear()
+        self._irq_poll = None
+        if self.cart is not None:
+            self.cart.mapper.reschedule()
+
+    def request_nmi(self):
+        # The CPU takes the NMI once the current instruction is done
+        self.schedule(self.system_clock_counter, self._take_nmi)
+
+    def _take_nmi(self):
+        if self.ppu.nmi:
+            self.ppu.nmi = False
+            self.cpu.nmi()
+
+    def set_irq(self, source, asserted: bool):
+        # IRQ is level triggered: while any source holds the line the CPU
+        # is asked after every instruction, until it takes the IRQ with the
+        # I flag clear or the source lets go
+        if asserted:
+            self._irq_sources.add(source)
+            if self._irq_poll is None:
+                self._irq_poll = self.schedule(self.system_clock_counter, self._poll_irq)
+        else:
+            self._irq_sources.discard(source)
+
+    def _poll_irq(self):
+        if not self._irq_sources:
+            self._irq_poll = None
+            return
+        if not self.cpu.state.cycles:
+            self.cpu.irq()
+        self._irq_poll = self.schedule(self.system_clock_counter + 1, self._poll_irq)
 
     def cpu_write(self, addr: int, data: int):
-        if self.cart.cpu_write(addr, data) is not None:
-            pass
-        elif 0x0000 <= addr <= 0x1FFF:
-            self.cpu_ram[addr & 0x7FF] = data
-        elif 0x2000 <= addr <= 0x3FFF:
-            self.ppu.cpu_write(addr & 0x0007, data)
-        elif addr == 0x4014:
+        self._write_page[(addr >> 8) & 0xFF](addr, data)
+
+    def cpu_read(self, addr: int, read_only=False) -> int:
+        return self._read_page[(addr >> 8) & 0xFF](addr)
+
+    def cpu_read_2(self, addr: int, read_only=False) -> (int, int):
+        read_page = self._read_page
+        return read_page[(addr >> 8) & 0xFF](addr), read_page[((addr + 1) >> 8) & 0xFF](addr + 1)
+
+    def insert_cartridge(self, cartridge: Cartridge):
+        self.cart = cartridge
+        self.ppu.connect_cartridge(cartridge)
+        self._map_pages()
+
+        if isinstance(cartridge, Cartridge):
+            cartridge.mapper.connect_bus(self)
+            cartridge.mapper.prg_switch_listeners.append(self._map_rom_pages)
+            self._map_rom_pages(0x8000, 0xFFFF)
+
+        if self.recompile:
+            self.compiler = BlockCompiler(self)
+            self._cpu_step = self.compiler.step
+
+    def _map_pages(self):
+        # Every 256 byte page of the CPU address space gets a read and a write
+        # handler, so an access is a single table lookup and call
+        ram = self.cpu_ram
+
+        def read_ram(addr):
+            return ram[addr & 0x07FF]
+
+        def write_ram(addr, data):
+            ram[addr & 0x07FF] = data
+
+        ppu = self.ppu
+
+        def read_ppu(addr):
+            return ppu.cpu_read(addr & 0x0007)
+
+        def write_ppu(addr, data):
+            ppu.cpu_write(addr & 0x0007, data)
+
+        self._write_ram = write_ram
+        for page in range(0x00, 0x20):
+            self._read_page[page] = read_ram
+            self._write_page[page] = write_ram
+        for page in range(0x20, 0x40):
+            self._read_page[page] = read_ppu
+            self._write_page[page] = write_ppu
+
+        self._read_page[0x40] = self._read_io
+        self._write_page[0x40] = self._write_io
+        for page in range(0x41, 0x100):
+            self._read_page[page] = self._read_cart
+            self._write_page[page] = self._write_cart
+
+    def _map_rom_pages(self, start: int, end: int):
+        # Point pages at the PRG bank the mapper currently has there
+        windows = self.cart.mapper.prg_windows
+        for page in range(max(start >> 8, 0x80), (end >> 8) + 1):
+            self._read_page[page] = _prg_reader(windows[(page >> 5) & 0x03], (page & 0x1F) << 8)
+
+    def map_ram_page(self, page: int, watched: bool):
+        # Writes to a watched RAM page also notify the block compiler
+        write = self._write_watched_ram if watched else self._write_ram
+        for mirror in range(page & 0x07, 0x20, 0x08):
+            self._write_page[mirror] = write
+
+    def _write_watched_ram(self, addr: int, data: int):
+        self.cpu_ram[addr & 0x07FF] = data
+        self.compiler.ram_written(addr)
+
+    def _read_cart(self, addr: int) -> int:
+        data = self.cart.cpu_read(addr & 0xFFFF)
+        return 0x00 if data is None else data
+
+    def _write_cart(self, addr: int, data: int):
+        if addr >= 0x8000:
+            self.ppu.sync()  # the mapper might switch CHR banks or mirroring
+        self.cart.cpu_write(addr & 0xFFFF, data)
+
+    def _write_io(self, addr: int, data: int):
+        if addr == 0x4014:
             self._dma_page = data & 0xFF
-            self._dma_addr = 0x00
             self._dma_transfer = True
+            self._dma_cycle = self.system_clock_counter + 3
+            self.schedule(self._dma_cycle, self._run_dma)
         elif 0x4016 == addr:
             if data & 0x01 == 1:  # joypad poll (latch)
                 # if self.controller[0] != 0:
@@ -43,16 +213,12 @@ class Bus:
                 self.controller[1] = 0x00
         elif addr == 0x4017:
             pass
+        elif addr >= 0x4020:
+            self._write_cart(addr, data)
 
-    def cpu_read(self, addr: int, read_only=False) -> int:
+    def _read_io(self, addr: int) -> int:
         data = 0x00
-        if (cart_data := self.cart.cpu_read(addr)) is not None:
-            data = cart_data
-        elif 0x0000 <= addr <= 0x1FFF:
-            data = self.cpu_ram[addr & 0x07FF]
-        elif 0x2000 <= addr <= 0x3FFF:
-            data = self.ppu.cpu_read(addr & 0x0007, read_only=read_only)
-        elif addr == 0x4016:
+        if addr == 0x4016:
             # return more bits for other devices
             # Joy pad 1 read
             data = 1 if (self.controller_state[0] & 0x80) > 0 else 0
@@ -61,60 +227,131 @@ class Bus:
             # Joy pad 2 read
             data = 1 if (self.controller_state[1] & 0x80) > 0 else 0
             self.controller_state[1] <<= 1
+        elif addr >= 0x4020:
+            data = self._read_cart(addr)
 
         return data
 
-    def cpu_read_2(self, addr: int, read_only=False) -> int:
-        data = (0x00, 0x00)
+    def save_state(self) -> bytes:
+        """
+        Snapshot the machine: CPU, PPU, RAM, VRAM, OAM, palette, PRG RAM, CHR
+        RAM and mapper registers. The rendered frame is not included.
+        """
+        bus = _STATE.pack(
+            self.system_clock_counter,
+            self.controller_state[0] & 0xFF, self.controller_state[1] & 0xFF,
+            self.controller[0], self.controller[1],
+            self._dma_page, self._dma_transfer, self._dma_cycle,
+        ) + self.cpu_ram
+        sections = [_STATE_HEADER.pack(STATE_MAGIC, STATE_VERSION)]
+        for section in (bus, self.cpu.save_state(), self.ppu.save_state(), self.cart.save_state()):
+            sections.append(_SECTION.pack(len(section)))
+            sections.append(section)
+        return b''.join(sections)
 
-        if (cart_data := self.cart.cpu_read_2(addr)) is not None:
-            data = cart_data
-        elif 0x0000 <= addr <= 0x1FFF:
-            data = self.cpu_ram[addr & 0x07FF], self.cpu_ram[(addr + 1) & 0x07FF]
-        elif 0x2000 <= addr <= 0x3FFF:
-            a = self.ppu.cpu_read(addr & 0x0007, read_only=read_only)
-            b = self.ppu.cpu_read((addr + 1) & 0x0007, read_only=read_only)
-            data = a, b
-        elif 0x4016 <= addr <= 0x4017:
-            print('reading 2 bytes from controller!!!')
+    def load_state(self, state: bytes):
+        magic, version = _STATE_HEADER.unpack_from(state)
+        if magic != STATE_MAGIC:
+            raise ValueError('Not a save state')
+        if version != STATE_VERSION:
+            raise ValueError(f'Unsupported save state version {version}, expected {STATE_VERSION}')
 
-        return data
+        sections = []
+        offset = _STATE_HEADER.size
+        while offset < len(state):
+            size, = _SECTION.unpack_from(state, offset)
+            offset += _SECTION.size
+            sections.append(state[offset:offset + size])
+            offset += size
+        bus, cpu, ppu, cart = sections
 
-    def insert_cartridge(self, cartridge: Cartridge):
-        self.cart = cartridge
-        self.ppu.connect_cartridge(cartridge)
+        (self.system_clock_counter,
+         self.controller_state[0], self.controller_state[1],
+         self.controller[0], self.controller[1],
+         self._dma_page, self._dma_transfer, self._dma_cycle,
+         ) = _STATE.unpack_from(bus)
+        self.cpu_ram[:] = bus[_STATE.size:]
+        self.cpu.load_state(cpu)
+        self.ppu.load_state(ppu)
+        self.cart.load_state(cart)
+        self._restore_events()
+
+        if self.compiler is not None:
+            # blocks compiled from RAM are stale now
+            for page in range(8):
+                self.compiler.ram_written(page << 8)
 
     def reset(self):
         self.cpu.reset()
+        # The master clock starts over but the cartridge isn't reset, its
+        # state is kept relative to the clock
+        mapper_state = self.cart.mapper.save_state() if self.cart is not None else None
         self.system_clock_counter = 0
+        if mapper_state is not None:
+            self.cart.mapper.load_state(mapper_state)
+        self._restore_events()
 
     def clock(self):
-        self.ppu.clock()
-
+        # The PPU runs its dot first, so an instruction sees it one dot ahead
+        # of the master clock. Events wait until the CPU is between
+        # instructions, as they do in step().
+        self.ppu.run(1)
         if self.system_clock_counter % 3 == 0:
-            if self._dma_transfer:
-                self._do_dma_transfer()
-            else:
-                self.cpu.clock()
+            self.cpu.clock()
+        if self.system_clock_counter >= self._next_event and not self.cpu.state.cycles:
+            self._run_events()
+        self.system_clock_counter += 1
 
-        if self.ppu.nmi:
-            self.ppu.nmi = False
-            self.cpu.nmi()
+    def step(self) -> int:
+        # Run the CPU for a whole instruction and let the PPU catch up with
+        # the 3 dots it runs per CPU cycle. Returns the cycles taken, a DMA
+        # transfer started by the instruction included. As in clock(), the
+        # instruction sees the PPU one dot on.
+        start = self.system_clock_counter
+        self.ppu.run(1)
+        cycles = self._cpu_step()
+        self.system_clock_counter += 3 * cycles
+        self.ppu.run(3 * cycles - 1)
+        if self.system_clock_counter >= self._next_event:
+            self._run_events()
+        return (self.system_clock_counter - start) // 3
 
-        self.system_clock_counter += 1
+    def run_frame(self):
+        # step() inlined, nothing but the next event is checked between
+        # instructions
+        ppu = self.ppu
+        run = ppu.run
+        cpu_step = self._cpu_step
+        while not ppu.frame_complete:
+            run(1)
+            dots = 3 * cpu_step()
+            self.system_clock_counter += dots
+            run(dots - 1)
+            if self.system_clock_counter >= self._next_event:
+                self._run_events()
+        ppu.frame_complete = False
 
-    def _do_dma_transfer(self):
-        if self._dma_dummy:
-            if self.system_clock_counter % 2 == 1:
-                self._dma_dummy = False
+    def _run_dma(self):
+        # The CPU is halted while the 256 bytes of the page go to OAM: a
+        # cycle to wait for the writes, one more to get in step with the
+        # reads on an odd cycle, and a read and a write cycle per byte
+        self.ppu.sync()
+        page = self._dma_page
+        if page < 0x20:
+            start = (page & 0x07) << 8
+            self.ppu._oam[:] = self.cpu_ram_view[start:start + 256]
         else:
-            if self.system_clock_counter % 2 == 0:
-                addr = (self._dma_page << 8) | self._dma_addr
-                self._dma_data = self.cpu_read(addr)
-            else:
-                self.ppu._oam[self._dma_addr] = self._dma_data
-                self._dma_addr += 1
+            read = self._read_page[page]
+            addr = page << 8
+            self.ppu._oam[:] = bytes([read(addr | offset) for offset in range(256)])
+        self._dma_transfer = False
+
+        cycles = 513 if self._dma_cycle % 2 else 514
+        self.system_clock_counter += 3 * cycles
+        self.ppu.run(3 * cycles)
+
 
-                if self._dma_addr & 0xFF == 0x00:
-                    self._dma_transfer = False
-                    self._dma_dummy = True
+def _prg_reader(prg, base: int):
+    def read(addr):
+        return prg[base | (addr & 0xFF)]
+    return read
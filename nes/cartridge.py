@@ -1,44 +1,12 @@
+import mmap
+import os
+import struct
 from enum import Enum
-from io import SEEK_CUR
 from typing import Union
 
 from mappers import MAPPERS
-
-
-class NesHeader:
-    def __init__(self):
-        self.name = None
-        self.prg_rom_chunks = None
-        self.chr_rom_chunks = None
-        self.mapper1 = None
-        self.mapper2 = None
-        self.prg_ram_size = None
-        self.tv_system1 = None
-        self.tv_system2 = None
-        self.unused = None
-
-    @classmethod
-    def create_header(cls, f):
-        header = NesHeader()
-        header.name = f.read(4)
-        header.prg_rom_chunks = f.read(1)[0] & 0xff
-        header.chr_rom_chunks = f.read(1)[0] & 0xff
-        header.mapper1 = f.read(1)[0] & 0xff
-        header.mapper2 = f.read(1)[0] & 0xff
-        header.prg_ram_size = f.read(1)[0] & 0xff
-        header.tv_system1 = f.read(1)[0] & 0xff
-        header.tv_system2 = f.read(1)[0] & 0xff
-        header.unused = f.read(5)
-        return header
-
-    def cart_format(self):
-        cartridge_type = 'Unknown'
-        if self.name == b'NES\x1A':
-            cartridge_type = 'iNES'
-
-        if cartridge_type == 'iNES' and (self.mapper2 & 0x0C) == 0x08:
-            cartridge_type = 'NES20'
-        return cartridge_type
+from rom_info import NesHeader, RomCache, RomInfo
+from tile_cache import TileCache
 
 
 class Mirror(Enum):
@@ -48,94 +16,158 @@ class Mirror(Enum):
     ONESCREEN_HI = 0x03
 
 
-class Cartridge:
+# Mirroring and the size of the mapper state that follows, then PRG RAM and
+# CHR RAM
+_STATE = struct.Struct('<BH')
+
+
+def map_save_file(path: str, size: int) -> mmap.mmap:
+    # Map the first size bytes of a save file, which is created or extended
+    # with zeros when it is shorter
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        return mmap.mmap(fd, size, access=mmap.ACCESS_WRITE)
+    finally:
+        os.close(fd)
 
-    def __init__(self, filename):
+
+class Cartridge:
+    """
+    A ROM file mapped into memory. PRG and CHR ROM are views of a private
+    mapping of the file, so every emulator on a ROM shares its pages in the OS
+    cache and loading copies nothing. Writes to the views (tests patch
+    vectors, NROM writes go to PRG) stay private to the process.
+
+    Battery backed PRG RAM is a shared mapping of a .sav file next to the
+    ROM instead: games write to it like to any RAM and the OS writes it back
+    to the file when it sees fit. Loading a state (Bus.load_state, rewinding)
+    loads its PRG RAM into the file as well, as in other emulators the save
+    is whatever the game has in RAM. Machines that must not touch the save
+    (headless runs, environments) pass battery_save=False. Where the file
+    can't be opened PRG RAM stays in memory.
+    """
+
+    def __init__(self, filename, rom_cache: Union[RomCache, None] = None, battery_save=True):
         self.filename = filename
 
-        self.prg_memory = None
-        self.chr_memory = None
+        self.prg_memory: memoryview = None
+        self.prg_ram: Union[bytearray, mmap.mmap] = bytearray(0x2000)  # $6000-$7FFF
+        self.save_file: Union[str, None] = None
+        self.chr_memory: Union[memoryview, bytearray] = None
+        self.prg_view: memoryview = None
+        self.chr_view: memoryview = None
+        self.info: RomInfo = None
         self.mapper_id = 0x00
         self.mirror = Mirror.HORIZONTAL
         self.prg_banks = 0x00
         self.chr_banks = 0x00
         self.mapper = None
+        self.tiles: TileCache = None
         self._mapped_read_addr = None
 
-        self.read_cartridge()
+        self.read_cartridge(rom_cache, battery_save)
 
-    def read_cartridge(self):
+    def read_cartridge(self, rom_cache: Union[RomCache, None] = None, battery_save=True):
         with open(self.filename, 'rb') as f:
-            header = NesHeader.create_header(f)
-            self.mapper_id = ((header.mapper2 >> 4) << 4) | (header.mapper1 >> 4)
-            self.mirror = Mirror(header.mapper1 & 0x01)
-
-            print(f'Cartridge: {self.filename}')
-            print(f'Type: {header.cart_format()}')
-            print(f'Mapper ID: {self.mapper_id:03d}')
-            print(f'Scrolling mode: {self.mirror.name}')
-            print(f'PRG banks: {header.prg_rom_chunks}')
-            print(f'CHR banks: {header.chr_rom_chunks}')
-
-            # if (header.tv_system2 >> 4) & 0x01:
-            if (header.mapper1 >> 1) & 0x01:
-                print(f'PRG RAM size: {header.prg_ram_size}')
-
-            if header.mapper1 & 0x04:
-                print('skipping training data')
-                f.seek(512, SEEK_CUR)
-
-            file_type = 1
-
-            if file_type == 0:
-                pass
-            elif file_type == 1:
-                self.prg_banks = header.prg_rom_chunks
-                prg_size = self.prg_banks * 16384
-                print(f'PRG ROM size: {prg_size}')
-                data = f.read(prg_size)
-                self.prg_memory = [int(b) for b in data]
-
-                self.chr_banks = header.chr_rom_chunks
-                if self.chr_banks == 0:
-                    print(f'No CHR ROM creating CHR RAM @ 8192 bytes')
-                    self.chr_memory = [0x00] * 8192
-                else:
-                    chr_size = self.chr_banks * 8192
-                    print(f'CHR ROM size: {chr_size}')
-                    data = f.read(chr_size)
-                    self.chr_memory = [int(b) for b in data]
-            elif file_type == 2:
-                pass
-
-            self.mapper = MAPPERS[self.mapper_id](self.prg_banks, self.chr_banks)
+            rom = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        if rom_cache is not None:
+            info = rom_cache.info(self.filename, rom)
+        else:
+            info = RomInfo.from_header(NesHeader.parse(rom))
+        self.info = info
+        self.mapper_id = info.mapper_id
+        self.mirror = Mirror(info.mirror)
+
+        print(f'Cartridge: {self.filename}')
+        print(f'Type: {info.format}')
+        print(f'Mapper ID: {self.mapper_id:03d}')
+        print(f'Scrolling mode: {self.mirror.name}')
+        print(f'PRG banks: {info.prg_rom_size // 16384}')
+        print(f'CHR banks: {info.chr_rom_size // 8192}')
+
+        if info.battery:
+            print(f'PRG RAM size: {info.prg_ram_size}')
+            if battery_save:
+                save_file = os.path.splitext(self.filename)[0] + '.sav'
+                try:
+                    self.prg_ram = map_save_file(save_file, len(self.prg_ram))
+                    self.save_file = save_file
+                    print(f'Battery save: {save_file}')
+                except OSError as e:
+                    print(f'Battery save not possible, PRG RAM is not kept: {e}')
+
+        if info.trainer:
+            print('skipping training data')
+
+        rom_view = memoryview(rom)
+        self.prg_banks = info.prg_rom_size // 16384
+        print(f'PRG ROM size: {info.prg_rom_size}')
+        self.prg_memory = rom_view[info.prg_offset:info.chr_offset]
+
+        self.chr_banks = info.chr_rom_size // 8192
+        if self.chr_banks == 0:
+            print(f'No CHR ROM creating CHR RAM @ 8192 bytes')
+            self.chr_memory = bytearray(8192)
+        else:
+            print(f'CHR ROM size: {info.chr_rom_size}')
+            self.chr_memory = rom_view[info.chr_offset:info.chr_offset + info.chr_rom_size]
+
+        self.prg_view = memoryview(self.prg_memory)
+        self.chr_view = memoryview(self.chr_memory)
+
+        self.mapper = MAPPERS[self.mapper_id](self.prg_banks, self.chr_banks)
+        self.mapper.connect(self.prg_view, self.chr_view)
+        self.mapper.mirror_switch_listeners.append(self._mirror_switched)
+        self.tiles = TileCache(self.chr_memory, self.mapper)
+
+    def _mirror_switched(self, mirror: int):
+        self.mirror = Mirror(mirror)
+
+    def save_state(self) -> bytes:
+        mapper = self.mapper.save_state()
+        chr_ram = self.chr_memory if self.chr_banks == 0 else b''
+        return b''.join((_STATE.pack(self.mirror.value, len(mapper)), mapper, self.prg_ram, chr_ram))
+
+    def load_state(self, data: bytes):
+        mirror, size = _STATE.unpack_from(data)
+        self.mirror = Mirror(mirror)
+        offset = _STATE.size
+        self.mapper.load_state(data[offset:offset + size])
+        offset += size
+        self.prg_ram[:] = data[offset:offset + len(self.prg_ram)]
+        if self.chr_banks == 0:
+            offset += len(self.prg_ram)
+            self.chr_memory[:] = data[offset:offset + len(self.chr_memory)]
+            self.tiles.invalidate()
+
+        self.mapper.prg_switched(0x8000, 0xFFFF)
+        self.mapper.chr_switched()
 
     def cpu_write(self, addr: int, data: int):
-        mapped_addr = self.mapper.cpu_map_write(addr, data)
-        if mapped_addr is not None:
-            self.prg_memory[mapped_addr] = data
+        if 0x6000 <= addr <= 0x7FFF:
+            if self.mapper.prg_ram_writable:
+                self.prg_ram[addr & 0x1FFF] = data
+        else:
+            self.mapper.cpu_write(addr, data)
 
     def cpu_read(self, addr: int, read_only=False) -> Union[int, None]:
-        mapped_addr = self.mapper.cpu_map_read(addr)
-        if mapped_addr is not None:
-            return self.prg_memory[mapped_addr]
-        return None
-
-    def cpu_read_2(self, addr: int, read_only=False) -> (int, int):
-        addr1 = self.mapper.cpu_map_read(addr)
-        addr2 = self.mapper.cpu_map_read(addr + 1)
-        if addr1 is not None and addr2 is not None:
-            return self.prg_memory[addr1], self.prg_memory[addr2]
+        if addr >= 0x8000:
+            return self.mapper.prg_windows[(addr >> 13) & 0x03][addr & 0x1FFF]
+        if addr >= 0x6000:
+            return self.prg_ram[addr & 0x1FFF] if self.mapper.prg_ram_enabled else None
         return None
 
     def ppu_write(self, addr: int, data: int) -> bool:
-        map_addr = self.mapper.ppu_map_write(addr, data)
-        if map_addr is not None:
-            self.chr_memory[map_addr] = data
-            return True
-        return False
+        if addr > 0x1FFF:
+            return False
+        if self.chr_banks == 0:  # CHR RAM
+            self.mapper.chr_windows[addr >> 10][addr & 0x03FF] = data
+            self.tiles.chr_written(self.mapper.chr_offsets[addr >> 10] | (addr & 0x03FF))
+        return True
 
     def ppu_read(self, addr: int) -> Union[int, None]:
-        mapped_addr = self.mapper.ppu_map_read(addr)
-        return self.chr_memory[mapped_addr] if mapped_addr else None
-
+        if addr > 0x1FFF:
+            return None
+        return self.mapper.chr_windows[addr >> 10][addr & 0x03FF]
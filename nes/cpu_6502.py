@@ -1,8 +1,13 @@
+import struct
 from dataclasses import dataclass, fields
 from typing import Union
 
 from flags_6502 import Flags6502
 
+# a, x, y, stkp, pc, _status, _nz, clock_count, opcode, addr_abs, addr_rel,
+# cycles, _implied (-1 for None) and the instruction count
+_STATE = struct.Struct('<4BHBHQB3HhQ')
+
 
 @dataclass
 class CPU6502State:
@@ -11,7 +16,8 @@ class CPU6502State:
     y: int = 0x00  # Y Register
     stkp: int = 0x00  # Stack pointer (points to location on bus)
     pc: int = 0x0000  # Program Counter
-    status: int = 0x00  # Status register
+    _status: int = 0x00  # Status register except for the N and Z flags
+    _nz: int = 0x01  # Last result, the N and Z flags are derived from it
     clock_count: int = 0  # Number clock ticks
     opcode: int = 0x00  # Current opcode
 
@@ -33,14 +39,42 @@ class CPU6502State:
 
         self.cycles = 8
 
+    # Most instructions only store their result byte in _nz. N is set when
+    # bit 7 (or bit 8) of _nz is set and Z when its low byte is zero, which
+    # lets 0x100 represent the N and Z combination no single byte can.
+    @property
+    def status(self):
+        nz = self._nz
+        status = self._status
+        if nz & 0x180:
+            status |= Flags6502.N
+        if not nz & 0xFF:
+            status |= Flags6502.Z
+        return status
+
+    @status.setter
+    def status(self, value: int):
+        self._status = value & ~(Flags6502.N | Flags6502.Z) & 0xFF
+        if value & Flags6502.N:
+            self._nz = 0x100 if value & Flags6502.Z else 0x80
+        else:
+            self._nz = 0x00 if value & Flags6502.Z else 0x01
+
     def get_flag(self, flag: int):
-        return 1 if (self.status & flag) else 0
+        if flag & (Flags6502.N | Flags6502.Z):
+            return 1 if (self.status & flag) else 0
+        return 1 if (self._status & flag) else 0
 
     def set_flag(self, flag: int, value: Union[bool, int]):
-        if value:
-            self.status |= flag
+        if flag & (Flags6502.N | Flags6502.Z):
+            if value:
+                self.status |= flag
+            else:
+                self.status &= ~flag
+        elif value:
+            self._status |= flag
         else:
-            self.status &= ~flag
+            self._status &= ~flag
 
     def copy_to(self, target):
         for field in fields(CPU6502State):
@@ -108,10 +142,12 @@ class CPU6502:
     def __init__(self, bus):
         self.bus = bus
         self.state = CPU6502State()
+        self.instruction_count = 0
 
         # local import due to cycle in my imports
         import _opcodes_6502
         self.OPCODES = _opcodes_6502.lookup
+        self.DISPATCH = _opcodes_6502.dispatch
 
     # addr is a 16 bit address and data is a single 8 bit byte
     def cpu_write(self, addr: int, data: int):
@@ -134,16 +170,49 @@ class CPU6502:
             state.pc += 1
             state.opcode = opcode
             state._implied = None
-            instruction = self.OPCODES[opcode]
-            state.cycles = instruction.cycles
-            additional_cycle1 = instruction.addr_mode(self)
-            additional_cycle2 = instruction.operate(self)
-
-            state.cycles += (additional_cycle1 & additional_cycle2)
+            self.instruction_count += 1
+            # branches add their extra cycles to state.cycles while executing
+            cycles = self.DISPATCH[opcode](self)
+            state.cycles += cycles
 
         state.cycles -= 1
         state.clock_count += 1
 
+    def step(self) -> int:
+        # Execute a complete instruction (or the remainder of a pending reset
+        # or interrupt sequence) and return the number of cycles it took
+        state = self.state
+        if state.cycles == 0:
+            opcode = self.cpu_read(state.pc)
+            state.pc += 1
+            state.opcode = opcode
+            state._implied = None
+            self.instruction_count += 1
+            cycles = self.DISPATCH[opcode](self)
+            cycles += state.cycles
+        else:
+            cycles = state.cycles
+
+        state.cycles = 0
+        state.clock_count += cycles
+        return cycles
+
+    def save_state(self) -> bytes:
+        state = self.state
+        return _STATE.pack(
+            state.a & 0xFF, state.x & 0xFF, state.y & 0xFF, state.stkp & 0xFF, state.pc & 0xFFFF,
+            state._status, state._nz & 0x1FF, state.clock_count, state.opcode,
+            state.addr_abs & 0xFFFF, state.addr_rel & 0xFFFF, state.cycles,
+            -1 if state._implied is None else state._implied, self.instruction_count)
+
+    def load_state(self, data: bytes):
+        state = self.state
+        (state.a, state.x, state.y, state.stkp, state.pc,
+         state._status, state._nz, state.clock_count, state.opcode,
+         state.addr_abs, state.addr_rel, state.cycles,
+         implied, self.instruction_count) = _STATE.unpack(data)
+        state._implied = None if implied < 0 else implied
+
     def fetch(self):
         if self.state._implied is not None:
             return self.state._implied
@@ -168,17 +237,18 @@ class CPU6502:
         self.state.cycles = 8
 
     def push_interrupt_state_on_stack(self):
+        # The status is pushed as it was, RTI clears I again if it was clear
         self.state.set_flag(Flags6502.B, 0)
         self.state.set_flag(Flags6502.U, 1)
-        self.state.set_flag(Flags6502.I, 1)
         self.cpu_write(0x0100 + self.state.stkp, self.state.status & 0x00ff)
-        self.state.stkp -= 1
+        self.state.stkp = (self.state.stkp - 1) & 0xFF
+        self.state.set_flag(Flags6502.I, 1)
 
     def push_program_counter_on_stack(self):
         self.cpu_write(0x0100 + self.state.stkp, (self.state.pc >> 8) & 0x00ff)
-        self.state.stkp -= 1
+        self.state.stkp = (self.state.stkp - 1) & 0xFF
         self.cpu_write(0x0100 + self.state.stkp, self.state.pc & 0x00ff)
-        self.state.stkp -= 1
+        self.state.stkp = (self.state.stkp - 1) & 0xFF
 
     def load_program_counter_from_addr(self, addr):
         lo = self.cpu_read(addr)
@@ -186,9 +256,9 @@ class CPU6502:
         self.state.pc = (hi << 8) | lo
 
     def pop_program_counter_from_stack(self):
-        self.state.stkp += 1
+        self.state.stkp = (self.state.stkp + 1) & 0xFF
         lo = self.cpu_read(0x0100 + self.state.stkp) & 0xff
-        self.state.stkp += 1
+        self.state.stkp = (self.state.stkp + 1) & 0xFF
         hi = self.cpu_read(0x0100 + self.state.stkp) & 0xff
         self.state.pc = (hi << 8) | lo
 
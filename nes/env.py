@@ -0,0 +1,110 @@
+from typing import Callable, Dict, Sequence, Tuple, Union
+
+import numpy as np
+
+from bus import Bus
+from headless import create_nes
+
+# Controller bits, as read by the game one at a time from bit 7 down
+BUTTON_A = 0x80
+BUTTON_B = 0x40
+BUTTON_SELECT = 0x20
+BUTTON_START = 0x10
+BUTTON_UP = 0x08
+BUTTON_DOWN = 0x04
+BUTTON_LEFT = 0x02
+BUTTON_RIGHT = 0x01
+
+OBSERVATIONS = ('gray', 'indexed')
+
+
+def observation_shape(downscale: int) -> Tuple[int, int]:
+    return -(-240 // downscale), -(-256 // downscale)
+
+
+def _create_gray_palette(pal_screen) -> np.ndarray:
+    # Luma of every colour index
+    rgb = np.array(pal_screen, dtype=np.float64)
+    return np.round(rgb @ (0.299, 0.587, 0.114)).astype(np.uint8)
+
+
+class NesEnv:
+    """
+    A reset()/step(action) environment around one machine.
+
+    Every step holds the buttons of the action for frame_skip frames. Only
+    the last of these frames is rendered, the observation is taken from its
+    framebuffer: colour indices or their luma, every downscale-th pixel in
+    both directions.
+
+    An action is an index into actions, the controller byte to hold, or the
+    controller byte itself when actions is None. reward and done are
+    functions of the machine after a step; without them every reward is 0
+    and an episode only ends when it is max_steps long.
+    """
+
+    def __init__(self, rom: str, frame_skip=4, observation='gray', downscale=2,
+                 actions: Union[Sequence[int], None] = None,
+                 reward: Union[Callable[[Bus], float], None] = None,
+                 done: Union[Callable[[Bus], bool], None] = None,
+                 max_steps: Union[int, None] = None, recompile=True):
+        if observation not in OBSERVATIONS:
+            raise ValueError(f'Unknown observation {observation!r}, expected one of {OBSERVATIONS}')
+        if frame_skip < 1:
+            raise ValueError('frame_skip must be at least 1')
+
+        self.nes = create_nes(rom, recompile=recompile, scanline_renderer=True)
+        self.frame_skip = frame_skip
+        self.observation = observation
+        self.downscale = downscale
+        self.actions = None if actions is None else list(actions)
+        self.reward = reward
+        self.done = done
+        self.max_steps = max_steps
+        self.steps = 0
+
+        self._gray = _create_gray_palette(self.nes.ppu.pal_screen)
+        self._initial_state = self.nes.save_state()
+
+    @property
+    def observation_shape(self) -> Tuple[int, int]:
+        return observation_shape(self.downscale)
+
+    @property
+    def action_count(self) -> int:
+        return 256 if self.actions is None else len(self.actions)
+
+    def observe(self, out: Union[np.ndarray, None] = None) -> np.ndarray:
+        # The observation of the last rendered frame, written to out if given
+        pixels = self.nes.ppu.frame_buffer[::self.downscale, ::self.downscale]
+        if self.observation == 'gray':
+            return np.take(self._gray, pixels, out=out)
+        if out is None:
+            return pixels.copy()
+        out[:] = pixels
+        return out
+
+    def reset(self, out: Union[np.ndarray, None] = None) -> np.ndarray:
+        nes = self.nes
+        nes.load_state(self._initial_state)
+        nes.controller[0] = 0x00
+        nes.ppu.frame_buffer[:] = 0
+        self.steps = 0
+        return self.observe(out)
+
+    def step(self, action: int, out: Union[np.ndarray, None] = None) -> Tuple[np.ndarray, float, bool, Dict]:
+        nes = self.nes
+        ppu = nes.ppu
+        buttons = action if self.actions is None else self.actions[action]
+        for frame in range(self.frame_skip):
+            # the bus clears the controller whenever the game polls it
+            nes.controller[0] = buttons
+            ppu.timing_only = frame < self.frame_skip - 1
+            nes.run_frame()
+        self.steps += 1
+
+        reward = 0.0 if self.reward is None else self.reward(nes)
+        done = self.done is not None and self.done(nes)
+        if self.max_steps is not None and self.steps >= self.max_steps:
+            done = True
+        return self.observe(out), reward, done, {'steps': self.steps, 'frames': self.steps * self.frame_skip}
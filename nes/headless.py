@@ -1,35 +1,139 @@
+import argparse
+import sys
 import time
+from dataclasses import dataclass, asdict
+from typing import List, Union
+
+import numpy as np
 
 from bus import Bus
 from cartridge import Cartridge
+from rom_info import RomCache
 
-if __name__ == '__main__':
-    nes = Bus()
-    # cart = Cartridge('tests/nestest.nes')
-    cart = Cartridge('roms/donkeykong.nes')
-    # cart = Cartridge('roms/smb.nes')
-    # cart = Cartridge('roms/ducktales.nes')
-    nes.insert_cartridge(cart)
 
+@dataclass
+class RunResult:
+    frames: int
+    seconds: float
+    instructions: int
+    dots: int
+
+    @property
+    def fps(self) -> float:
+        return self.frames / self.seconds if self.seconds else 0.0
+
+    @property
+    def instructions_per_second(self) -> float:
+        return self.instructions / self.seconds if self.seconds else 0.0
+
+    @property
+    def dots_per_second(self) -> float:
+        return self.dots / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        result = asdict(self)
+        result['fps'] = self.fps
+        result['instructions_per_second'] = self.instructions_per_second
+        result['dots_per_second'] = self.dots_per_second
+        return result
+
+
+def create_nes(rom: str, recompile=False, scanline_renderer=False, timing_only=False,
+               rom_cache: Union[RomCache, None] = None) -> Bus:
+    # Every run starts from the same battery RAM, runs of the same ROM in
+    # parallel would otherwise share it
+    nes = Bus(recompile=recompile, scanline_renderer=scanline_renderer)
+    nes.insert_cartridge(Cartridge(rom, rom_cache, battery_save=False))
     nes.reset()
+    nes.ppu.timing_only = timing_only
+    return nes
+
+
+def run(nes: Bus, frames: Union[int, None] = None, seconds: Union[float, None] = None) -> RunResult:
+    # Run a number of frames, or whole frames until the wall clock budget is
+    # spent, and measure how long it took
+    instructions = nes.cpu.instruction_count
+    dots = nes.system_clock_counter
+    frame_count = 0
 
-    frame_count = 20
-    now = time.time()
+    start = time.perf_counter()
     while True:
-        nes.clock()
-        if nes.ppu.frame_count == frame_count:
+        if frames is not None and frame_count >= frames:
             break
-    diff = time.time() - now
-
-    print('------------')
-    print(f'Ran for {frame_count} frames.')
-    print(f'Running time: {diff:.{2}f} seconds')
-    print(f'Frames per second: {frame_count / diff:.{3}f} FPS')
-    print(f'Quality (60 FPS expected): {(frame_count / diff) / 60:.{2}f}')
-
-    # Best so far:
-    # 2020-10-06
-    # Ran for 20 frames.
-    # Running time: 9.36 seconds
-    # Frames per second: 2.138 FPS
-    # Quality (60 FPS expected): 0.04
+        if seconds is not None and time.perf_counter() - start >= seconds:
+            break
+        nes.run_frame()
+        frame_count += 1
+    elapsed = time.perf_counter() - start
+
+    return RunResult(
+        frames=frame_count,
+        seconds=elapsed,
+        instructions=nes.cpu.instruction_count - instructions,
+        dots=nes.system_clock_counter - dots,
+    )
+
+
+def dump_frame(nes: Bus, path: str):
+    # .npy files get the indexed frame, anything else a binary PPM image
+    if path.endswith('.npy'):
+        np.save(path, nes.ppu.frame_buffer)
+    else:
+        screen = nes.ppu.get_screen()
+        with open(path, 'wb') as f:
+            f.write(b'P6\n256 240\n255\n')
+            f.write(screen.tobytes())
+
+
+def dump_ram(nes: Bus, path: str):
+    with open(path, 'wb') as f:
+        f.write(bytes(nes.cpu_ram))
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='nes', description='Run a NES ROM headless and report its speed.')
+    parser.add_argument('rom', help='iNES ROM file')
+    budget = parser.add_mutually_exclusive_group()
+    budget.add_argument('-f', '--frames', type=int, help='frames to run (default 60)')
+    budget.add_argument('-s', '--seconds', type=float, help='wall clock seconds to run for')
+    parser.add_argument('-w', '--warmup', type=int, default=0, help='frames to run before measuring')
+    parser.add_argument('-r', '--repeats', type=int, default=1, help='measure this many times, each on a fresh machine')
+    parser.add_argument('--recompile', action='store_true', help='run the CPU through the block recompiler')
+    parser.add_argument('--scanline-renderer', action='store_true', help='render whole scanlines at once')
+    parser.add_argument('--timing-only', action='store_true', help='keep PPU timing but draw nothing')
+    parser.add_argument('--dump-frame', metavar='FILE', help='write the final frame (.npy: indexed, else PPM)')
+    parser.add_argument('--dump-ram', metavar='FILE', help='write the final 2 KiB of CPU RAM')
+    return parser
+
+
+def main(argv: Union[List[str], None] = None):
+    parser = create_parser()
+    args = parser.parse_args(argv)
+    if args.repeats < 1:
+        parser.error('--repeats must be at least 1')
+    frames = args.frames if args.frames is not None or args.seconds is not None else 60
+
+    nes = None  # the machine of the last repeat
+    results = []
+    for repeat in range(args.repeats):
+        nes = create_nes(args.rom, args.recompile, args.scanline_renderer, args.timing_only)
+        run(nes, frames=args.warmup)
+        result = run(nes, frames=frames, seconds=args.seconds)
+        results.append(result)
+        print(f'run {repeat + 1}: {result.frames} frames in {result.seconds:.2f} s, '
+              f'{result.fps:.2f} fps, {result.instructions_per_second:,.0f} instr/s, '
+              f'{result.dots_per_second:,.0f} dots/s')
+
+    if len(results) > 1:
+        best = max(results, key=lambda r: r.fps)
+        print(f'best: {best.fps:.2f} fps, {best.instructions_per_second:,.0f} instr/s, '
+              f'{best.dots_per_second:,.0f} dots/s')
+
+    if args.dump_frame:
+        dump_frame(nes, args.dump_frame)
+    if args.dump_ram:
+        dump_ram(nes, args.dump_ram)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -34,8 +34,10 @@ class HackerWindow(pxng.Window):
             self.advance_emulator()
 
         if self._dirty:
+            nes.ppu.sync()  # draw the frame up to where the CPU is
             nes.ppu.get_pattern_table(0, self._selected_palette)
             nes.ppu.get_pattern_table(1, self._selected_palette)
+            nes.ppu.get_screen()
             self._spr_screen.update()
             self._spr_ptrn_tbl_0.update()
             self._spr_ptrn_tbl_1.update()
@@ -175,22 +177,23 @@ if __name__ == '__main__':
     # cart = Cartridge('roms/smb3.nes')             # 004
     # cart = Cartridge('roms/kirbysadventure.nes')  # 004
 
-    # cart = Cartridge('tests/test_roms/test_cpu_exec_space_ppuio.nes')  #
-    # cart = Cartridge('tests/test_roms/test_cpu_exec_space_apu.nes')  #
-    # cart = Cartridge('tests/test_roms/1.Branch_Basics.nes')  # passed
-    # cart = Cartridge('tests/test_roms/2.Backward_Branch.nes')  # passed
-    # cart = Cartridge('tests/test_roms/3.Forward_Branch.nes')  # passed
-    # cart = Cartridge('tests/test_roms/instructions/01-implied.nes')  # passed
-    # cart = Cartridge('tests/test_roms/instructions/02-immediate.nes')  # failed
-    # cart = Cartridge('tests/test_roms/instructions/03-zero_page.nes')  # passed
-    # cart = Cartridge('tests/test_roms/instructions/04-zp_xy.nes')  # passed
-    # cart = Cartridge('tests/test_roms/instructions/05-absolute.nes')  # passed
-    # cart = Cartridge('tests/test_roms/instructions/06-abs_xy.nes')  # failed
-    # cart = Cartridge('tests/test_roms/instructions/07-ind_x.nes')  # passed
-    # cart = Cartridge('tests/test_roms/instructions/08-ind_y.nes')  # passed
-    # cart = Cartridge('tests/test_roms/instructions/09-branches.nes')  # passed
-    # cart = Cartridge('tests/test_roms/instructions/10-stack.nes')  # passed
-    # cart = Cartridge('tests/test_roms/instructions/11-special.nes')  # failed -> bug in test?
+    # cart = Cartridge('tests/test_roms/test_cpu_exec_space_ppuio.nes')
+    # cart = Cartridge('tests/test_roms/test_cpu_exec_space_apu.nes')
+    # cart = Cartridge('tests/test_roms/1.Branch_Basics.nes')
+    # cart = Cartridge('tests/test_roms/2.Backward_Branch.nes')
+    # cart = Cartridge('tests/test_roms/3.Forward_Branch.nes')
+    # blargg's instruction tests, tests/test_blargg.py has their results
+    # cart = Cartridge('tests/test_roms/instructions/01-implied.nes')
+    # cart = Cartridge('tests/test_roms/instructions/02-immediate.nes')
+    # cart = Cartridge('tests/test_roms/instructions/03-zero_page.nes')
+    # cart = Cartridge('tests/test_roms/instructions/04-zp_xy.nes')
+    # cart = Cartridge('tests/test_roms/instructions/05-absolute.nes')
+    # cart = Cartridge('tests/test_roms/instructions/06-abs_xy.nes')
+    # cart = Cartridge('tests/test_roms/instructions/07-ind_x.nes')
+    # cart = Cartridge('tests/test_roms/instructions/08-ind_y.nes')
+    # cart = Cartridge('tests/test_roms/instructions/09-branches.nes')
+    # cart = Cartridge('tests/test_roms/instructions/10-stack.nes')
+    # cart = Cartridge('tests/test_roms/instructions/11-special.nes')
     # cart = Cartridge('tests/test_roms/instructions/all_instrs.nes-kopi')  # mapper 1
     # cart = Cartridge('tests/test_roms/instructions/official_only.nes')  # mapper 1
     nes.insert_cartridge(cart)
@@ -1,26 +1,107 @@
-from typing import Union
-
-
-class Mapper:
-    def __init__(self, prg_banks, chr_banks):
-        self.prg_banks = prg_banks
-        self.chr_banks = chr_banks
-
-    def cpu_map_read(self, addr: int) -> Union[int, None]: pass
-
-    def cpu_map_write(self, addr: int, data: int) -> Union[int, None]: pass
-
-    def ppu_map_read(self, addr: int) -> Union[int, None]: pass
-
-    def ppu_map_write(self, addr: int, data: int) -> Union[int, None]: pass
-
-
-
-
-
+from typing import List, Union
 
+PRG_WINDOW = 0x2000  # 8 KiB windows at $8000, $A000, $C000 and $E000
+CHR_WINDOW = 0x0400  # 1 KiB windows over $0000-$1FFF
 
+# Values of cartridge.Mirror
+MIRROR_HORIZONTAL = 0x00
+MIRROR_VERTICAL = 0x01
 
 
+class Mapper:
+    """
+    A mapper keeps bank tables: for each PRG window and each CHR window the
+    offset of the bank it holds and a view of that bank once the cartridge's
+    memory is connected. Reads index the tables, a mapper only touches them
+    when its registers are written.
+    """
 
+    # Whether the PPU should call scanline() on every rise of its A12 line
+    counts_scanlines = False
 
+    def __init__(self, prg_banks, chr_banks):
+        self.prg_banks = prg_banks
+        self.chr_banks = chr_banks
+        self.prg_switch_listeners = []
+        self.chr_switch_listeners = []
+        self.mirror_switch_listeners = []
+        self.prg_ram_enabled = True
+        self.prg_ram_writable = True
+        self.bus = None
+
+        self._prg_size = prg_banks * 0x4000
+        self._chr_size = max(chr_banks, 1) * 0x2000
+        self._prg: Union[memoryview, None] = None
+        self._chr: Union[memoryview, None] = None
+        # Until the mapper says otherwise, everything is mapped in order
+        self.prg_offsets = [window * PRG_WINDOW % self._prg_size for window in range(4)]
+        self.chr_offsets = [window * CHR_WINDOW for window in range(8)]
+        self.prg_windows: List[Union[memoryview, None]] = [None] * 4
+        self.chr_windows: List[Union[memoryview, None]] = [None] * 8
+
+    def connect(self, prg_memory, chr_memory):
+        self._prg = memoryview(prg_memory)
+        self._chr = memoryview(chr_memory)
+        self.prg_windows = [self._prg[offset:offset + PRG_WINDOW] for offset in self.prg_offsets]
+        self.chr_windows = [self._chr[offset:offset + CHR_WINDOW] for offset in self.chr_offsets]
+
+    def connect_bus(self, bus):
+        self.bus = bus
+
+    def map_prg(self, window: int, bank: int):
+        # Put 8 KiB PRG bank number bank in window 0-3, negative banks count
+        # from the end
+        offset = bank * PRG_WINDOW % self._prg_size
+        if offset != self.prg_offsets[window]:
+            self.prg_offsets[window] = offset
+            if self._prg is not None:
+                self.prg_windows[window] = self._prg[offset:offset + PRG_WINDOW]
+            start = 0x8000 + window * PRG_WINDOW
+            self.prg_switched(start, start + PRG_WINDOW - 1)
+
+    def map_chr(self, window: int, bank: int):
+        # Put 1 KiB CHR bank number bank in window 0-7
+        offset = bank * CHR_WINDOW % self._chr_size
+        if offset != self.chr_offsets[window]:
+            self.chr_offsets[window] = offset
+            if self._chr is not None:
+                self.chr_windows[window] = self._chr[offset:offset + CHR_WINDOW]
+            self.chr_switched()
+
+    def cpu_write(self, addr: int, data: int):
+        # A CPU write to the cartridge outside PRG RAM, i.e. to the registers
+        pass
+
+    def scanline(self):
+        # The PPU's A12 line rose, see counts_scanlines
+        pass
+
+    def ppu_changed(self):
+        # The PPU's control or mask register was written
+        pass
+
+    def reschedule(self):
+        # The bus dropped its events and IRQ sources (a reset or a loaded
+        # state), queue whatever the mapper needs again
+        pass
+
+    def save_state(self) -> bytes:
+        # The registers a mapper needs to resume where it was
+        return b''
+
+    def load_state(self, data: bytes): pass
+
+    def prg_switched(self, start: int, end: int):
+        # Tell listeners that CPU addresses start..end now map to other PRG data
+        for listener in self.prg_switch_listeners:
+            listener(start, end)
+
+    def mirror_switched(self, mirror: int):
+        # Tell listeners that the name tables are now mirrored another way
+        for listener in self.mirror_switch_listeners:
+            listener(mirror)
+
+    def chr_switched(self):
+        # Tell listeners that the pattern tables now map to other CHR data
+        for listener in self.chr_switch_listeners:
+            listener()
@@ -1,33 +1,12 @@
-from typing import Union
-
 from mappers.mapper import Mapper
 
 
 class Mapper000(Mapper):
-    def __init__(self, prg_banks, chr_banks):
-        super().__init__(prg_banks, chr_banks)
-        self.cpu_map = {}
-        for addr in range(0x8000, 0xFFFF + 1):
-            if self.prg_banks > 1:
-                map_addr = addr & 0x7FFF
-            else:
-                map_addr = addr & 0x3FFF
-            self.cpu_map[addr] = map_addr
-
-    def cpu_map_read(self, addr: int) -> Union[int, None]:
-        return self.cpu_map.get(addr)
-
-    def cpu_map_write(self, addr: int, data: int) -> Union[int, None]:
-        return self.cpu_map.get(addr)
-
-    def ppu_map_read(self, addr: int) -> Union[int, None]:
-        if 0x0000 <= addr <= 0x1FFF:
-            return addr
-        return None
-
-    def ppu_map_write(self, addr: int, data: int) -> Union[int, None]:
-        if 0x0000 <= addr <= 0x1FFF:
-            if self.chr_banks == 0:
-                print(f'writing to cartridge RAM? Mapper000')
-                return addr
-        return None
+    # NROM: 16 or 32 KiB of PRG ROM (16 KiB shows up twice) and 8 KiB of
+    # CHR, nothing to switch
+
+    def cpu_write(self, addr: int, data: int):
+        # Without registers writes go to PRG memory, which lets tests patch
+        # the reset vector
+        if 0x8000 <= addr <= 0xFFFF:
+            self.prg_windows[(addr >> 13) & 0x03][addr & 0x1FFF] = data
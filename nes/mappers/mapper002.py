@@ -1,36 +1,31 @@
-from typing import Union
+import struct
 
 from mappers.mapper import Mapper
 
+_STATE = struct.Struct('<B')
+
 
 class Mapper002(Mapper):
     def __init__(self, prg_banks, chr_banks):
         super().__init__(prg_banks, chr_banks)
         self.current_prg_bank = 0
+        self._map_banks()
+
+    def _map_banks(self):
+        # The selected 16 KiB bank at $8000, the last one at $C000
+        self.map_prg(0, 2 * self.current_prg_bank)
+        self.map_prg(1, 2 * self.current_prg_bank + 1)
+        self.map_prg(2, -2)
+        self.map_prg(3, -1)
 
-    def cpu_map_read(self, addr: int) -> Union[int, None]:
-        if 0x8000 <= addr <= 0xBFFF:
-            addr &= 0x3FFF
-            addr += 0x4000 * self.current_prg_bank
-            return addr
-        elif 0xC000 <= addr <= 0xFFFF:
-            addr &= 0x3FFF
-            addr += 0x4000 * (self.prg_banks - 1)
-            return addr
-        return None
-
-    def cpu_map_write(self, addr: int, data: int) -> Union[int, None]:
+    def cpu_write(self, addr: int, data: int):
         if 0x8000 <= addr <= 0xFFFF:
             self.current_prg_bank = data & 0x0F
-        return None
-
-    def ppu_map_read(self, addr: int) -> Union[int, None]:
-        if 0x0000 <= addr <= 0x1FFF:
-            return addr
-        return None
-
-    def ppu_map_write(self, addr: int, data: int) -> Union[int, None]:
-        if 0x0000 <= addr <= 0x1FFF:
-            if self.chr_banks == 0:
-                return addr
-        return None
+            self._map_banks()
+
+    def save_state(self) -> bytes:
+        return _STATE.pack(self.current_prg_bank)
+
+    def load_state(self, data: bytes):
+        self.current_prg_bank, = _STATE.unpack(data)
+        self._map_banks()
@@ -1,38 +1,160 @@
+import struct
 from typing import Union
 
-from mappers.mapper import Mapper
+from mappers.mapper import Mapper, MIRROR_HORIZONTAL, MIRROR_VERTICAL
 
+# Bank registers, bank select and IRQ latch and counter, then the reload,
+# enable and IRQ flags and the PRG RAM flags
+_STATE = struct.Struct('<8BBBB5?')
 
+
+#
+# Source https://www.nesdev.org/wiki/MMC3
+#
+
+# Nintendo MMC3 (TxROM)
 class Mapper004(Mapper):
+    counts_scanlines = True
+    power_on_registers = (0, 2, 4, 5, 6, 7, 0, 1)  # R0-R7
+
     def __init__(self, prg_banks, chr_banks):
         super().__init__(prg_banks, chr_banks)
 
-        self.current_prg_bank = 0
-        self.current_chr_bank = 0
-
-    def cpu_map_read(self, addr: int) -> Union[int, None]:
-        if 0x8000 <= addr <= 0xFFFF:
-            addr &= 0x7FFF
-            addr += 0x8000 * self.current_prg_bank
-            return addr
-        return None
-
-    def cpu_map_write(self, addr: int, data: int) -> Union[int, None]:
-        if 0x8000 <= addr <= 0xFFFF:
-            self.current_chr_bank = data & 0x03
-            self.current_prg_bank = (data >> 4) & 0x03
-        return None
-
-    def ppu_map_read(self, addr: int) -> Union[int, None]:
-        if 0x0000 <= addr <= 0x1FFF:
-            if self.chr_banks > 0:
-                addr = 0x2000 * self.current_chr_bank + addr
-            return addr
-        return None
-
-    def ppu_map_write(self, addr: int, data: int) -> Union[int, None]:
-        if 0x0000 <= addr <= 0x1FFF:
-            if self.chr_banks > 0:
-                addr = 0x2000 * self.current_chr_bank + addr
-            return addr
-        return None
\ No newline at end of file
+        self.registers = list(self.power_on_registers)
+        self.bank_select = 0
+
+        self.irq_latch = 0
+        self.irq_counter = 0
+        self.irq_reload = False
+        self.irq_enabled = False
+        self.irq_asserted = False
+        self._irq_event = None
+        self._map_banks()
+
+    def _map_banks(self):
+        r = self.registers
+        if self.bank_select & 0x40:  # $C000 swappable, $8000 fixed to the second last bank
+            self.map_prg(0, -2)
+            self.map_prg(2, r[6])
+        else:
+            self.map_prg(0, r[6])
+            self.map_prg(2, -2)
+        self.map_prg(1, r[7])
+        self.map_prg(3, -1)
+
+        # Two 2 KiB banks and four 1 KiB banks, swapped round by the CHR
+        # inversion bit
+        inversion = 4 if self.bank_select & 0x80 else 0
+        banks = (r[0] & 0xFE, r[0] | 0x01, r[1] & 0xFE, r[1] | 0x01, r[2], r[3], r[4], r[5])
+        for window, bank in enumerate(banks):
+            self.map_chr(window ^ inversion, bank)
+
+    def cpu_write(self, addr: int, data: int):
+        if addr < 0x8000:
+            return
+        even = not addr & 0x01
+        if addr <= 0x9FFF:
+            if even:
+                self.bank_select = data
+            else:
+                self.registers[self.bank_select & 0x07] = data
+            self._map_banks()
+        elif addr <= 0xBFFF:
+            if even:
+                self.mirror_switched(MIRROR_HORIZONTAL if data & 0x01 else MIRROR_VERTICAL)
+            else:
+                self.prg_ram_enabled = bool(data & 0x80)
+                self.prg_ram_writable = self.prg_ram_enabled and not data & 0x40
+        elif addr <= 0xDFFF:
+            if even:
+                self.irq_latch = data
+            else:
+                self.irq_counter = 0
+                self.irq_reload = True
+            self._schedule_irq()
+        else:
+            if even:
+                self.irq_enabled = False
+                self._set_irq(False)
+            else:
+                self.irq_enabled = True
+            self._schedule_irq()
+
+    def scanline(self):
+        self._clock_counter()
+
+    def _clock_counter(self):
+        if self.irq_counter == 0 or self.irq_reload:
+            self.irq_counter = self.irq_latch
+            self.irq_reload = False
+        else:
+            self.irq_counter -= 1
+        if self.irq_counter == 0 and self.irq_enabled:
+            self._set_irq(True)
+
+    def _clocks_to_irq(self) -> int:
+        # How many clocks it takes the counter to reach zero
+        if self.irq_counter == 0 or self.irq_reload:
+            return self.irq_latch + 1
+        return self.irq_counter
+
+    def _set_irq(self, asserted: bool):
+        self.irq_asserted = asserted
+        if self.bus is not None:
+            self.bus.set_irq(self, asserted)
+
+    def _schedule_irq(self):
+        # The counter is only clocked when the PPU catches up, so queue an
+        # event for the A12 rise that will raise IRQ. The event catches the
+        # PPU up, which clocks the counter to zero.
+        bus = self.bus
+        if bus is None:
+            return
+        if self._irq_event is not None:
+            bus.cancel(self._irq_event)
+            self._irq_event = None
+        if not self.irq_enabled or self.irq_asserted:
+            return
+
+        when = self._clock_time(self._clocks_to_irq())
+        if when is not None:
+            self._irq_event = bus.schedule(when, self._irq_due)
+
+    def _clock_time(self, clocks: int) -> Union[int, None]:
+        # The master clock cycle by which the counter is clocked clocks times
+        ppu = self.bus.ppu
+        ppu.sync()
+        dots = ppu.dots_to_scanline_clock(clocks)
+        return None if dots is None else self.bus.system_clock_counter + dots
+
+    def _catch_up(self):
+        # Clock the counter up to now
+        self.bus.ppu.sync()
+
+    def _irq_due(self):
+        self._irq_event = None
+        self._catch_up()
+        if not self.irq_asserted:
+            # the PPU was set up differently than predicted
+            self._schedule_irq()
+
+    def ppu_changed(self):
+        self._schedule_irq()
+
+    def reschedule(self):
+        self._irq_event = None
+        if self.irq_asserted:
+            self.bus.set_irq(self, True)
+        self._schedule_irq()
+
+    def save_state(self) -> bytes:
+        return _STATE.pack(*self.registers, self.bank_select, self.irq_latch, self.irq_counter,
+                           self.irq_reload, self.irq_enabled, self.irq_asserted,
+                           self.prg_ram_enabled, self.prg_ram_writable)
+
+    def load_state(self, data: bytes):
+        values = _STATE.unpack(data)
+        self.registers = list(values[:8])
+        (self.bank_select, self.irq_latch, self.irq_counter, self.irq_reload, self.irq_enabled,
+         self.irq_asserted, self.prg_ram_enabled, self.prg_ram_writable) = values[8:]
+        self._map_banks()
@@ -1,123 +1,146 @@
+import struct
 from typing import Union
 
-from mappers.mapper import Mapper
+from mappers.mapper import MIRROR_HORIZONTAL, MIRROR_VERTICAL
+from mappers.mapper004 import Mapper004
+
+# Bank registers R0-RF, bank select, IRQ latch, counter and mode, the
+# prescaler's progress in master cycles, then the reload, enable and IRQ flags
+_STATE = struct.Struct('<16BBBH?Q3?')
+
+# In CPU cycle mode the counter is clocked every 4 CPU cycles
+_PRESCALER_CYCLES = 4 * 3
 
 
 #
 # Source https://wiki.nesdev.com/w/index.php/RAMBO-1
 #
 
-# Tengen RAMBO-1
-class Mapper064(Mapper):
+# Tengen RAMBO-1, an MMC3 with a third PRG register, 1 KiB CHR banks in place
+# of the 2 KiB ones (K=1) and an IRQ counter that can also count CPU cycles
+class Mapper064(Mapper004):
+    power_on_registers = (0, 2, 4, 5, 6, 7, 0, 1, 1, 3, 0, 0, 0, 0, 0, 2)  # R0-RF, RA-RE are unused
+
     def __init__(self, prg_banks, chr_banks):
         super().__init__(prg_banks, chr_banks)
-        self.prg_rom = [0, 1, 2, prg_banks - 1]
-        self.current_chr_bank = 0
-
-        self.r = 0
-        self.chr_mode = 0
-        self.prg_mode = 0
-        self.chr_inversion = 0
-        self.mirror_mode = 0  # 0: vertical; 1: horizontal
-
-    def cpu_map_read(self, addr: int) -> Union[int, None]:
-        if 0x8000 <= addr <= 0x9FFF:
-            addr &= 0x1FFF
-            addr += 0x2000 * self.prg_rom[0]
-        elif 0xA000 <= addr <= 0xBFFF:
-            addr &= 0x1FFF
-            addr += 0x2000 * self.prg_rom[1]
-        elif 0xC000 <= addr <= 0xDFFF:
-            addr &= 0x1FFF
-            addr += 0x2000 * self.prg_rom[2]
-        elif 0xE000 <= addr <= 0xFFFF:
-            addr &= 0x1FFF
-            addr += 0x2000 * self.prg_rom[3]
+        self.irq_cycle_mode = False
+        self._prescaler_start = 0  # master cycle the prescaler last started over
+
+    def _map_banks(self):
+        r = self.registers
+        if self.bank_select & 0x40:
+            self.map_prg(0, r[15])
+            self.map_prg(1, r[6])
+            self.map_prg(2, r[7])
+        else:
+            self.map_prg(0, r[6])
+            self.map_prg(1, r[7])
+            self.map_prg(2, r[15])
+        self.map_prg(3, -1)
+
+        if self.bank_select & 0x20:
+            banks = (r[0], r[8], r[1], r[9], r[2], r[3], r[4], r[5])
+        else:
+            banks = (r[0] & 0xFE, r[0] | 0x01, r[1] & 0xFE, r[1] | 0x01, r[2], r[3], r[4], r[5])
+        inversion = 4 if self.bank_select & 0x80 else 0
+        for window, bank in enumerate(banks):
+            self.map_chr(window ^ inversion, bank)
+
+    def cpu_write(self, addr: int, data: int):
+        if addr < 0x8000:
+            return
+        even = not addr & 0x01
+        if addr <= 0x9FFF:
+            if even:
+                self.bank_select = data
+            else:
+                self.registers[self.bank_select & 0x0F] = data
+            self._map_banks()
+        elif addr <= 0xBFFF:
+            if even:
+                self.mirror_switched(MIRROR_HORIZONTAL if data & 0x01 else MIRROR_VERTICAL)
         else:
-            addr = None
-        return addr
-
-    def cpu_map_write(self, addr: int, data: int) -> Union[int, None]:
-        addr &= 0xFFFF
-        if addr & 0x01 == 0:  # Even
-            if 0x8000 <= addr <= 0x9FFE:  # bank select
-                self.r = data & 0xF
-                self.chr_mode = (data >> 5) & 0x1
-                self.prg_mode = (data >> 6) & 0x1
-                self.chr_inversion = (data >> 7) & 0x1
-            elif 0xA000 <= addr <= 0xBFFE:  # Mirroring
-                temp = self.mirror_mode
-                self.mirror_mode = data & 0x01
-                if temp != self.mirror_mode:
-                    print(f'mirror mode changed from: {temp} -> {self.mirror_mode}')
-            elif 0xC000 <= addr <= 0xDFFE:
-                print('IRQ Latching')
-                pass
-            elif 0xE001 <= addr <= 0xFFFF:
-                print('IRQ Enable')
-                pass
-        else:  # Odd
-            if 0x8001 <= addr <= 0x9FFF:
-                if self.r == 0b0000:
-                    # R0: Select 2 (K=0) or 1 (K=1) KiB CHR bank at PPU $0000 (or $1000)
-                    pass
-                elif self.r == 0b0001:
-                    # R1: Select 2 (K=0) or 1 (K=1) KiB CHR bank at PPU $0800 (or $1800)
-                    pass
-                elif self.r == 0b0010:
-                    # R2: Select 1 KiB CHR bank at PPU $1000-$13FF (or $0000-$03FF)
-                    pass
-                elif self.r == 0b0011:
-                    # R3: Select 1 KiB CHR bank at PPU $1400-$17FF (or $0400-$07FF)
-                    pass
-                elif self.r == 0b0100:
-                    # R4: Select 1 KiB CHR bank at PPU $1800-$1BFF (or $0800-$0BFF)
-                    pass
-                elif self.r == 0b0101:
-                    # R5: Select 1 KiB CHR bank at PPU $1C00-$1FFF (or $0C00-$0FFF)
-                    pass
-                elif self.r == 0b0110:
-                    # R6: Select 8 KiB PRG ROM bank at $8000-$9FFF (or $C000-$DFFF)
-                    prg_index = 2 if self.prg_mode else 0
-                    print(f'PRG swap {prg_index} := {data:02X}')
-                elif self.r == 0b0111:
-                    # R7: Select 8 KiB PRG ROM bank at $A000-$BFFF
-                    prg_index = 1
-                    print(f'PRG swap {prg_index} := {data:02X}')
-                elif self.r == 0b1000:
-                    # R8: If K=1, Select 1 KiB CHR bank at PPU $0400 (or $1400)
-                    pass
-                elif self.r == 0b1001:
-                    # R9: If K=1, Select 1 KiB CHR bank at PPU $0C00 (or $1C00)
-                    pass
-                elif self.r == 0b1111:
-                    # RF: Select 8 KiB PRG ROM bank at $C000-$DFFF (or $8000-$9FFF)
-                    prg_index = 0 if self.prg_mode else 2
-                    print(f'PRG swap {prg_index} := {data:02X}')
+            self._catch_up()
+            if addr <= 0xDFFF:
+                if even:
+                    self.irq_latch = data
                 else:
-                    # print(f'Unknown mode: {self.r:04b}')
-                    pass  # do nothing
-                # print(f'odd {addr:016b} {self.r:04b} {self.chr_mode} {self.prg_mode} {self.chr_inversion}')
-            elif 0xA001 <= addr <= 0xBFFF:
-                print('Unused mode?')
-                pass
-
-        if 0x8000 <= addr <= 0xFFFF:
-            pass
-            # self.current_chr_bank = data & 0x03
-            # self.current_prg_bank = (data >> 4) & 0x03
-        return None
-
-    def ppu_map_read(self, addr: int) -> Union[int, None]:
-        if 0x0000 <= addr <= 0x1FFF:
-            if self.chr_banks > 0:
-                addr = 0x2000 * self.current_chr_bank + addr
-            return addr
-        return None
-
-    def ppu_map_write(self, addr: int, data: int) -> Union[int, None]:
-        if 0x0000 <= addr <= 0x1FFF:
-            if self.chr_banks > 0:
-                addr = 0x2000 * self.current_chr_bank + addr
-            return addr
-        return None
+                    self.irq_cycle_mode = bool(data & 0x01)
+                    self._prescaler_start = self._now()
+                    self.irq_reload = True
+            elif even:
+                self.irq_enabled = False
+                self._set_irq(False)
+            else:
+                self.irq_enabled = True
+            self._schedule_irq()
+
+    def scanline(self):
+        if not self.irq_cycle_mode:
+            self._clock_counter()
+
+    def _clock_counter(self):
+        # A reload takes one clock more than it does on the MMC3 for
+        # latches above 1
+        if self.irq_reload:
+            self.irq_counter = self.irq_latch if self.irq_latch <= 1 else self.irq_latch + 1
+            self.irq_reload = False
+        elif self.irq_counter == 0:
+            self.irq_counter = self.irq_latch
+        else:
+            self.irq_counter -= 1
+        if self.irq_counter == 0 and self.irq_enabled:
+            self._set_irq(True)
+
+    def _clocks_to_irq(self) -> int:
+        if self.irq_reload:
+            return self.irq_latch + 1 if self.irq_latch <= 1 else self.irq_latch + 2
+        if self.irq_counter == 0:
+            return self.irq_latch + 1
+        return self.irq_counter
+
+    def _now(self) -> int:
+        return 0 if self.bus is None else self.bus.system_clock_counter
+
+    def _clock_time(self, clocks: int) -> Union[int, None]:
+        if not self.irq_cycle_mode:
+            return super()._clock_time(clocks)
+        return self._prescaler_start + clocks * _PRESCALER_CYCLES
+
+    def _catch_up(self):
+        if not self.irq_cycle_mode:
+            if self.bus is not None:
+                self.bus.ppu.sync()
+            return
+
+        # Nothing sees the counter between register writes and IRQs, so the
+        # prescaler's clocks are worked out all at once
+        clocks = (self._now() - self._prescaler_start) // _PRESCALER_CYCLES
+        if not clocks:
+            return
+        self._prescaler_start += clocks * _PRESCALER_CYCLES
+        self._clock_counter()
+        clocks -= 1
+        if clocks < self.irq_counter:
+            self.irq_counter -= clocks
+            return
+
+        # Reaches zero and from then on counts down from the latch
+        clocks -= self.irq_counter
+        left = clocks % (self.irq_latch + 1)
+        self.irq_counter = self.irq_latch + 1 - left if left else 0
+        if self.irq_enabled:
+            self._set_irq(True)
+
+    def save_state(self) -> bytes:
+        return _STATE.pack(*self.registers, self.bank_select, self.irq_latch, self.irq_counter,
+                           self.irq_cycle_mode, self._now() - self._prescaler_start,
+                           self.irq_reload, self.irq_enabled, self.irq_asserted)
+
+    def load_state(self, data: bytes):
+        values = _STATE.unpack(data)
+        self.registers = list(values[:16])
+        (self.bank_select, self.irq_latch, self.irq_counter, self.irq_cycle_mode, prescaler,
+         self.irq_reload, self.irq_enabled, self.irq_asserted) = values[16:]
+        self._prescaler_start = self._now() - prescaler
+        self._map_banks()
@@ -1,7 +1,9 @@
-from typing import Union
+import struct
 
 from mappers.mapper import Mapper
 
+_STATE = struct.Struct('<BB')
+
 
 class Mapper066(Mapper):
     def __init__(self, prg_banks, chr_banks):
@@ -9,30 +11,24 @@ class Mapper066(Mapper):
 
         self.current_prg_bank = 0
         self.current_chr_bank = 0
+        self._map_banks()
 
-    def cpu_map_read(self, addr: int) -> Union[int, None]:
-        if 0x8000 <= addr <= 0xFFFF:
-            addr &= 0x7FFF
-            addr += 0x8000 * self.current_prg_bank
-            return addr
-        return None
+    def _map_banks(self):
+        # A 32 KiB PRG bank and an 8 KiB CHR bank
+        for window in range(4):
+            self.map_prg(window, 4 * self.current_prg_bank + window)
+        for window in range(8):
+            self.map_chr(window, 8 * self.current_chr_bank + window)
 
-    def cpu_map_write(self, addr: int, data: int) -> Union[int, None]:
+    def cpu_write(self, addr: int, data: int):
         if 0x8000 <= addr <= 0xFFFF:
             self.current_chr_bank = data & 0x03
             self.current_prg_bank = (data >> 4) & 0x03
-        return None
-
-    def ppu_map_read(self, addr: int) -> Union[int, None]:
-        if 0x0000 <= addr <= 0x1FFF:
-            if self.chr_banks > 0:
-                addr = 0x2000 * self.current_chr_bank + addr
-            return addr
-        return None
-
-    def ppu_map_write(self, addr: int, data: int) -> Union[int, None]:
-        if 0x0000 <= addr <= 0x1FFF:
-            if self.chr_banks > 0:
-                addr = 0x2000 * self.current_chr_bank + addr
-            return addr
-        return None
+            self._map_banks()
+
+    def save_state(self) -> bytes:
+        return _STATE.pack(self.current_prg_bank, self.current_chr_bank)
+
+    def load_state(self, data: bytes):
+        self.current_prg_bank, self.current_chr_bank = _STATE.unpack(data)
+        self._map_banks()
@@ -1,9 +1,10 @@
+import struct
 from dataclasses import dataclass
-from typing import List
+from typing import Union
 
 import numpy as np
 
-from _nes_palette import _create_palette
+from _nes_palette import _create_palette, _create_emphasis_palette
 from cartridge import Cartridge, Mirror
 from ppu_2C02_structs import PPUCtrl, PPUMask, PPUStatus, LoopyRegister
 
@@ -14,6 +15,49 @@ def _create_sprite(w, h):
     return array
 
 
+# Palette RAM index for palette << 2 | pixel, with $3F10/$3F14/$3F18/$3F1C
+# mirroring $3F00/$3F04/$3F08/$3F0C
+_PALETTE_MIRROR = np.array([i & 0x0F if i in (0x10, 0x14, 0x18, 0x1C) else i for i in range(32)])
+
+_EMPTY_NAME_TABLE = bytes(1024)
+
+# Registers and latches, the 8 sprites of the scanline (y, id, attribute, x)
+# and their pattern shifters, followed by OAM, name tables, pattern tables and
+# palette RAM
+_STATE = struct.Struct('<3B?2B2I3B2?4B4HHhQ?H32B16B')
+_MEMORY_SIZES = (256, 2048, 8192, 32)
+
+# Dot counts from the start of the pre-render line: the dot setting
+# vertical blank and the length of a frame
+_VBLANK_DOT = 242 * 341 + 1
+_FRAME_DOTS = 262 * 341
+
+
+def _unpack(data):
+    # One element per bit, most significant bit first
+    return np.unpackbits(np.array(data, dtype=np.uint8))
+
+
+def _increment_y(vram: int) -> int:
+    # increment_scroll_y on a plain loopy register value
+    if vram & 0x7000 != 0x7000:
+        return vram + 0x1000
+    vram &= ~0x7000
+    coarse_y = (vram >> 5) & 0x1F
+    if coarse_y == 29:
+        return (vram & ~0x03E0) ^ 0x0800
+    elif coarse_y == 31:
+        return vram & ~0x03E0
+    return vram + 0x0020
+
+
+def _increment_x(vram: int, n: int) -> int:
+    # increment_scroll_x n times, coarse x and the horizontal name table
+    # bit count together as one 6 bit number
+    x = ((((vram >> 10) & 0x01) << 5) | (vram & 0x1F)) + n
+    return (vram & ~0x041F) | ((x & 0x20) << 5) | (x & 0x1F)
+
+
 def _reverse_byte(b):
     b = (b & 0xF0) >> 4 | (b & 0x0F) << 4
     b = (b & 0xCC) >> 2 | (b & 0x33) << 2
@@ -36,9 +80,18 @@ class OAMAttributeEntry:
 
 
 class PPU2C02:
-    def __init__(self, bus):
+    def __init__(self, bus, scanline_renderer=False):
         self.bus = bus
         self.cart: Cartridge = None
+        self._scanline_counter = None  # the mapper if it counts A12 rises
+        self.scanline_renderer = scanline_renderer
+        # Without output frame_buffer is left alone, the PPU still keeps time
+        # and detects sprite zero hits
+        self.render_output = True
+        self._timing_only = False
+        self._deferred = 0  # dots put off by run()
+        self._event_dots = 0  # how many dots run() may put off
+        self._spr_zero_hit_dot = 0  # timing only: the dot of this line's hit
 
         self._control = PPUCtrl(0x00)
         self._mask = PPUMask(0x00)
@@ -51,7 +104,8 @@ class PPU2C02:
         self._tram_addr = LoopyRegister(0x0000)
         self._fine_x = 0x00
 
-        self._oam = [0x00] * 64 * 4  # 4 bytes per OAM
+        self._oam = bytearray(64 * 4)  # 4 bytes per OAM
+        self.oam_view = memoryview(self._oam)
         self._oam_addr = 0x00
         self._sprite_scanline = [OAMAttributeEntry() for _ in range(8)]
         self._sprite_count = 0x00
@@ -76,23 +130,41 @@ class PPU2C02:
         self.frame_count = 0
         self.frame_complete = False
 
-        self.name_table = [[0x00] * 1024, [0x00] * 1024]
-        self.pattern_table = [[0x00] * 4096, [0x00] * 4096]
-        self.palette_table = [0x00] * 32
+        # The tables are views into contiguous buffers, which makes copying
+        # them (or handing them to NumPy) a single operation
+        self.vram_view = memoryview(bytearray(2 * 1024))
+        self.pattern_view = memoryview(bytearray(2 * 4096))
+        self.palette_view = memoryview(bytearray(32))
+        self.name_table = [self.vram_view[:1024], self.vram_view[1024:]]
+        self.pattern_table = [self.pattern_view[:4096], self.pattern_view[4096:]]
+        self.palette_table = self.palette_view
 
         self.pal_screen = _create_palette()
+        self.pal_emphasis = _create_emphasis_palette(self.pal_screen)
+        self._palette = np.frombuffer(self.palette_view, dtype=np.uint8)
         self.spr_pattern_table = [_create_sprite(128, 128), _create_sprite(128, 128)]
         self.spr_screen = _create_sprite(256, 240)
 
+        # Colour index (0-63) of every pixel and the emphasis bits of every
+        # line, turned into RGB by get_screen
+        self.frame_buffer = np.zeros((240, 256), dtype=np.uint8)
+        self.frame_emphasis = np.zeros(240, dtype=np.uint8)
+
     def cpu_write(self, addr: int, data: int):
+        if self._deferred:
+            self.sync()
         data = data & 0xFF
         if addr == 0x0000:  # Control
             self._control.set_reg(data)
             self._tram_addr.nametable_x = self._control.nametable_x
             self._tram_addr.nametable_y = self._control.nametable_y
+            if self._scanline_counter is not None:
+                self._scanline_counter.ppu_changed()
 
         elif addr == 0x0001:  # Mask
             self._mask.set_reg(data)
+            if self._scanline_counter is not None:
+                self._scanline_counter.ppu_changed()
 
         elif addr == 0x0002:  # Status
             pass
@@ -128,6 +200,8 @@ class PPU2C02:
             self._vram_addr.reg += inc
 
     def cpu_read(self, addr: int, read_only=False) -> int:
+        if self._deferred:
+            self.sync()
         data = 0x00
         if addr == 0x0000:  # Control
             pass
@@ -245,10 +319,61 @@ class PPU2C02:
 
         return data
 
+    def save_state(self) -> bytes:
+        # Shifters only ever expose their low 8 (sprites) or 16 (background)
+        # bits, the rest is left over from shifting
+        sprites = []
+        for oam in self._sprite_scanline:
+            sprites += (oam.y, oam.id, oam.attribute, oam.x)
+        registers = _STATE.pack(
+            self._control.reg, self._mask.reg, self._status.reg, self.nmi,
+            self._address_latch, self._ppu_data_buffer,
+            self._vram_addr.reg, self._tram_addr.reg,
+            self._fine_x, self._oam_addr, self._sprite_count,
+            self._spr_zero_hit_possible, self._spr_zero_being_rendered,
+            self._bg_next_tile_id, self._bg_next_tile_attrib, self._bg_next_tile_lsb, self._bg_next_tile_msb,
+            self._bg_shifter_ptrn_lo & 0xFFFF, self._bg_shifter_ptrn_hi & 0xFFFF,
+            self._bg_shifter_attrib_lo & 0xFFFF, self._bg_shifter_attrib_hi & 0xFFFF,
+            self._cycle, self._scanline, self.frame_count, self.frame_complete, self._deferred,
+            *sprites,
+            *(shifter & 0xFF for shifter in self._spr_shifter_ptrn_lo),
+            *(shifter & 0xFF for shifter in self._spr_shifter_ptrn_hi),
+        )
+        return b''.join((registers, self._oam, self.vram_view, self.pattern_view, self.palette_view))
+
+    def load_state(self, data: bytes):
+        values = _STATE.unpack_from(data)
+        (control, mask, status, self.nmi,
+         self._address_latch, self._ppu_data_buffer,
+         self._vram_addr.reg, self._tram_addr.reg,
+         self._fine_x, self._oam_addr, self._sprite_count,
+         self._spr_zero_hit_possible, self._spr_zero_being_rendered,
+         self._bg_next_tile_id, self._bg_next_tile_attrib, self._bg_next_tile_lsb, self._bg_next_tile_msb,
+         self._bg_shifter_ptrn_lo, self._bg_shifter_ptrn_hi,
+         self._bg_shifter_attrib_lo, self._bg_shifter_attrib_hi,
+         self._cycle, self._scanline, self.frame_count, self.frame_complete, self._deferred) = values[:26]
+        self._event_dots = 0
+        self._spr_zero_hit_dot = 0
+        self._control.set_reg(control)
+        self._mask.set_reg(mask)
+        self._status.set_reg(status)
+        for i, oam in enumerate(self._sprite_scanline):
+            oam.y, oam.id, oam.attribute, oam.x = values[26 + i * 4:30 + i * 4]
+        self._spr_shifter_ptrn_lo = list(values[58:66])
+        self._spr_shifter_ptrn_hi = list(values[66:74])
+
+        offset = _STATE.size
+        for memory, size in zip((self.oam_view, self.vram_view, self.pattern_view, self.palette_view), _MEMORY_SIZES):
+            memory[:] = data[offset:offset + size]
+            offset += size
+
     def connect_cartridge(self, cartridge: Cartridge):
         self.cart = cartridge
+        mapper = getattr(cartridge, 'mapper', None)
+        self._scanline_counter = mapper if mapper is not None and mapper.counts_scanlines else None
 
     def get_screen(self):
+        self.spr_screen[:] = self.pal_emphasis[self.frame_emphasis[:, np.newaxis], self.frame_buffer]
         return self.spr_screen
 
     def get_color_from_palette_ram(self, palette, pixel):
@@ -256,20 +381,11 @@ class PPU2C02:
         return self.pal_screen[self.ppu_read(addr) & 0x3F]
 
     def get_pattern_table(self, i, palette):
-        for tile_y in range(0, 16):
-            for tile_x in range(0, 16):
-                offset = tile_y * 256 + tile_x * 16
-                for row in range(0, 8):
-                    tile_lsb = self.ppu_read(i * 0x1000 + offset + row)
-                    tile_msb = self.ppu_read(i * 0x1000 + offset + row + 8)
-                    for col in range(0, 8):
-                        pixel = ((tile_lsb & 0x01) << 1) | (tile_msb & 0x01)
-                        tile_lsb >>= 1
-                        tile_msb >>= 1
-                        x = tile_x * 8 + (7 - col)
-                        y = tile_y * 8 + row
-                        color = self.get_color_from_palette_ram(palette, pixel)
-                        self.spr_pattern_table[i][y, x] = color
+        # 16x16 tiles of 8x8 pixels
+        tiles = self.cart.tiles.table(i).reshape(16, 16, 8, 8)
+        pixels = tiles.transpose(0, 2, 1, 3).reshape(128, 128)
+        colors = np.array([self.get_color_from_palette_ram(palette, pixel) for pixel in range(4)], dtype=np.uint8)
+        self.spr_pattern_table[i][:] = colors[pixels]
 
         return self.spr_pattern_table[i]
 
@@ -357,21 +473,7 @@ class PPU2C02:
             self.sprite_evaluation(cycle, scanline)
 
             if cycle == 340:
-                for i in range(self._sprite_count):
-                    oam = self._sprite_scanline[i]
-
-                    spr_ptrn_addr_lo = self.get_sprite_pattern_addr_lo(oam, scanline)
-                    spr_ptrn_addr_hi = spr_ptrn_addr_lo + 8
-                    spr_ptrn_bits_lo = self.ppu_read(spr_ptrn_addr_lo)
-                    spr_ptrn_bits_hi = self.ppu_read(spr_ptrn_addr_hi)
-
-                    if oam.attribute & 0x40:
-                        # flip patterns horizontally
-                        spr_ptrn_bits_lo = _reverse_byte(spr_ptrn_bits_lo)
-                        spr_ptrn_bits_hi = _reverse_byte(spr_ptrn_bits_hi)
-
-                    self._spr_shifter_ptrn_lo[i] = spr_ptrn_bits_lo
-                    self._spr_shifter_ptrn_hi[i] = spr_ptrn_bits_hi
+                self.load_sprite_shifters(scanline)
 
         if scanline == 240:
             # post render scanline
@@ -382,6 +484,7 @@ class PPU2C02:
 
             if self._control.enable_nmi:
                 self.nmi = True
+                self.bus.request_nmi()
 
         bg_pixel = 0x00
         bg_palette = 0x00
@@ -443,9 +546,10 @@ class PPU2C02:
                         if 1 <= cycle < 258:
                             self._status.sprite_zero_hit = 1
 
-        if 0 <= scanline < 240 and 1 <= cycle < 257:
-            color = self.get_color_from_palette_ram(palette, pixel)
-            self.spr_screen[scanline, cycle - 1] = color
+        if 0 <= scanline < 240 and 1 <= cycle < 257 and self.render_output:
+            if cycle == 1:
+                self.frame_emphasis[scanline] = self._mask.reg >> 5
+            self.frame_buffer[scanline, cycle - 1] = self.ppu_read(0x3F00 + (palette << 2) + pixel) & 0x3F
 
         self._cycle += 1
         if self._cycle >= 341:
@@ -456,6 +560,395 @@ class PPU2C02:
                 self.frame_complete = True
                 self.frame_count += 1
 
+    @property
+    def scanline(self) -> int:
+        # The line the PPU is on once it has run the dots put off
+        self.sync()
+        return self._scanline
+
+    @property
+    def cycle(self) -> int:
+        # The dot of the line the PPU is on once it has run the dots put off
+        self.sync()
+        return self._cycle
+
+    @property
+    def timing_only(self) -> bool:
+        """
+        Whether the PPU only keeps time. Nothing is drawn and only what the
+        CPU can see is kept up: status flags, NMI, frame timing and the VRAM
+        address. Each line is worked out at once instead of dot by dot.
+        Switch between frames, the lines after a switch in the middle of a
+        frame may render wrongly.
+        """
+        return self._timing_only
+
+    @timing_only.setter
+    def timing_only(self, timing_only: bool):
+        self.sync()
+        self._timing_only = timing_only
+        self._event_dots = 0
+
+    def run(self, dots: int):
+        # The PPU runs lazily: dots are put off until the CPU touches it
+        # (which calls sync()), vertical blank starts or the frame ends
+        deferred = self._deferred + dots
+        if deferred < self._event_dots:
+            self._deferred = deferred
+            return
+        self._deferred = 0
+        self._catch_up(deferred)
+
+    def sync(self):
+        # Something is about to observe or change the PPU, run what was put off
+        deferred = self._deferred
+        if deferred:
+            self._deferred = 0
+            self._catch_up(deferred)
+
+    def _catch_up(self, dots: int):
+        # Whole visible lines go to the scanline renderer, the dots of lines
+        # that draw nothing are only counted, anything else is clocked
+        clock = self.clock
+        counter = self._scanline_counter
+        while dots:
+            scanline = self._scanline
+            cycle = self._cycle
+            end = min(cycle + dots, 341)
+            dots -= end - cycle
+            if counter is not None and scanline < 240:
+                a12_dot = self._a12_dot()
+                if a12_dot is not None and cycle <= a12_dot < end:
+                    counter.scanline()
+
+            if scanline >= 240:
+                self._idle_line(cycle, end)
+            elif self._timing_only:
+                self._time_line(cycle, end)
+            elif self.scanline_renderer and end - cycle == 341 and scanline >= 0:
+                self.render_scanline()
+                continue
+            else:
+                for _ in range(end - cycle):
+                    clock()
+                continue
+
+            if end < 341:
+                self._cycle = end
+            else:
+                self._cycle = 0
+                self._scanline += 1
+                if self._scanline >= 261:
+                    self._scanline = -1
+                    self.frame_complete = True
+                    self.frame_count += 1
+
+        position = (self._scanline + 1) * 341 + self._cycle
+        if position <= _VBLANK_DOT:
+            self._event_dots = _VBLANK_DOT + 1 - position
+        else:
+            self._event_dots = _FRAME_DOTS - position
+
+    def _a12_dot(self) -> Union[int, None]:
+        # The dot of lines -1 to 239 where A12 of the PPU address rises for
+        # good: when the sprite patterns are fetched from $1000 after the
+        # background from $0000, or the other way round when the next line's
+        # background is fetched. None if it never does (or only briefly).
+        if not self._mask.reg & 0x18:
+            return None
+        control = self._control
+        sprites_high = control.sprite_size or control.pattern_sprite
+        if control.pattern_background:
+            return None if sprites_high else 324
+        return 260 if sprites_high else None
+
+    def dots_to_scanline_clock(self, count: int) -> Union[int, None]:
+        """
+        How many dots from now it takes until A12 has risen count times, if
+        nothing is written to the PPU in between. None if it never rises.
+        """
+        dot = self._a12_dot()
+        if dot is None:
+            return None
+        # Lines are numbered from 0 (the pre-render line) on, A12 rises on
+        # the first 241 lines of every 262
+        line = self._scanline + 1
+        first = line if line <= 240 and self._cycle <= dot else line + 1
+        if first > 240:
+            first = 262
+        clocked = first // 262 * 241 + first % 262 + count - 1
+        target = clocked // 241 * 262 + clocked % 241
+        return (target - line) * 341 + dot + 1 - self._cycle - self._deferred
+
+    def _idle_line(self, start: int, end: int):
+        # Dots start to end - 1 of lines 240-260, which only raise vertical
+        # blank. Nothing shifts on these lines, so clock() looks at the same
+        # background and sprite pixels on every dot and can only find a
+        # sprite zero hit left over from the last visible line.
+        if self._scanline == 241 and start <= 1 < end:
+            self._status.vertical_blank = 1
+            if self._control.enable_nmi:
+                self.nmi = True
+                self.bus.request_nmi()
+
+        mask = self._mask.reg
+        if self._spr_zero_hit_possible and mask & 0x18 == 0x18 and start < 258 and end > (1 if mask & 0x06 else 9):
+            oam = self._sprite_scanline[0]
+            sprite = (self._spr_shifter_ptrn_lo[0] | self._spr_shifter_ptrn_hi[0]) & 0x80
+            background = (self._bg_shifter_ptrn_lo | self._bg_shifter_ptrn_hi) & (0x8000 >> self._fine_x)
+            if oam.x == 0 and sprite and background:
+                self._status.sprite_zero_hit = 1
+
+    def _time_line(self, start: int, end: int):
+        # What dots start to end - 1 of the current line do in clock() that
+        # the CPU can observe, in the same order
+        scanline = self._scanline
+        mask = self._mask.reg
+        if scanline == -1:
+            if start <= 1 < end:
+                self._status.vertical_blank = 0
+                self._status.sprite_zero_hit = 0
+                self._status.sprite_overflow = 0
+                self._spr_shifter_ptrn_lo = [0x00] * 8
+                self._spr_shifter_ptrn_hi = [0x00] * 8
+            if mask & 0x10 and start < 258 and end > 2:
+                # the sprites of the last line count their x down here too,
+                # the first line draws them from what is left
+                dots = min(end, 258) - max(start, 2)
+                for i in range(self._sprite_count):
+                    oam = self._sprite_scanline[i]
+                    oam.x = max(oam.x - dots, 0)
+
+        if scanline >= 0:
+            if start == 0:
+                hit = self._spr_zero_hit_possible and mask & 0x18 == 0x18
+                self._spr_zero_hit_dot = self._sprite_zero_hit_dot() if hit else 0
+            if self._spr_zero_hit_dot and start <= self._spr_zero_hit_dot < end:
+                self._status.sprite_zero_hit = 1
+
+        if mask & 0x18:
+            # coarse x is incremented on dots 8, 16, .. 256, 328 and 336
+            vram = self._vram_addr.reg
+            first, last = max(start, 8), min(end, 257)
+            if first < last:
+                vram = _increment_x(vram, (last - 1) // 8 - (first - 1) // 8)
+            if start <= 256 < end:
+                vram = _increment_y(vram)
+            if start <= 257 < end:
+                vram = (vram & ~0x041F) | (self._tram_addr.reg & 0x041F)
+            if scanline == -1 and start < 305 and end > 280:
+                vram = (vram & ~0x7BE0) | (self._tram_addr.reg & 0x7BE0)
+            vram = _increment_x(vram, (start <= 328 < end) + (start <= 336 < end))
+            self._vram_addr.reg = vram
+
+        # Only sprite zero is of interest, and all sprites of the last line
+        # for the pre-render line of the next frame
+        if scanline >= 0 and start <= 257 < end:
+            size = 16 if self._control.sprite_size else 8
+            if scanline == 239 or 0 <= scanline - self._oam[0] < size:
+                self.sprite_evaluation(257, scanline)
+            else:
+                self._spr_zero_hit_possible = False
+        if start <= 340 < end and self._spr_zero_hit_possible:
+            self.load_sprite_shifters(scanline)
+
+    def _sprite_zero_hit_dot(self) -> int:
+        # The first dot of this line at which an opaque sprite zero pixel is
+        # over an opaque background pixel, or 0. The background tiles are the
+        # two fetched at the end of the previous line followed by the ones
+        # along the VRAM address.
+        sprite = (self._spr_shifter_ptrn_lo[0] | self._spr_shifter_ptrn_hi[0]) & 0xFF
+        if not sprite:
+            return 0
+        x = self._sprite_scanline[0].x
+        vram = self._vram_addr.reg
+        fine_y = (vram >> 12) & 0x07
+        row = (((vram >> 11) & 0x01) << 1, vram & 0x03E0)
+        tile_x = ((((vram >> 10) & 0x01) << 5) | (vram & 0x1F)) - 2
+        name_tables = self._mirrored_name_tables()
+        tiles = self.cart.tiles.table(self._control.pattern_background)
+
+        first = 0 if self._mask.reg & 0x06 else 8
+        for column in range(max(x, first), min(x + 8, 256)):
+            if sprite & (0x80 >> (column - x)):
+                pixel = column + self._fine_x
+                tile = (tile_x + (pixel >> 3)) & 0x3F
+                tile_id = name_tables[row[0] | (tile >> 5)][row[1] | (tile & 0x1F)]
+                if tiles[tile_id, fine_y, pixel & 0x07]:
+                    return column + 1
+        return 0
+
+    def render_scanline(self):
+        """
+        Run all 341 dots of a visible scanline at once.
+
+        The background is drawn from the scroll registers as latched at the
+        start of the line: the two tiles already in the shifters followed by
+        the tiles fetched across the line. The result (pixels, registers,
+        shifters and sprite state) matches clocking the line dot by dot as
+        long as the PPU is left alone during the line. The only exception is
+        the off screen dot 257, which is not checked for sprite zero hits.
+        """
+        scanline = self._scanline
+        mask = self._mask.reg
+        rendering = mask & 0x18
+        ppu_read = self.ppu_read
+        name_tables = self._mirrored_name_tables()
+        pattern_background = self._control.pattern_background << 12
+
+        # 32 tiles are fetched for this line (dots 2-257) and two for the
+        # next one (dots 321-336)
+        vram = self._vram_addr.reg
+        fine_y = (vram >> 12) & 0x07
+        tile_id = self._bg_next_tile_id
+        tile_ids = []
+        attribs = []
+        next_tiles = []
+        for tile in range(34):
+            if tile == 32:
+                if rendering:
+                    vram = _increment_y(vram)
+                    vram = (vram & ~0x041F) | (self._tram_addr.reg & 0x041F)
+                tile_id = name_tables[(vram >> 10) & 0x03][vram & 0x03FF]
+
+            attrib = name_tables[(vram >> 10) & 0x03][0x03C0 | ((vram >> 4) & 0x38) | ((vram >> 2) & 0x07)]
+            if vram & 0x0040:
+                attrib >>= 4
+            if vram & 0x0002:
+                attrib >>= 2
+            attrib &= 0x03
+            if tile < 32:
+                tile_ids.append(tile_id)
+                attribs.append(attrib)
+            else:
+                # the shifters get the pattern bytes of these
+                addr = pattern_background + (tile_id << 4) + ((vram >> 12) & 0x07)
+                next_tiles.append((ppu_read(addr), ppu_read(addr + 8), attrib))
+
+            if rendering:
+                if vram & 0x001F == 31:
+                    vram = (vram & ~0x001F) ^ 0x0400
+                else:
+                    vram += 1
+            tile_id = name_tables[(vram >> 10) & 0x03][vram & 0x03FF]
+
+        output = self.render_output
+        bg_pixel = None
+        color = None
+        if mask & 0x08:
+            # the pixels are a 256 dot window, offset by fine x, into the two
+            # tiles left in the shifters followed by the fetched ones
+            shifters = _unpack([
+                (self._bg_shifter_ptrn_lo >> 8) & 0xFF, self._bg_shifter_ptrn_lo & 0xFF,
+                (self._bg_shifter_ptrn_hi >> 8) & 0xFF, self._bg_shifter_ptrn_hi & 0xFF,
+                (self._bg_shifter_attrib_lo >> 8) & 0xFF, self._bg_shifter_attrib_lo & 0xFF,
+                (self._bg_shifter_attrib_hi >> 8) & 0xFF, self._bg_shifter_attrib_hi & 0xFF,
+            ]).reshape(4, 16)
+            tiles = self.cart.tiles.table(pattern_background >> 12)
+            pixels = slice(self._fine_x, self._fine_x + 256)
+            bg_pixel = np.concatenate((shifters[0] | (shifters[1] << 1), tiles[tile_ids, fine_y].ravel()))[pixels]
+            if output:
+                bg_palette = np.concatenate((shifters[2] | (shifters[3] << 1), np.repeat(attribs, 8)))[pixels]
+                color = np.where(bg_pixel != 0, (bg_palette << 2) | bg_pixel, 0).astype(np.uint8)
+        elif output:
+            color = np.zeros(256, dtype=np.uint8)
+
+        if mask & 0x10 and self._sprite_count:
+            if output:
+                # palette << 2 | pixel of the frontmost opaque sprite pixel
+                fg_color = np.zeros(264, dtype=np.uint8)
+                fg_front = np.zeros(264, dtype=bool)
+                for i in reversed(range(self._sprite_count)):
+                    oam = self._sprite_scanline[i]
+                    row = _unpack([self._spr_shifter_ptrn_lo[i] & 0xFF, self._spr_shifter_ptrn_hi[i] & 0xFF])
+                    row = row[:8] | (row[8:] << 1)
+                    opaque = row != 0
+                    x = oam.x
+                    fg_color[x:x + 8][opaque] = row[opaque] | (((oam.attribute & 0x03) + 0x04) << 2)
+                    fg_front[x:x + 8][opaque] = (oam.attribute & 0x20) == 0
+                fg_color = fg_color[:256]
+
+                if bg_pixel is None:
+                    color = fg_color
+                else:
+                    color = np.where((fg_color != 0) & (fg_front[:256] | (bg_pixel == 0)), fg_color, color)
+
+            if bg_pixel is not None and self._spr_zero_hit_possible:
+                # sprite zero is in the first slot when it is on this line
+                row = _unpack([self._spr_shifter_ptrn_lo[0] & 0xFF, self._spr_shifter_ptrn_hi[0] & 0xFF])
+                x = self._sprite_scanline[0].x
+                sprite_zero = np.zeros(264, dtype=bool)
+                sprite_zero[x:x + 8] = (row[:8] | row[8:]) != 0
+                hits = sprite_zero[:256] & (bg_pixel != 0)
+                if not mask & 0x06:
+                    hits[:8] = False
+                if hits.any():
+                    self._status.sprite_zero_hit = 1
+
+        if output:
+            self.frame_buffer[scanline] = self._palette[_PALETTE_MIRROR[color]] & 0x3F
+            self.frame_emphasis[scanline] = mask >> 5
+
+        # Leave everything as the last dots of the line would have
+        self._vram_addr.reg = vram
+        (lsb_a, msb_a, attrib_a), (lsb, msb, attrib) = next_tiles
+        self._bg_next_tile_id = tile_id
+        self._bg_next_tile_attrib = attrib
+        self._bg_next_tile_lsb = lsb
+        self._bg_next_tile_msb = msb
+        attrib_lo = 0xFF if attrib & 0x01 else 0x00
+        attrib_hi = 0xFF if attrib & 0x02 else 0x00
+        if mask & 0x08:
+            # the shifters hold the two tiles fetched for the next line
+            self._bg_shifter_ptrn_lo = lsb_a << 8 | lsb
+            self._bg_shifter_ptrn_hi = msb_a << 8 | msb
+            self._bg_shifter_attrib_lo = (0xFF00 if attrib_a & 0x01 else 0x0000) | attrib_lo
+            self._bg_shifter_attrib_hi = (0xFF00 if attrib_a & 0x02 else 0x0000) | attrib_hi
+        else:
+            # nothing was shifted, the loads only replaced the low bytes
+            self._bg_shifter_ptrn_lo = (self._bg_shifter_ptrn_lo & 0xFF00) | lsb
+            self._bg_shifter_ptrn_hi = (self._bg_shifter_ptrn_hi & 0xFF00) | msb
+            self._bg_shifter_attrib_lo = (self._bg_shifter_attrib_lo & 0xFF00) | attrib_lo
+            self._bg_shifter_attrib_hi = (self._bg_shifter_attrib_hi & 0xFF00) | attrib_hi
+
+        if mask & 0x10:
+            # sprite shifters start shifting once their x counter is down to 0
+            for i in range(self._sprite_count):
+                shift = 256 - self._sprite_scanline[i].x
+                self._spr_shifter_ptrn_lo[i] <<= shift
+                self._spr_shifter_ptrn_hi[i] <<= shift
+
+        self.sprite_evaluation(257, scanline)
+        self.load_sprite_shifters(scanline)
+
+        self._scanline += 1
+
+    def _mirrored_name_tables(self):
+        # The name tables seen at $2000, $2400, $2800 and $2C00
+        name_table = self.name_table
+        if self.cart.mirror == Mirror.VERTICAL:
+            return [name_table[0], name_table[1], name_table[0], name_table[1]]
+        elif self.cart.mirror == Mirror.HORIZONTAL:
+            return [name_table[0], name_table[0], name_table[1], name_table[1]]
+        return [_EMPTY_NAME_TABLE] * 4
+
+    def load_sprite_shifters(self, scanline):
+        for i in range(self._sprite_count):
+            oam = self._sprite_scanline[i]
+
+            spr_ptrn_addr_lo = self.get_sprite_pattern_addr_lo(oam, scanline)
+            spr_ptrn_addr_hi = spr_ptrn_addr_lo + 8
+            spr_ptrn_bits_lo = self.ppu_read(spr_ptrn_addr_lo)
+            spr_ptrn_bits_hi = self.ppu_read(spr_ptrn_addr_hi)
+
+            if oam.attribute & 0x40:
+                # flip patterns horizontally
+                spr_ptrn_bits_lo = _reverse_byte(spr_ptrn_bits_lo)
+                spr_ptrn_bits_hi = _reverse_byte(spr_ptrn_bits_hi)
+
+            self._spr_shifter_ptrn_lo[i] = spr_ptrn_bits_lo
+            self._spr_shifter_ptrn_hi[i] = spr_ptrn_bits_hi
+
     def get_sprite_pattern_addr_lo(self, oam, scanline):
         if not self._control.sprite_size:
             # 8x8 sprite mode - control register determines the pattern tbl
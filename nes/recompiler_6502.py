@@ -0,0 +1,299 @@
+from typing import Callable, Dict, List, Union
+
+import _opcodes_6502 as opcodes
+from _opcodes_6502 import lookup, IMP, IMM, ZP0, ABS, REL
+
+# Instructions that transfer control and therefore end a basic block
+_CONTROL_FLOW = {
+    opcodes.BPL, opcodes.BMI, opcodes.BVC, opcodes.BVS,
+    opcodes.BCC, opcodes.BCS, opcodes.BNE, opcodes.BEQ,
+    opcodes.JMP, opcodes.JSR, opcodes.RTS, opcodes.RTI, opcodes.BRK,
+    opcodes.XXX,
+}
+
+# Instructions that continue at the program counter they are executed with
+_USES_PC = {
+    opcodes.BPL, opcodes.BMI, opcodes.BVC, opcodes.BVS,
+    opcodes.BCC, opcodes.BCS, opcodes.BNE, opcodes.BEQ,
+    opcodes.JSR, opcodes.BRK, opcodes.XXX,
+}
+
+# Instructions that look at state.opcode while executing
+_USES_OPCODE = {
+    opcodes.ASL, opcodes.LSR, opcodes.ROL, opcodes.ROR, opcodes.ANC,
+    opcodes.NOP, opcodes.XXX,
+}
+
+# Instructions that write to memory
+_WRITES = {
+    opcodes.STA, opcodes.STX, opcodes.STY, opcodes.SAX,
+    opcodes.INC, opcodes.DEC, opcodes.ASL, opcodes.LSR, opcodes.ROL, opcodes.ROR,
+    opcodes.SLO, opcodes.SRE, opcodes.RLA, opcodes.RRA, opcodes.DCP, opcodes.ISB,
+}
+
+_SIZES = {
+    IMP: 1, IMM: 2, ZP0: 2, opcodes.ZPX: 2, opcodes.ZPY: 2, REL: 2,
+    opcodes.IZX: 2, opcodes.IZY: 2,
+    ABS: 3, opcodes.ABX: 3, opcodes.ABY: 3, opcodes.IND: 3,
+}
+
+MAX_BLOCK_LENGTH = 64
+
+# Names available to the generated code
+_NAMESPACE = {}
+for _instruction in lookup:
+    _NAMESPACE[_instruction.operate.__name__] = _instruction.operate
+    _NAMESPACE[_instruction.addr_mode.__name__] = _instruction.addr_mode
+
+
+def _is_io(addr: int):
+    return 0x2000 <= addr <= 0x5FFF
+
+
+def _may_reach(addr_mode, operand, write: bool) -> bool:
+    # Whether an instruction whose address depends on registers or memory
+    # can touch I/O or, writing, mapper registers
+    if addr_mode in (opcodes.ABX, opcodes.ABY):
+        lo = operand[1] << 8 | operand[0]
+        hi = lo + 0xFF
+    elif addr_mode in (opcodes.IZX, opcodes.IZY):
+        lo, hi = 0x0000, 0xFFFF
+    else:
+        return False  # zero page
+    return lo <= 0x5FFF and hi >= 0x2000 or write and hi >= 0x8000
+
+
+class BlockCompiler:
+    """
+    Translates straight-line 6502 code into Python functions.
+
+    A block runs from its entry point up to and including the next
+    instruction that transfers control. Blocks never cross an 8 KiB window
+    and start anew at any instruction with a fixed I/O address. An
+    instruction whose address is only known when it runs returns from the
+    block before it when the address turns out to be I/O or, for writes, a
+    mapper register. Either way the bus and PPU have caught up before
+    registers are touched, and a block ends after any such write, as it
+    might start a DMA transfer or switch banks. A block that might run past
+    the next bus event or vertical blank, or that follows the end of a
+    frame, is not run at all, the instructions are stepped one at a time
+    instead, so that interrupts are taken and frames end when they would be
+    without the compiler. Compiled blocks are cached per PRG bank mapped
+    into their window, blocks in RAM are dropped as soon as the RAM page
+    they were read from is written to (the bus only reports writes to such
+    pages).
+    """
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.cpu = bus.cpu
+        self.ppu = bus.ppu
+        self.mapper = bus.cart.mapper
+
+        self._cache: Dict[object, Dict[int, Callable]] = {}
+        self._windows: List[Union[Dict[int, Callable], None]] = [None] * 8
+        self._windows[0] = self._cache.setdefault('ram', {})
+        self._ram_blocks: Dict[int, List[int]] = {}
+        self.code_pages = bytearray(8)  # RAM pages that compiled code was read from
+
+        self.map_windows(0x8000, 0xFFFF)
+        self.mapper.prg_switch_listeners.append(self.map_windows)
+
+    def map_windows(self, start: int, end: int):
+        for window in range(max(start, 0x8000) >> 13, (end >> 13) + 1):
+            bank = self.mapper.prg_offsets[window - 4] >> 13
+            self._windows[window] = self._cache.setdefault(('prg', bank), {})
+
+    def ram_written(self, addr: int):
+        page = (addr & 0x07FF) >> 8
+        if self.code_pages[page]:
+            blocks = self._windows[0]
+            for pc in self._ram_blocks.pop(page, []):
+                blocks.pop(pc, None)
+            self.code_pages[page] = 0
+            self.bus.map_ram_page(page, watched=False)
+
+    def invalidate(self):
+        self._cache.clear()
+        self._ram_blocks.clear()
+        for page in range(8):
+            if self.code_pages[page]:
+                self.bus.map_ram_page(page, watched=False)
+        self.code_pages[:] = bytes(8)
+        self._windows[0] = self._cache.setdefault('ram', {})
+        self.map_windows(0x8000, 0xFFFF)
+
+    def step(self) -> int:
+        # Execute a compiled block starting at the program counter and return
+        # the number of cycles it took
+        cpu = self.cpu
+        state = cpu.state
+        if state.cycles:
+            return cpu.step()
+
+        pc = state.pc
+        blocks = self._windows[pc >> 13]
+        if blocks is None:
+            return cpu.step()
+
+        block = blocks.get(pc)
+        if block is None:
+            block = self.compile(pc)
+            if block is None:
+                return cpu.step()
+            blocks[pc] = block
+
+        dots = block.max_dots
+        bus = self.bus
+        ppu = self.ppu
+        if (dots >= bus._next_event - bus.system_clock_counter or dots >= ppu._event_dots - ppu._deferred
+                or ppu.frame_complete):
+            return cpu.step()
+
+        cycles = block(cpu)
+        cycles += state.cycles
+        state.cycles = 0
+        state.clock_count += cycles
+        return cycles
+
+    def decode(self, pc: int):
+        # List the (address, opcode, operand bytes) making up the block at pc
+        read = self.bus.cpu_read
+        window = pc >> 13
+        block = []
+        while len(block) < MAX_BLOCK_LENGTH:
+            opcode = read(pc, read_only=True)
+            instruction = lookup[opcode]
+            size = _SIZES[instruction.addr_mode]
+            if (pc + size - 1) >> 13 != window:
+                break
+            operand = [read(pc + i, read_only=True) for i in range(1, size)]
+
+            addr_mode = instruction.addr_mode
+            operate = instruction.operate
+            addr = None
+            if addr_mode == ABS and operate not in (opcodes.JMP, opcodes.JSR):
+                addr = operand[1] << 8 | operand[0]
+            if block and addr is not None and _is_io(addr):
+                break
+
+            block.append((pc, opcode, operand))
+            pc += size
+            if operate in _CONTROL_FLOW:
+                break
+            if operate in _WRITES and addr is not None and (_is_io(addr) or addr >= 0x8000):
+                break  # the write might schedule an event or switch banks
+            if pc >> 13 != window:
+                break
+        return block
+
+    def compile(self, pc: int) -> Union[Callable, None]:
+        block = self.decode(pc)
+        if not block:
+            return None
+
+        source = self.generate(block)
+        namespace = dict(_NAMESPACE)
+        exec(compile(source, f'<block ${pc:04X}>', 'exec'), namespace)
+
+        if pc < 0x2000:
+            end = block[-1][0] + len(block[-1][2])
+            for page in range(pc >> 8, (end >> 8) + 1):
+                page &= 0x07
+                self._ram_blocks.setdefault(page, []).append(pc)
+                if not self.code_pages[page]:
+                    self.code_pages[page] = 1
+                    self.bus.map_ram_page(page, watched=True)
+
+        # Every instruction might cross a page and the branch at the end be
+        # taken
+        function = namespace['block']
+        function.max_dots = 3 * (sum(lookup[opcode].cycles for _, opcode, _ in block) + len(block) + 2)
+        return function
+
+    @staticmethod
+    def generate(block) -> str:
+        lines = ['def block(cpu):', '    state = cpu.state', '    extra = 0']
+        cycles = 0
+        implied = True  # state._implied may hold a value from earlier
+        operate = None
+        next_pc = block[0][0]
+        for index, (pc, opcode, operand) in enumerate(block):
+            instruction = lookup[opcode]
+            addr_mode = instruction.addr_mode
+            operate = instruction.operate
+            op = operate.__name__
+            next_pc = pc + 1 + len(operand)
+            cycles_before = cycles
+            cycles += instruction.cycles
+
+            lines.append(f'    # ${pc:04X} {instruction.name} {addr_mode.__name__}')
+            prologue = []
+            if operate in _USES_OPCODE:
+                prologue.append(f'    state.opcode = 0x{opcode:02X}')
+            if addr_mode == IMP:
+                prologue.append('    state._implied = state.a')
+                implied = True
+            elif implied:
+                prologue.append('    state._implied = None')
+                implied = False
+
+            if addr_mode in (IMP, IMM, ZP0, ABS, REL):
+                lines += prologue
+            if addr_mode == IMP:
+                pass
+            elif addr_mode == IMM:
+                lines.append(f'    state.addr_abs = 0x{pc + 1:04X}')
+            elif addr_mode == ZP0:
+                lines.append(f'    state.addr_abs = 0x{operand[0]:04X}')
+            elif addr_mode == ABS:
+                lines.append(f'    state.addr_abs = 0x{operand[1] << 8 | operand[0]:04X}')
+            elif addr_mode == REL:
+                rel = operand[0] | 0xFF00 if operand[0] & 0x80 else operand[0]
+                lines.append(f'    state.addr_rel = 0x{rel:04X}')
+            else:
+                # addressing modes that depend on registers or memory run as is
+                lines.append(f'    state.pc = 0x{pc + 1:04X}')
+                write = operate in _WRITES
+                if not _may_reach(addr_mode, operand, write):
+                    lines += prologue
+                    lines.append(f'    extra += {addr_mode.__name__}(cpu) & {op}(cpu)')
+                    continue
+
+                if write:
+                    reach = 'state.addr_abs >= 0x2000 and not 0x6000 <= state.addr_abs < 0x8000'
+                else:
+                    reach = '0x2000 <= state.addr_abs < 0x6000'
+                if index:
+                    # leave the instruction to a block of its own, starting
+                    # when the bus has caught up with it
+                    lines.append('    addr_abs = state.addr_abs')
+                    lines.append(f'    crossed = {addr_mode.__name__}(cpu)')
+                    lines.append(f'    if {reach}:')
+                    lines.append(f'        state.pc = 0x{pc:04X}')
+                    lines.append('        state.addr_abs = addr_abs')
+                    lines.append(f'        state.opcode = 0x{block[index - 1][1]:02X}')
+                    lines.append(f'        cpu.instruction_count += {index}')
+                    lines.append(f'        return extra + {cycles_before}')
+                else:
+                    lines.append(f'    crossed = {addr_mode.__name__}(cpu)')
+                lines += prologue
+                lines.append(f'    extra += crossed & {op}(cpu)')
+                if write and not index and len(block) > 1:
+                    # the write might have scheduled an event or switched banks
+                    lines.append(f'    if {reach}:')
+                    lines.append(f'        state.opcode = 0x{opcode:02X}')
+                    lines.append('        cpu.instruction_count += 1')
+                    lines.append(f'        return extra + {cycles}')
+                continue
+
+            if operate in _USES_PC:
+                lines.append(f'    state.pc = 0x{next_pc:04X}')
+            lines.append(f'    {op}(cpu)')
+
+        if operate not in _CONTROL_FLOW:
+            lines.append(f'    state.pc = 0x{next_pc:04X}')
+        lines.append(f'    state.opcode = 0x{block[-1][1]:02X}')
+        lines.append(f'    cpu.instruction_count += {len(block)}')
+        lines.append(f'    return extra + {cycles}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,132 @@
+import struct
+from collections import deque
+from typing import Deque, Tuple
+
+import numpy as np
+
+from bus import Bus
+
+# Offset and length of a run of changed bytes, followed by the XOR of the run
+_RUN = struct.Struct('<IH')
+_MAX_RUN = 0xFFFF
+
+
+def xor_delta(old: bytes, new: bytes) -> bytes:
+    """
+    Encode the difference between two equally long states as runs of XORed
+    bytes. Unchanged stretches longer than a run header split runs and are
+    not stored at all.
+    """
+    diff = np.bitwise_xor(np.frombuffer(old, dtype=np.uint8), np.frombuffer(new, dtype=np.uint8))
+    changed = np.flatnonzero(diff)
+    if not len(changed):
+        return b''
+
+    gaps = np.flatnonzero(np.diff(changed) > _RUN.size)
+    starts = np.concatenate((changed[:1], changed[gaps + 1]))
+    ends = np.concatenate((changed[gaps], changed[-1:])) + 1
+    runs = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        for offset in range(start, end, _MAX_RUN):
+            length = min(end - offset, _MAX_RUN)
+            runs.append(_RUN.pack(offset, length))
+            runs.append(diff[offset:offset + length].tobytes())
+    return b''.join(runs)
+
+
+def apply_delta(state: bytearray, delta: bytes):
+    # XOR a delta made by xor_delta into state, in either direction
+    target = np.frombuffer(state, dtype=np.uint8)
+    position = 0
+    while position < len(delta):
+        offset, length = _RUN.unpack_from(delta, position)
+        position += _RUN.size
+        target[offset:offset + length] ^= np.frombuffer(delta, dtype=np.uint8, count=length, offset=position)
+        position += length
+
+
+class RewindBuffer:
+    """
+    The save states of the last frames, for stepping back in time.
+
+    Every keyframe_interval frames a full state is kept, the frames in
+    between only store their XOR delta to the frame before. Restoring a frame
+    therefore applies at most keyframe_interval - 1 deltas. When the buffer
+    holds more than capacity frames or more than max_bytes of states and
+    deltas, the oldest keyframe is dropped with the deltas that depend on it.
+    The frames since the latest keyframe are always kept, so a max_bytes
+    smaller than one keyframe and its deltas is exceeded by that much.
+    """
+
+    def __init__(self, nes: Bus, capacity=3600, keyframe_interval=60, max_bytes=8 << 20):
+        if keyframe_interval < 1:
+            raise ValueError('keyframe_interval must be at least 1')
+        if capacity < keyframe_interval:
+            raise ValueError(f'capacity ({capacity}) must hold a keyframe interval ({keyframe_interval})')
+        self.nes = nes
+        self.capacity = capacity
+        self.keyframe_interval = keyframe_interval
+        self.max_bytes = max_bytes
+        # (keyframe, state or delta) for every recorded frame, oldest first
+        self._frames: Deque[Tuple[bool, bytes]] = deque()
+        self._keyframes = 0
+        self._nbytes = 0
+        self._last: bytes = None
+        self._since_keyframe = 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def record(self):
+        # Store the current state of the machine, call once per frame
+        state = self.nes.save_state()
+        last = self._last
+        frames = self._frames
+        if (last is None or not frames or not frames[0][0] or len(last) != len(state)
+                or self._since_keyframe + 1 >= self.keyframe_interval):
+            frame = (True, state)
+            self._keyframes += 1
+            self._since_keyframe = 0
+        else:
+            frame = (False, xor_delta(last, state))
+            self._since_keyframe += 1
+        frames.append(frame)
+        self._nbytes += len(frame[1])
+        self._last = state
+
+        while self._keyframes > 1 and (len(frames) > self.capacity or self._nbytes > self.max_bytes):
+            self._nbytes -= len(frames.popleft()[1])
+            self._keyframes -= 1
+            while not frames[0][0]:
+                self._nbytes -= len(frames.popleft()[1])
+
+    def rewind(self, frames=1) -> int:
+        """
+        Restore the state recorded the given number of frames before the
+        latest one and forget everything after it. Returns how many frames
+        were actually rewound, which is less when the buffer is shorter.
+        """
+        if not self._frames:
+            return 0
+        frames = max(0, min(frames, len(self._frames) - 1))
+        index = len(self._frames) - 1 - frames
+
+        keyframe = index
+        while not self._frames[keyframe][0]:
+            keyframe -= 1
+        state = bytearray(self._frames[keyframe][1])
+        for i in range(keyframe + 1, index + 1):
+            apply_delta(state, self._frames[i][1])
+
+        for _ in range(frames):
+            is_keyframe, data = self._frames.pop()
+            self._keyframes -= is_keyframe
+            self._nbytes -= len(data)
+        self._last = bytes(state)
+        self._since_keyframe = index - keyframe
+        self.nes.load_state(self._last)
+        return frames
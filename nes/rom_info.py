@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import struct
+import zlib
+from dataclasses import dataclass, asdict
+from typing import Union
+
+HEADER_SIZE = 16
+TRAINER_SIZE = 512
+
+_HEADER = struct.Struct('<4s7B5s')
+
+
+class NesHeader:
+    def __init__(self):
+        self.name = None
+        self.prg_rom_chunks = None
+        self.chr_rom_chunks = None
+        self.mapper1 = None
+        self.mapper2 = None
+        self.prg_ram_size = None
+        self.tv_system1 = None
+        self.tv_system2 = None
+        self.unused = None
+
+    @classmethod
+    def create_header(cls, f):
+        return cls.parse(f.read(HEADER_SIZE))
+
+    @classmethod
+    def parse(cls, data):
+        header = NesHeader()
+        (header.name, header.prg_rom_chunks, header.chr_rom_chunks, header.mapper1, header.mapper2,
+         header.prg_ram_size, header.tv_system1, header.tv_system2, header.unused) = _HEADER.unpack_from(data)
+        return header
+
+    def cart_format(self):
+        cartridge_type = 'Unknown'
+        if self.name == b'NES\x1A':
+            cartridge_type = 'iNES'
+
+        if cartridge_type == 'iNES' and (self.mapper2 & 0x0C) == 0x08:
+            cartridge_type = 'NES20'
+        return cartridge_type
+
+    # In NES 2.0 headers bytes 8-12 have other meanings: the top bits of the
+    # mapper and ROM sizes, the submapper, RAM sizes and the timing.
+    # Source https://www.nesdev.org/wiki/NES_2.0
+
+    @property
+    def mapper_id(self) -> int:
+        mapper_id = (self.mapper2 & 0xF0) | (self.mapper1 >> 4)
+        if self.cart_format() == 'NES20':
+            mapper_id |= (self.prg_ram_size & 0x0F) << 8
+        return mapper_id
+
+    @property
+    def submapper(self) -> int:
+        return self.prg_ram_size >> 4 if self.cart_format() == 'NES20' else 0
+
+    @property
+    def battery(self) -> bool:
+        return bool(self.mapper1 & 0x02)
+
+    @property
+    def trainer(self) -> bool:
+        return bool(self.mapper1 & 0x04)
+
+    @property
+    def prg_rom_size(self) -> int:
+        return self._rom_size(self.prg_rom_chunks, self.tv_system1 & 0x0F, 0x4000)
+
+    @property
+    def chr_rom_size(self) -> int:
+        return self._rom_size(self.chr_rom_chunks, self.tv_system1 >> 4, 0x2000)
+
+    def _rom_size(self, lsb: int, msb: int, unit: int) -> int:
+        if self.cart_format() != 'NES20':
+            return lsb * unit
+        if msb == 0x0F:  # 2^E * (M * 2 + 1) bytes
+            return (1 << (lsb >> 2)) * ((lsb & 0x03) * 2 + 1)
+        return ((msb << 8) | lsb) * unit
+
+    @property
+    def prg_ram_bytes(self) -> int:
+        if self.cart_format() != 'NES20':
+            return max(self.prg_ram_size, 1) * 0x2000
+        return self._ram_size(self.tv_system2 & 0x0F)
+
+    @property
+    def prg_nvram_bytes(self) -> int:
+        if self.cart_format() != 'NES20':
+            return self.prg_ram_bytes if self.battery else 0
+        return self._ram_size(self.tv_system2 >> 4)
+
+    @property
+    def chr_ram_bytes(self) -> int:
+        if self.cart_format() != 'NES20':
+            return 0 if self.chr_rom_chunks else 0x2000
+        return self._ram_size(self.unused[0] & 0x0F)
+
+    @property
+    def timing(self) -> int:
+        # 0: NTSC, 1: PAL, 2: multiple regions, 3: Dendy
+        if self.cart_format() != 'NES20':
+            return self.tv_system1 & 0x01
+        return self.unused[1] & 0x03
+
+    @staticmethod
+    def _ram_size(shift: int) -> int:
+        return 64 << shift if shift else 0
+
+
+@dataclass
+class RomInfo:
+    # What a cartridge needs to know about a ROM file before it maps it
+    format: str
+    mapper_id: int
+    submapper: int
+    mirror: int
+    battery: bool
+    trainer: bool
+    prg_rom_size: int
+    chr_rom_size: int
+    prg_ram_size: int
+    prg_nvram_size: int
+    chr_ram_size: int
+    timing: int
+    crc32: Union[str, None] = None
+    sha1: Union[str, None] = None
+
+    @classmethod
+    def from_header(cls, header: NesHeader, crc32: Union[str, None] = None, sha1: Union[str, None] = None):
+        return cls(format=header.cart_format(), mapper_id=header.mapper_id, submapper=header.submapper,
+                   mirror=header.mapper1 & 0x01, battery=header.battery, trainer=header.trainer,
+                   prg_rom_size=header.prg_rom_size, chr_rom_size=header.chr_rom_size,
+                   prg_ram_size=header.prg_ram_bytes, prg_nvram_size=header.prg_nvram_bytes,
+                   chr_ram_size=header.chr_ram_bytes, timing=header.timing, crc32=crc32, sha1=sha1)
+
+    @property
+    def prg_offset(self) -> int:
+        return HEADER_SIZE + (TRAINER_SIZE if self.trainer else 0)
+
+    @property
+    def chr_offset(self) -> int:
+        return self.prg_offset + self.prg_rom_size
+
+
+def rom_hashes(rom) -> (str, str):
+    # CRC32 and SHA1 of the ROM without its header, the way ROM databases
+    # identify them
+    data = memoryview(rom)[HEADER_SIZE:]
+    return f'{zlib.crc32(data):08x}', hashlib.sha1(data).hexdigest()
+
+
+class RomCache:
+    """
+    ROM metadata on disk, shared by every process that points at the same
+    directory.
+
+    Entries are keyed by the ROM's CRC32 and SHA1 and its header, as the same
+    ROM data turns up with different headers. A second index keyed by the
+    file's path, size and modification time finds the entry of a file seen
+    before without hashing it again. Every entry is a file of its own that is
+    replaced in one go, so concurrent processes never see half an entry; at
+    worst they both compute the same one.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, 'roms'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'files'), exist_ok=True)
+
+    def info(self, filename: str, rom) -> RomInfo:
+        stat = os.stat(filename)
+        file_key = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()
+        seen = self._read('files', file_key)
+        if seen is not None and seen.get('size') == stat.st_size and seen.get('mtime_ns') == stat.st_mtime_ns:
+            info = self._read_info(seen.get('rom', ''))
+            if info is not None:
+                return info
+
+        crc32, sha1 = rom_hashes(rom)
+        rom_key = f'{crc32}-{sha1}-{bytes(rom[:HEADER_SIZE]).hex()}'
+        info = self._read_info(rom_key)
+        if info is None:
+            info = RomInfo.from_header(NesHeader.parse(rom), crc32, sha1)
+            self._write('roms', rom_key, asdict(info))
+        self._write('files', file_key, {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'rom': rom_key})
+        return info
+
+    def _read_info(self, rom_key: str) -> Union[RomInfo, None]:
+        cached = self._read('roms', rom_key)
+        try:
+            return None if cached is None else RomInfo(**cached)
+        except TypeError:  # written by a version with other fields
+            return None
+
+    def _read(self, kind: str, key: str) -> Union[dict, None]:
+        try:
+            with open(os.path.join(self.directory, kind, f'{key}.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, kind: str, key: str, entry: dict):
+        path = os.path.join(self.directory, kind, f'{key}.json')
+        temp = f'{path}.{os.getpid()}'
+        with open(temp, 'w') as f:
+            json.dump(entry, f)
+        os.replace(temp, path)
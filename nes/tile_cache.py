@@ -0,0 +1,60 @@
+from typing import Dict, List, Union
+
+import numpy as np
+
+BANK_SIZE = 0x0400  # 1 KiB, 64 tiles
+
+
+def decode_tiles(data) -> np.ndarray:
+    # 16 bytes per tile, 8 rows of the low bit plane followed by 8 rows of
+    # the high bit plane, become 8x8 pixels with a value of 0-3
+    planes = np.frombuffer(data, dtype=np.uint8).reshape(-1, 2, 8, 1)
+    bits = np.unpackbits(planes, axis=3)
+    return bits[:, 0] | (bits[:, 1] << 1)
+
+
+class TileCache:
+    """
+    Decoded tiles of a cartridge's CHR memory.
+
+    Tiles are decoded 1 KiB of CHR memory (a CHR bank) at a time and kept
+    until that memory is written to. The two pattern tables are assembled
+    from the banks the mapper has in them and are rebuilt when the mapper
+    switches CHR banks.
+    """
+
+    def __init__(self, chr_memory, mapper):
+        self.chr_memory = chr_memory
+        self.mapper = mapper
+        self._banks: Dict[int, np.ndarray] = {}
+        self._tables: List[Union[np.ndarray, None]] = [None, None]
+        mapper.chr_switch_listeners.append(self.chr_switched)
+
+    def bank(self, offset: int) -> np.ndarray:
+        # The 64 tiles of the CHR bank starting at offset
+        tiles = self._banks.get(offset)
+        if tiles is None:
+            tiles = decode_tiles(self.chr_memory[offset:offset + BANK_SIZE])
+            self._banks[offset] = tiles
+        return tiles
+
+    def table(self, i: int) -> np.ndarray:
+        # The 256 tiles of pattern table i as currently mapped
+        tiles = self._tables[i]
+        if tiles is None:
+            offsets = self.mapper.chr_offsets[i * 4:i * 4 + 4]
+            tiles = self._tables[i] = np.concatenate([self.bank(offset) for offset in offsets])
+        return tiles
+
+    def chr_written(self, offset: int):
+        bank = offset & ~(BANK_SIZE - 1)
+        if bank in self._banks:
+            del self._banks[bank]
+            self._tables = [None, None]
+
+    def chr_switched(self):
+        self._tables = [None, None]
+
+    def invalidate(self):
+        self._banks.clear()
+        self._tables = [None, None]
@@ -0,0 +1,129 @@
+import multiprocessing
+import traceback
+from multiprocessing import shared_memory
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from env import NesEnv, observation_shape
+
+
+def _worker(conn, shm_name: str, shape: Tuple[int, ...], index: int, rom: str, env_kwargs: Dict):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    out = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)[index]
+    try:
+        try:
+            env = NesEnv(rom, **env_kwargs)
+        except Exception:
+            conn.send((False, traceback.format_exc()))
+            return
+        conn.send((True, None))
+        while True:
+            command, data = conn.recv()
+            try:
+                if command == 'step':
+                    _, reward, done, info = env.step(data, out=out)
+                    if done:
+                        env.reset(out=out)
+                    conn.send((True, (reward, done, info)))
+                elif command == 'reset':
+                    env.reset(out=out)
+                    conn.send((True, None))
+                elif command == 'close':
+                    conn.send((True, None))
+                    break
+            except Exception:
+                conn.send((False, traceback.format_exc()))
+    finally:
+        del out
+        shm.close()
+
+
+class VectorNesEnv:
+    """
+    Environments stepped together, each in its own worker process.
+
+    The workers write their observations into one shared memory block, so a
+    step only sends the actions out and gets rewards, done flags and infos
+    back. observations is a view of that block with one row per environment,
+    overwritten by every reset() and step(). An environment that is done is
+    reset right away and its row holds the first observation of the next
+    episode.
+    """
+
+    def __init__(self, roms: Sequence[str], downscale=2, **env_kwargs):
+        # env_kwargs are passed on to every NesEnv
+        self.num_envs = len(roms)
+        env_kwargs['downscale'] = downscale
+        shape = (self.num_envs,) + observation_shape(downscale)
+        self._shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+        self.observations = np.ndarray(shape, dtype=np.uint8, buffer=self._shm.buf)
+        self.observations[:] = 0
+
+        self._conns = []
+        self._processes = []
+        for index, rom in enumerate(roms):
+            conn, worker_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_worker, args=(worker_conn, self._shm.name, shape, index, rom, env_kwargs), daemon=True)
+            process.start()
+            worker_conn.close()
+            self._conns.append(conn)
+            self._processes.append(process)
+        self.closed = False
+
+        # Every worker reports whether it could create its environment
+        try:
+            self._receive()
+        except RuntimeError:
+            self.close()
+            raise
+
+    def _call(self, command: str, data: Sequence) -> List:
+        for conn, item in zip(self._conns, data):
+            conn.send((command, item))
+        return self._receive()
+
+    def _receive(self) -> List:
+        results = []
+        for index, conn in enumerate(self._conns):
+            ok, result = conn.recv()
+            if not ok:
+                raise RuntimeError(f'Environment {index} failed:\n{result}')
+            results.append(result)
+        return results
+
+    def reset(self) -> np.ndarray:
+        self._call('reset', [None] * self.num_envs)
+        return self.observations
+
+    def step(self, actions: Sequence[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[Dict]]:
+        if len(actions) != self.num_envs:
+            raise ValueError(f'Expected {self.num_envs} actions, got {len(actions)}')
+        rewards, dones, infos = zip(*self._call('step', [int(action) for action in actions]))
+        return self.observations, np.array(rewards), np.array(dones), list(infos)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for conn, process in zip(self._conns, self._processes):
+            if process.is_alive():
+                try:
+                    conn.send(('close', None))
+                    conn.recv()
+                except (EOFError, OSError):
+                    pass
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+        del self.observations
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
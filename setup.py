@@ -17,6 +17,7 @@ setup(
     entry_points={
         "console_scripts": [
             "nes = nes:main",
+            "nes-batch = nes:batch_main",
         ],
     },
     test_suite="tests",
@@ -0,0 +1,16 @@
+def create_rom(path, mapper_id, prg_banks, chr_banks=0, prg_fill=0x4000, chr_fill=0x2000,
+               program=b'', origin=0xC000, vectors=None):
+    # An iNES file with prg_banks 16 KiB PRG banks and chr_banks 8 KiB CHR
+    # banks. Every prg_fill bytes of PRG and chr_fill bytes of CHR are filled
+    # with their own bank number. The program goes at origin in the last
+    # 16 KiB, the NMI, reset and IRQ vectors at its end.
+    header = bytes([0x4E, 0x45, 0x53, 0x1A, prg_banks, chr_banks,
+                    (mapper_id & 0x0F) << 4, mapper_id & 0xF0]) + bytes(8)
+    prg = bytearray(b''.join(bytes([bank]) * prg_fill for bank in range(prg_banks * 0x4000 // prg_fill)))
+    start = len(prg) - 0x10000 + origin
+    prg[start:start + len(program)] = program
+    if vectors is not None:
+        prg[-6:] = b''.join(vector.to_bytes(2, 'little') for vector in vectors)
+    chr_ = b''.join(bytes([bank]) * chr_fill for bank in range(chr_banks * 0x2000 // chr_fill))
+    path.write_bytes(header + prg + chr_)
+    return str(path)
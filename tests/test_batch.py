@@ -0,0 +1,40 @@
+import json
+
+from batch import find_roms, main, run_rom
+
+
+def test_find_roms(tmp_path):
+    (tmp_path / 'b').mkdir()
+    for name in ('b/2.nes', 'b/1.NES', 'a.nes', 'notes.txt'):
+        (tmp_path / name).write_bytes(b'')
+
+    roms = find_roms([str(tmp_path), 'nestest.nes'])
+    assert roms == [str(tmp_path / 'a.nes'), str(tmp_path / 'b' / '1.NES'), str(tmp_path / 'b' / '2.nes'),
+                    'nestest.nes']
+
+
+def test_run_rom():
+    result = run_rom('nestest.nes', frames=1, status=(0x0002, 0x6000))
+    assert result['rom'] == 'nestest.nes'
+    assert result['frames'] == 1
+    assert len(result['frame_hash']) == 40
+    assert result['status'] == {'$0002': 0, '$6000': 0}
+
+    assert 'error' in run_rom('missing.nes', frames=1)
+
+
+def test_run_rom_with_rom_cache(tmp_path):
+    result = run_rom('nestest.nes', frames=1, rom_cache=str(tmp_path))
+    assert len(result['crc32']) == 8
+    assert len(result['sha1']) == 40
+    assert run_rom('nestest.nes', frames=1, rom_cache=str(tmp_path))['sha1'] == result['sha1']
+
+
+def test_main_prints_json_lines(capsys):
+    assert main(['nestest.nes', 'nestest.nes', '--frames', '1', '--workers', '2', '--status', '0x02']) == 0
+
+    lines = capsys.readouterr().out.splitlines()
+    results = [json.loads(line) for line in lines]
+    assert [result['rom'] for result in results] == ['nestest.nes', 'nestest.nes']
+    assert results[0]['frame_hash'] == results[1]['frame_hash']
+    assert results[0]['status'] == {'$0002': 0}
@@ -0,0 +1,49 @@
+import glob
+import os
+
+import pytest
+
+from blargg import run_blargg
+from headless import create_nes
+
+ROOT = os.path.join('test_roms', 'instructions')
+ROMS = sorted(glob.glob(os.path.join(ROOT, '**', '*.nes'), recursive=True))
+
+# Known problems by path from ROOT, the ROMs that never finish are not run at
+# all
+FAILING = {'11-special.nes', 'v3/14-brk.nes', 'v3/15-special.nes'}
+HANGING = {'02-immediate.nes', '06-abs_xy.nes', 'v3/06-abs_xy.nes'}
+UNSUPPORTED_MAPPER = {'v3/all_instrs.nes', 'v3/official_only.nes'}
+
+
+def rom_param(rom):
+    name = os.path.relpath(rom, ROOT).replace(os.sep, '/')
+    marks = []
+    if name in UNSUPPORTED_MAPPER:
+        marks.append(pytest.mark.skip(reason='mapper 1 is not implemented'))
+    elif name in HANGING:
+        marks.append(pytest.mark.xfail(run=False, reason='never reports a result'))
+    elif name in FAILING:
+        marks.append(pytest.mark.xfail(reason='known failure'))
+    return pytest.param(rom, marks=marks, id=os.path.relpath(rom, 'test_roms'))
+
+
+@pytest.mark.parametrize('rom', [rom_param(rom) for rom in ROMS])
+def test_blargg(rom):
+    result = run_blargg(rom, max_frames=600, recompile=True)
+    assert not result.timed_out, 'no result after 600 frames'
+    assert result.passed, result.message
+    assert result.message.endswith('Passed')
+
+
+def test_recompiled_machine_matches_stepped():
+    # The ROMs above run through the block recompiler, which has to leave the
+    # machine, OAM and PPU included, as stepping the CPU does
+    rom = os.path.join(ROOT, '01-implied.nes')
+    stepped = create_nes(rom, recompile=False, timing_only=True)
+    compiled = create_nes(rom, recompile=True, timing_only=True)
+    for _ in range(70):
+        stepped.run_frame()
+        compiled.run_frame()
+        assert compiled.save_state() == stepped.save_state()
+    assert run_blargg(rom, recompile=True) == run_blargg(rom, recompile=False)
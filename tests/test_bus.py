@@ -0,0 +1,238 @@
+import hashlib
+
+import pytest
+
+from bus import Bus
+from cartridge import Cartridge
+from roms import create_rom
+
+
+def create_nes():
+    nes = Bus()
+    nes.insert_cartridge(Cartridge('nestest.nes'))
+    nes.cpu_write(0xFFFC, 0x00)
+    nes.reset()
+    return nes
+
+
+def clock(nes):
+    while nes.cpu.complete():
+        nes.clock()
+    while not nes.cpu.complete():
+        nes.clock()
+
+
+def test_step_matches_clock():
+    ticked = create_nes()
+    stepped = create_nes()
+
+    clock(ticked)
+    assert stepped.step() == ticked.cpu.state.clock_count
+
+    for _ in range(5000):
+        clock_count = ticked.cpu.state.clock_count
+        clock(ticked)
+        cycles = stepped.step()
+
+        assert cycles == ticked.cpu.state.clock_count - clock_count
+        assert stepped.cpu.state == ticked.cpu.state
+        assert stepped.system_clock_counter == 3 * stepped.cpu.state.clock_count
+
+
+def test_run_frame():
+    nes = create_nes()
+    nes.run_frame()
+    assert nes.ppu.frame_count == 1
+    assert not nes.ppu.frame_complete
+    assert nes.ppu.scanline == -1
+
+
+def clock_frames(nes, frames):
+    for _ in range(frames):
+        while not nes.ppu.frame_complete:
+            nes.clock()
+        nes.ppu.frame_complete = False
+    nes.ppu.sync()
+
+
+def test_clock_frames():
+    # scanline.nes draws where the PPU is when its writes land, so a frame
+    # shows any change to when the CPU, PPU and events run relative to each
+    # other
+    nes = Bus()
+    nes.insert_cartridge(Cartridge('test_roms/scanline.nes'))
+    nes.reset()
+    clock_frames(nes, 8)
+    screen = hashlib.sha1(nes.ppu.get_screen().tobytes()).hexdigest()
+    assert screen == '6f06d23d7bda514975951d2cf3e5d3920612aec6'
+
+
+def test_step_sees_the_ppu_as_clock_does():
+    # scanline.nes waits on $2002, so an instruction that sees the PPU a dot
+    # off ends up with different registers
+    ticked = Bus()
+    ticked.insert_cartridge(Cartridge('test_roms/scanline.nes'))
+    ticked.reset()
+    stepped = Bus()
+    stepped.insert_cartridge(Cartridge('test_roms/scanline.nes'))
+    stepped.reset()
+
+    for _ in range(10000):
+        stepped.step()
+        while ticked.system_clock_counter < stepped.system_clock_counter:
+            ticked.clock()
+        a, b = ticked.cpu.state, stepped.cpu.state
+        assert (a.a, a.x, a.y, a.stkp, a.pc, a.status) == (b.a, b.x, b.y, b.stkp, b.pc, b.status)
+
+
+def test_ppu_position_follows_the_clock():
+    # The PPU puts off its dots until something looks at it
+    nes = Bus()
+    nes.insert_cartridge(Cartridge('test_roms/scanline.nes'))
+    nes.reset()
+    for _ in range(20000):
+        nes.step()
+        scanline, cycle = nes.ppu.scanline, nes.ppu.cycle
+        assert nes.ppu.frame_count * 262 * 341 + scanline * 341 + cycle == nes.system_clock_counter
+
+
+def test_run_frame_matches_clock():
+    ticked = Bus()
+    ticked.insert_cartridge(Cartridge('test_roms/scanline.nes'))
+    ticked.reset()
+    framed = Bus()
+    framed.insert_cartridge(Cartridge('test_roms/scanline.nes'))
+    framed.reset()
+
+    clock_frames(ticked, 8)
+    for _ in range(8):
+        framed.run_frame()
+    framed.ppu.sync()
+    assert (framed.ppu.get_screen() == ticked.ppu.get_screen()).all()
+
+
+def test_rom_pages_follow_bank_switch(tmp_path):
+    nes = Bus()
+    nes.insert_cartridge(Cartridge(create_rom(tmp_path / 'uxrom.nes', 2, 4)))
+
+    assert nes.cpu_read(0x8000) == 0
+    assert nes.cpu_read(0xBFFF) == 0
+    assert nes.cpu_read(0xC000) == 3
+    assert nes.cpu_read_2(0xBFFF) == (0, 3)
+
+    nes.cpu_write(0x8000, 2)
+    assert nes.cpu_read(0x8000) == 2
+    assert nes.cpu_read(0xBFFF) == 2
+    assert nes.cpu_read(0xFFFF) == 3
+
+
+def test_ram_pages():
+    nes = Bus()
+    nes.insert_cartridge(Cartridge('nestest.nes'))
+    nes.cpu_write(0x1FFF, 0x42)
+    assert nes.cpu_read(0x07FF) == 0x42
+    assert nes.cpu_read_2(0x07FF) == (0x42, nes.cpu_read(0x0800))
+
+
+def test_save_state_round_trip():
+    nes = Bus(scanline_renderer=True)
+    nes.insert_cartridge(Cartridge('nestest.nes'))
+    nes.reset()
+    nes.run_frame()
+    for _ in range(1000):
+        nes.step()
+
+    state = nes.save_state()
+    nes.run_frame()
+    nes.run_frame()
+
+    restored = Bus(scanline_renderer=True)
+    restored.insert_cartridge(Cartridge('nestest.nes'))
+    restored.load_state(state)
+    assert restored.save_state() == state
+    restored.run_frame()
+    restored.run_frame()
+
+    assert restored.cpu.state == nes.cpu.state
+    assert restored.cpu_ram == nes.cpu_ram
+    assert restored.system_clock_counter == nes.system_clock_counter
+    assert (restored.ppu.frame_buffer == nes.ppu.frame_buffer).all()
+    assert restored.save_state() == nes.save_state()
+
+
+def test_load_state_checks_version():
+    nes = create_nes()
+    state = bytearray(nes.save_state())
+    state[4] += 1
+    with pytest.raises(ValueError):
+        nes.load_state(bytes(state))
+
+
+def test_prg_ram():
+    nes = create_nes()
+    nes.cpu_write(0x6000, 0x80)
+    nes.cpu_write(0x7FFF, 0x42)
+    assert nes.cpu_read(0x6000) == 0x80
+    assert nes.cart.prg_ram[0x1FFF] == 0x42
+    state = nes.save_state()
+
+    nes.cpu_write(0x6000, 0x00)
+    nes.load_state(state)
+    assert nes.cpu_read(0x6000) == 0x80
+
+
+def test_load_state_restores_banks(tmp_path):
+    rom = create_rom(tmp_path / 'uxrom.nes', 2, 4)
+    nes = Bus()
+    nes.insert_cartridge(Cartridge(rom))
+    nes.cpu_write(0x8000, 2)
+    state = nes.save_state()
+
+    restored = Bus()
+    restored.insert_cartridge(Cartridge(rom))
+    restored.load_state(state)
+    assert restored.cpu_read(0x8000) == 2
+
+
+def test_events_run_in_time_order():
+    nes = create_nes()
+    ran = []
+    nes.schedule(30, lambda: ran.append('late'))
+    nes.schedule(12, lambda: ran.append('early'))
+    nes.schedule(12, lambda: ran.append('early, scheduled later'))
+    nes.cancel(nes.schedule(20, lambda: ran.append('cancelled')))
+
+    while nes.system_clock_counter < 12:
+        nes.step()
+    assert ran == ['early', 'early, scheduled later']
+    while nes.system_clock_counter < 30:
+        nes.step()
+    assert ran == ['early', 'early, scheduled later', 'late']
+
+
+def test_oam_dma():
+    nes = create_nes()
+    for i in range(256):
+        nes.cpu_write(0x0200 + i, i ^ 0x5A)
+    nes.step()
+
+    # the transfer runs after the next instruction, which it holds up
+    nes.cpu_write(0x4014, 0x02)
+    nes.step()
+    assert bytes(nes.ppu._oam) == bytes(i ^ 0x5A for i in range(256))
+    assert nes.system_clock_counter == 3 * (nes.cpu.state.clock_count + 513)
+
+
+def test_oam_dma_from_rom():
+    nes = create_nes()
+    nes.cpu_write(0x4014, 0xC0)
+    nes.step()
+    assert bytes(nes.ppu._oam) == bytes(nes.cpu_read(0xC000 + i) for i in range(256))
+
+
+def test_chr_ram_bank_tables(tmp_path):
+    nes = Bus()
+    nes.insert_cartridge(Cartridge(create_rom(tmp_path / 'uxrom.nes', 2, 4)))
+    nes.ppu.ppu_write(0x1401, 0x42)
+    assert nes.cart.chr_memory[0x1401] == 0x42
+    assert nes.ppu.ppu_read(0x1401) == 0x42
@@ -1,5 +1,13 @@
+import shutil
+import zlib
+
+import pytest
+
+import rom_info
 from cartridge import Cartridge
+from headless import create_nes
 from mappers import Mapper000
+from rom_info import NesHeader, RomCache
 
 
 def test_load():
@@ -13,19 +21,133 @@ def test_load():
 
 def test_mapper_000():
     mapper1 = Mapper000(1, 1)
-    mapper2 = Mapper000(2, 2)
-
-    assert mapper1.cpu_map_read(0x0000) is None
-    assert mapper1.cpu_map_read(0x80FF) == 0xFF
-    assert mapper1.cpu_map_read(0xA0FF) == 0x20FF
-    assert mapper1.cpu_map_read(0xC0FF) == 0xFF
-
-    assert mapper2.cpu_map_read(0x0000) is None
-    assert mapper2.cpu_map_read(0x80FF) == 0xFF
-    assert mapper1.cpu_map_read(0xA0FF) == 0x20FF
-    assert mapper2.cpu_map_read(0xC0FF) == 0x40FF
-
-    assert mapper1.ppu_map_read(0x2000) is None
-    assert mapper2.ppu_map_read(0x2000) is None
-    assert mapper1.ppu_map_read(0x00FF) == 0x00FF
-    assert mapper2.ppu_map_read(0x00FF) == 0x00FF
+    mapper2 = Mapper000(2, 1)
+
+    assert mapper1.prg_offsets == [0x0000, 0x2000, 0x0000, 0x2000]
+    assert mapper2.prg_offsets == [0x0000, 0x2000, 0x4000, 0x6000]
+    assert mapper1.chr_offsets == [bank * 0x0400 for bank in range(8)]
+
+
+def test_bank_tables():
+    cart = Cartridge('nestest.nes')
+    assert cart.cpu_read(0x80FF) == cart.prg_memory[0x00FF]
+    assert cart.cpu_read(0xC0FF) == cart.prg_memory[0x00FF]
+    assert cart.cpu_read(0xFFFF) == cart.prg_memory[0x3FFF]
+    assert cart.cpu_read(0x4020) is None
+    assert cart.ppu_read(0x1ABC) == cart.chr_memory[0x1ABC]
+    assert cart.ppu_read(0x2000) is None
+
+    # CHR ROM can't be written to
+    assert cart.ppu_write(0x0000, cart.chr_memory[0] ^ 0xFF)
+    assert cart.ppu_read(0x0000) == cart.chr_memory[0]
+
+
+def test_nes20_header():
+    header = NesHeader.parse(bytes([0x4E, 0x45, 0x53, 0x1A, 0x02, 0x01, 0x43, 0x18,
+                                    0x31, 0x10, 0x97, 0x07, 0x01, 0, 0, 0]))
+    assert header.cart_format() == 'NES20'
+    assert header.mapper_id == 0x114
+    assert header.submapper == 3
+    assert header.battery and not header.trainer
+    assert header.prg_rom_size == 2 * 0x4000
+    assert header.chr_rom_size == 0x101 * 0x2000
+    assert header.prg_ram_bytes == 64 << 7
+    assert header.prg_nvram_bytes == 64 << 9
+    assert header.chr_ram_bytes == 64 << 7
+    assert header.timing == 1
+
+
+def test_rom_is_mapped_privately(tmp_path):
+    rom = tmp_path / 'nestest.nes'
+    shutil.copy('nestest.nes', rom)
+    data = rom.read_bytes()
+
+    cart = Cartridge(str(rom))
+    assert isinstance(cart.prg_memory, memoryview)
+    assert cart.prg_memory == data[16:16 + 16384]
+    assert cart.chr_memory == data[16 + 16384:]
+
+    cart.cpu_write(0xFFFC, data[16 + 0x3FFC] ^ 0xFF)
+    assert cart.cpu_read(0xFFFC) == data[16 + 0x3FFC] ^ 0xFF
+    assert rom.read_bytes() == data
+
+
+def test_rom_cache(tmp_path, monkeypatch):
+    rom = tmp_path / 'nestest.nes'
+    shutil.copy('nestest.nes', rom)
+    cache = RomCache(str(tmp_path / 'cache'))
+
+    info = Cartridge(str(rom), cache).info
+    assert info.crc32 == f'{zlib.crc32(rom.read_bytes()[16:]):08x}'
+    assert (info.mapper_id, info.prg_rom_size, info.chr_rom_size) == (0, 16384, 8192)
+
+    # The file is known by now, it isn't hashed again
+    with monkeypatch.context() as patch:
+        patch.setattr(rom_info, 'rom_hashes', lambda rom: pytest.fail('hashed again'))
+        assert Cartridge(str(rom), cache).info == info
+
+    # A copy of the ROM is hashed and finds the same entry
+    copy = tmp_path / 'copy.nes'
+    shutil.copy(rom, copy)
+    assert Cartridge(str(copy), cache).info == info
+
+    # The same ROM data with another header is another entry
+    data = bytearray(rom.read_bytes())
+    data[6] ^= 0x01
+    copy.write_bytes(data)
+    flipped = Cartridge(str(copy), cache)
+    assert flipped.info.sha1 == info.sha1
+    assert flipped.mirror == Cartridge(str(copy)).mirror != Cartridge(str(rom)).mirror
+
+    rom.write_bytes(rom.read_bytes()[:-1] + b'\xFF')
+    assert Cartridge(str(rom), cache).info.sha1 != info.sha1
+
+
+def test_battery_save(tmp_path):
+    rom = tmp_path / 'battery.nes'
+    data = bytearray(open('nestest.nes', 'rb').read())
+    data[6] |= 0x02
+    rom.write_bytes(data)
+
+    cart = Cartridge(str(rom))
+    assert cart.save_file == str(tmp_path / 'battery.sav')
+    cart.cpu_write(0x6000, 0x42)
+    cart.cpu_write(0x7FFF, 0x24)
+    state = cart.save_state()
+
+    # Another process, or the next run, finds the RAM in the file
+    restored = Cartridge(str(rom))
+    assert (restored.cpu_read(0x6000), restored.cpu_read(0x7FFF)) == (0x42, 0x24)
+    # Loading a state puts its PRG RAM in the save
+    restored.cpu_write(0x6000, 0x00)
+    restored.load_state(state)
+    assert (tmp_path / 'battery.sav').read_bytes() == b'\x42' + bytes(0x1FFE) + b'\x24'
+
+    assert Cartridge(str(rom), battery_save=False).cpu_read(0x6000) == 0x00
+    assert Cartridge('nestest.nes').save_file is None
+
+
+def test_battery_save_not_possible(tmp_path):
+    rom = tmp_path / 'battery.nes'
+    data = bytearray(open('nestest.nes', 'rb').read())
+    data[6] |= 0x02
+    rom.write_bytes(data)
+    (tmp_path / 'battery.sav').mkdir()
+
+    cart = Cartridge(str(rom))
+    assert cart.save_file is None
+    cart.cpu_write(0x6000, 0x42)
+    assert cart.cpu_read(0x6000) == 0x42
+
+
+def test_headless_machines_leave_the_save_alone(tmp_path):
+    rom = tmp_path / 'battery.nes'
+    data = bytearray(open('nestest.nes', 'rb').read())
+    data[6] |= 0x02
+    rom.write_bytes(data)
+
+    nes = create_nes(str(rom))
+    nes.cpu_write(0x6000, 0x42)
+    nes.load_state(nes.save_state())
+    assert nes.cart.save_file is None
+    assert not (tmp_path / 'battery.sav').exists()
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from env import BUTTON_START, NesEnv
+from headless import create_nes
+from roms import create_rom
+
+
+def test_step_observes_last_frame():
+    env = NesEnv('nestest.nes', frame_skip=4, observation='indexed', actions=[0x00, BUTTON_START], max_steps=2)
+    observation = env.reset()
+    assert observation.shape == env.observation_shape == (120, 128)
+    assert not observation.any()
+
+    observation, reward, done, info = env.step(1)
+    assert np.array_equal(observation, env.nes.ppu.frame_buffer[::2, ::2])
+    assert observation.any()
+    assert env.nes.ppu.render_output
+    assert (reward, done, info) == (0.0, False, {'steps': 1, 'frames': 4})
+    assert env.step(0)[2]
+
+
+def test_reset_is_deterministic():
+    env = NesEnv('nestest.nes', frame_skip=4, downscale=4, reward=lambda nes: nes.cpu_ram[0x00])
+    out = np.zeros(env.observation_shape, dtype=np.uint8)
+    runs = []
+    for _ in range(2):
+        env.reset()
+        observation, reward, done, info = env.step(BUTTON_START, out=out)
+        assert observation is out
+        runs.append((out.copy(), reward, env.nes.save_state()))
+
+    assert np.array_equal(runs[0][0], runs[1][0])
+    assert runs[0][1:] == runs[1][1:]
+    assert out.max() > 0
+
+
+def test_unknown_observation():
+    with pytest.raises(ValueError):
+        NesEnv('nestest.nes', observation='rgb')
+
+
+def test_skipped_frames_match_rendering():
+    env = NesEnv('nestest.nes', frame_skip=4, observation='indexed', downscale=1)
+    env.reset()
+    observation = env.step(BUTTON_START)[0]
+
+    nes = create_nes('nestest.nes', recompile=True, scanline_renderer=True)
+    for _ in range(4):
+        nes.controller[0] = BUTTON_START
+        nes.run_frame()
+    assert np.array_equal(observation, nes.ppu.frame_buffer)
+    assert env.nes.cpu_ram == nes.cpu_ram
+
+
+# Moves a sprite along a pixel a frame. The NMI handler starts the OAM DMA
+# and only then writes the sprite for the next frame to the page, as games
+# do.
+SPRITE_PROGRAM = bytes([
+    0x78, 0xA2, 0xFF, 0x9A,              # C000 SEI, LDX #$FF, TXS
+    0xA9, 0x3F, 0x8D, 0x06, 0x20,        # C004 LDA #$3F, STA $2006
+    0xA9, 0x13, 0x8D, 0x06, 0x20,        # C009 LDA #$13, STA $2006
+    0xA9, 0x16, 0x8D, 0x07, 0x20,        # C00E LDA #$16, STA $2007   sprite colour
+    0xA2, 0x00, 0xA9, 0xF0,              # C013 LDX #$00, LDA #$F0
+    0x9D, 0x00, 0x02, 0xE8, 0xD0, 0xFA,  # C017 STA $0200,X, INX, BNE $C017
+    0xA9, 0x40, 0x85, 0x10,              # C01D LDA #$40, STA $10
+    0xA9, 0x88, 0x8D, 0x00, 0x20,        # C021 LDA #$88, STA $2000   NMI, sprites at $1000
+    0xA9, 0x14, 0x8D, 0x01, 0x20,        # C026 LDA #$14, STA $2001   sprites on
+    0x4C, 0x2B, 0xC0,                    # C02B JMP $C02B
+    0xA9, 0x02, 0x8D, 0x14, 0x40,        # C02E LDA #$02, STA $4014
+    0xA9, 0x50, 0x8D, 0x00, 0x02,        # C033 LDA #$50, STA $0200
+    0xA9, 0x00, 0x8D, 0x01, 0x02,        # C038 LDA #$00, STA $0201
+    0x8D, 0x02, 0x02,                    # C03D STA $0202
+    0xE6, 0x10, 0xA5, 0x10,              # C040 INC $10, LDA $10
+    0x8D, 0x03, 0x02,                    # C044 STA $0203
+    0x40,                                # C047 RTI
+])
+
+
+def test_recompiled_sprites_match_stepped(tmp_path):
+    # Tiles at $1000 are filled with 1s, a sprite shows a column of colour 3
+    rom = create_rom(tmp_path / 'sprite.nes', 0, 1, 1, chr_fill=0x1000,
+                     program=SPRITE_PROGRAM, vectors=(0xC02E, 0xC000, 0xC000))
+    env = NesEnv(rom, frame_skip=2, observation='indexed', downscale=1)
+    env.reset()
+    nes = create_nes(rom, scanline_renderer=True)
+    for _ in range(3):
+        observation = env.step(0)[0]
+        for _ in range(2):
+            while not nes.ppu.frame_complete:
+                nes.step()
+            nes.ppu.frame_complete = False
+
+        assert bytes(env.nes.ppu._oam) == bytes(nes.ppu._oam)
+        assert np.array_equal(observation, nes.ppu.frame_buffer)
+    assert observation.any()
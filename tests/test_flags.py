@@ -1,4 +1,4 @@
-from nes.cpu_6502 import CPU6502
+from nes.cpu_6502 import CPU6502, CPU6502State
 from nes.flags_6502 import Flags6502
 
 
@@ -31,3 +31,23 @@ def test_flags():
     assert status == 239
     status &= ~Flags6502.U
     assert status == 207
+
+
+def test_lazy_status():
+    state = CPU6502State()
+    for status in range(0x100):
+        state.status = status
+        assert state.status == status
+        for flag in (Flags6502.N, Flags6502.Z, Flags6502.C, Flags6502.V):
+            assert state.get_flag(flag) == (1 if status & flag else 0)
+
+    state.status = 0x00
+    state._nz = 0x80
+    assert state.status == Flags6502.N
+    state._nz = 0x00
+    assert state.status == Flags6502.Z
+
+    state.set_flag(Flags6502.N, True)
+    assert state.status == Flags6502.N | Flags6502.Z
+    state.set_flag(Flags6502.Z, False)
+    assert state.status == Flags6502.N
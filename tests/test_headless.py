@@ -0,0 +1,38 @@
+from headless import create_nes, main, run
+
+
+def test_run_frames():
+    nes = create_nes('nestest.nes')
+    result = run(nes, frames=2)
+    assert result.frames == 2
+    assert result.instructions == nes.cpu.instruction_count > 0
+    assert result.dots == nes.system_clock_counter
+    assert result.fps > 0
+
+
+def test_run_seconds():
+    result = run(create_nes('nestest.nes', scanline_renderer=True), seconds=0.1)
+    assert result.frames >= 1
+    assert result.seconds >= 0.1
+
+
+def test_run_timing_only():
+    nes = create_nes('nestest.nes', timing_only=True)
+    result = run(nes, frames=2)
+    expected = run(create_nes('nestest.nes'), frames=2)
+    assert (result.dots, result.instructions) == (expected.dots, expected.instructions)
+    assert not nes.ppu.frame_buffer.any()
+
+
+def test_main_dumps(tmp_path, capsys):
+    frame = tmp_path / 'frame.ppm'
+    ram = tmp_path / 'ram.bin'
+    main(['nestest.nes', '--frames', '1', '--warmup', '1', '--repeats', '2',
+          '--dump-frame', str(frame), '--dump-ram', str(ram)])
+
+    out = capsys.readouterr().out
+    assert 'run 2: 1 frames' in out
+    assert 'best:' in out
+    assert frame.read_bytes().startswith(b'P6\n256 240\n255\n')
+    assert len(frame.read_bytes()) == 15 + 256 * 240 * 3
+    assert len(ram.read_bytes()) == 2048
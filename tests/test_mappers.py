@@ -0,0 +1,181 @@
+from bus import Bus
+from cartridge import Cartridge, Mirror
+from roms import create_rom
+
+# Sets up the MMC3 to raise IRQ every 11 lines and waits, the IRQ handler
+# acknowledges it. NMI goes straight to the RTI. Placed at $E000 in the
+# last 8 KiB PRG bank.
+MMC3_IRQ_PROGRAM = bytes([
+    0x78,              # E000 SEI
+    0xA9, 0x08,        # E001 LDA #$08      sprites at $1000
+    0x8D, 0x00, 0x20,  # E003 STA $2000
+    0xA9, 0x18,        # E006 LDA #$18      rendering on
+    0x8D, 0x01, 0x20,  # E008 STA $2001
+    0xA9, 0x0A,        # E00B LDA #10
+    0x8D, 0x00, 0xC0,  # E00D STA $C000     IRQ latch
+    0x8D, 0x01, 0xC0,  # E010 STA $C001     IRQ reload
+    0x8D, 0x01, 0xE0,  # E013 STA $E001     IRQ enable
+    0x58,              # E016 CLI
+    0x4C, 0x17, 0xE0,  # E017 JMP $E017
+    0x8D, 0x00, 0xE0,  # E01A STA $E000     acknowledge
+    0x8D, 0x01, 0xE0,  # E01D STA $E001     enable again
+    0x40,              # E020 RTI
+])
+IRQ_HANDLER = 0xE01A
+
+
+def create_mapper_rom(path, mapper_id, program=b''):
+    # 8 KiB PRG and 1 KiB CHR banks filled with their bank numbers, the
+    # program at $E000 in the last PRG bank
+    return create_rom(path, mapper_id, 8, 16, prg_fill=0x2000, chr_fill=0x400,
+                      program=program, origin=0xE000, vectors=(0xE020, 0xE000, 0xE01A))
+
+
+def create_nes(rom):
+    nes = Bus(scanline_renderer=True)
+    nes.insert_cartridge(Cartridge(rom))
+    nes.reset()
+    return nes
+
+
+def test_mmc3_banks(tmp_path):
+    nes = create_nes(create_mapper_rom(tmp_path / 'mmc3.nes', 4))
+    cart = nes.cart
+    assert [nes.cpu_read(addr) for addr in (0x8000, 0xA000, 0xC000, 0xE000)] == [0, 1, 14, 15]
+
+    for register, bank in enumerate((8, 10, 20, 21, 22, 23, 3, 4)):
+        nes.cpu_write(0x8000, register)
+        nes.cpu_write(0x8001, bank)
+    assert [nes.cpu_read(addr) for addr in (0x8000, 0xA000, 0xC000, 0xE000)] == [3, 4, 14, 15]
+    assert [cart.ppu_read(addr) for addr in range(0, 0x2000, 0x400)] == [8, 9, 10, 11, 20, 21, 22, 23]
+
+    nes.cpu_write(0x8000, 0xC0)  # PRG mode 1 and CHR inversion
+    assert [nes.cpu_read(addr) for addr in (0x8000, 0xA000, 0xC000, 0xE000)] == [14, 4, 3, 15]
+    assert [cart.ppu_read(addr) for addr in range(0, 0x2000, 0x400)] == [20, 21, 22, 23, 8, 9, 10, 11]
+
+    nes.cpu_write(0xA000, 0x01)
+    assert cart.mirror == Mirror.HORIZONTAL
+    nes.cpu_write(0xA000, 0x00)
+    assert cart.mirror == Mirror.VERTICAL
+
+    nes.cpu_write(0x6000, 0x42)
+    nes.cpu_write(0xA001, 0xC0)  # write protected
+    nes.cpu_write(0x6000, 0x00)
+    assert nes.cpu_read(0x6000) == 0x42
+    nes.cpu_write(0xA001, 0x00)  # disabled
+    assert nes.cpu_read(0x6000) == 0x00
+
+
+def irq_lines(nes, count, sync):
+    # The lines the CPU entered the IRQ handler on
+    lines = []
+    pc = None
+    while len(lines) < count:
+        nes.step()
+        if sync:
+            nes.ppu.sync()
+        if nes.cpu.state.pc == IRQ_HANDLER and pc != IRQ_HANDLER:
+            scanline, cycle = nes.ppu.scanline, nes.ppu.cycle
+            lines.append((nes.ppu.frame_count, scanline, cycle, nes.system_clock_counter))
+        pc = nes.cpu.state.pc
+    return lines
+
+
+def test_mmc3_irq(tmp_path):
+    rom = create_mapper_rom(tmp_path / 'mmc3.nes', 4, MMC3_IRQ_PROGRAM)
+    lines = irq_lines(create_nes(rom), 30, sync=False)
+
+    # The PPU synced after every instruction clocks the counter right away
+    assert lines == irq_lines(create_nes(rom), 30, sync=True)
+    for (_, scanline, cycle, _), (_, next_scanline, _, _) in zip(lines, lines[1:]):
+        assert 260 < cycle < 341
+        if next_scanline > scanline:
+            assert next_scanline - scanline == 11
+
+
+def test_mmc3_irq_survives_load_state(tmp_path):
+    rom = create_mapper_rom(tmp_path / 'mmc3.nes', 4, MMC3_IRQ_PROGRAM)
+    nes = create_nes(rom)
+    irq_lines(nes, 3, sync=False)
+    state = nes.save_state()
+    expected = irq_lines(nes, 5, sync=False)
+
+    restored = create_nes(rom)
+    restored.load_state(state)
+    assert irq_lines(restored, 5, sync=False) == expected
+
+
+def test_rambo1_banks(tmp_path):
+    nes = create_nes(create_mapper_rom(tmp_path / 'rambo1.nes', 64))
+    cart = nes.cart
+    assert [nes.cpu_read(addr) for addr in (0x8000, 0xA000, 0xC000, 0xE000)] == [0, 1, 2, 15]
+
+    for register, bank in ((0, 8), (1, 10), (2, 20), (3, 21), (4, 22), (5, 23),
+                           (6, 3), (7, 4), (8, 30), (9, 31), (15, 5)):
+        nes.cpu_write(0x8000, register)
+        nes.cpu_write(0x8001, bank)
+    assert [nes.cpu_read(addr) for addr in (0x8000, 0xA000, 0xC000, 0xE000)] == [3, 4, 5, 15]
+    assert [cart.ppu_read(addr) for addr in range(0, 0x2000, 0x400)] == [8, 9, 10, 11, 20, 21, 22, 23]
+
+    nes.cpu_write(0x8000, 0x20)  # 1 KiB banks
+    assert [cart.ppu_read(addr) for addr in range(0, 0x2000, 0x400)] == [8, 30, 10, 31, 20, 21, 22, 23]
+
+    nes.cpu_write(0x8000, 0xE0)  # PRG mode 1 and CHR inversion
+    assert [nes.cpu_read(addr) for addr in (0x8000, 0xA000, 0xC000, 0xE000)] == [5, 3, 4, 15]
+    assert [cart.ppu_read(addr) for addr in range(0, 0x2000, 0x400)] == [20, 21, 22, 23, 8, 30, 10, 31]
+
+    nes.cpu_write(0xA000, 0x01)
+    assert cart.mirror == Mirror.HORIZONTAL
+    nes.cpu_write(0xA000, 0x00)
+    assert cart.mirror == Mirror.VERTICAL
+
+
+def test_rambo1_scanline_irq(tmp_path):
+    rom = create_mapper_rom(tmp_path / 'rambo1.nes', 64, MMC3_IRQ_PROGRAM)
+    lines = irq_lines(create_nes(rom), 30, sync=False)
+
+    assert lines == irq_lines(create_nes(rom), 30, sync=True)
+    for (_, scanline, cycle, _), (_, next_scanline, _, _) in zip(lines, lines[1:]):
+        assert 260 < cycle < 341
+        if next_scanline > scanline:
+            assert next_scanline - scanline == 11
+
+
+def rambo1_cycle_rom(tmp_path):
+    program = bytearray(MMC3_IRQ_PROGRAM)
+    program[0x0C] = 0x1F  # latch 31 and bit 0 of $C001 for CPU cycle mode
+    return create_mapper_rom(tmp_path / 'rambo1.nes', 64, bytes(program))
+
+
+def assert_cycle_irqs(lines):
+    # An IRQ every 32 clocks of 4 CPU cycles, taken at the end of an instruction
+    for (_, _, _, clock), (_, _, _, next_clock) in zip(lines, lines[1:]):
+        assert abs(next_clock - clock - 32 * 4 * 3) <= 7 * 3
+
+
+def test_rambo1_cycle_irq(tmp_path):
+    rom = rambo1_cycle_rom(tmp_path)
+    nes = create_nes(rom)
+    lines = irq_lines(nes, 40, sync=False)
+    assert_cycle_irqs(lines)
+
+    state = nes.save_state()
+    expected = irq_lines(nes, 5, sync=False)
+    restored = create_nes(rom)
+    restored.load_state(state)
+    assert irq_lines(restored, 5, sync=False) == expected
+
+
+def test_rambo1_cycle_irq_after_reset(tmp_path):
+    nes = create_nes(rambo1_cycle_rom(tmp_path))
+    irq_lines(nes, 5, sync=False)
+    for _ in range(50):
+        nes.step()
+    nes.reset()
+    assert nes.cart.mapper.irq_counter <= 0x100
+    nes.save_state()
+
+    lines = irq_lines(nes, 20, sync=False)
+    assert lines[0][3] < 2 * 32 * 4 * 3
+    assert_cycle_irqs(lines)
+    assert nes.cart.mapper.irq_counter <= 0x100
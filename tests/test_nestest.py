@@ -109,8 +109,8 @@ def test_nesttest(expected):
         p = nes.cpu.state.status
         sp = nes.cpu.state.stkp
         cycle_count = nes.cpu.state.clock_count
-        ppu_cycle = nes.ppu._cycle
-        ppu_scanline = nes.ppu._scanline
+        ppu_cycle = nes.ppu.cycle
+        ppu_scanline = nes.ppu.scanline
 
         opcode = nes.cpu.cpu_read(pc)
         mock_cpu.state.pc += 1
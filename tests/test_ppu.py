@@ -0,0 +1,141 @@
+import random
+
+import numpy as np
+
+from bus import Bus
+from cartridge import Cartridge
+
+
+def create_nes(scanline_renderer, seed):
+    # Random pattern, name table, palette and sprite data with rendering on
+    rnd = random.Random(seed)
+    nes = Bus(scanline_renderer=scanline_renderer)
+    nes.insert_cartridge(Cartridge('nestest.nes'))
+    ppu = nes.ppu
+    for memory in (nes.cart.chr_memory, ppu.vram_view, ppu.palette_view, ppu._oam):
+        memory[:] = bytes(rnd.randrange(256) for _ in range(len(memory)))
+    ppu.cpu_write(0x0000, rnd.randrange(0x40))
+    ppu.cpu_write(0x0001, 0x1E)
+    ppu.cpu_write(0x0005, rnd.randrange(256))
+    ppu.cpu_write(0x0005, rnd.randrange(240))
+    ppu._vram_addr.reg = ppu._tram_addr.reg
+    ppu._scanline = -1
+    return nes
+
+
+def ppu_state(ppu):
+    state = {k: v for k, v in vars(ppu).items() if isinstance(v, int)}
+    for name in ('scanline_renderer', 'render_output', '_deferred', '_event_dots', '_spr_zero_being_rendered'):
+        state.pop(name)
+    state['vram_addr'] = ppu._vram_addr.reg
+    state['status'] = ppu._status.reg
+    state['sprites'] = [vars(oam) for oam in ppu._sprite_scanline]
+    state['spr_shifter_ptrn_lo'] = list(ppu._spr_shifter_ptrn_lo)
+    state['spr_shifter_ptrn_hi'] = list(ppu._spr_shifter_ptrn_hi)
+    return state
+
+
+def clock(ppu, dots):
+    # The reference: every dot clocked on its own, nothing put off
+    for _ in range(dots):
+        ppu.clock()
+
+
+def test_scanline_renderer_matches_dots():
+    for seed in range(3):
+        dots = create_nes(scanline_renderer=False, seed=seed)
+        lines = create_nes(scanline_renderer=True, seed=seed)
+
+        for _ in range(341 * 262 // 9):
+            clock(dots.ppu, 9)
+            lines.ppu.run(9)
+
+        lines.ppu.sync()
+        assert np.array_equal(dots.ppu.frame_buffer, lines.ppu.frame_buffer)
+        assert np.array_equal(dots.ppu.frame_emphasis, lines.ppu.frame_emphasis)
+        assert ppu_state(dots.ppu) == ppu_state(lines.ppu)
+
+
+def test_mid_line_write_falls_back_to_dots():
+    dots = create_nes(scanline_renderer=False, seed=0)
+    lines = create_nes(scanline_renderer=True, seed=0)
+
+    clock(dots.ppu, 341 * 101 + 130)
+    lines.ppu.run(341 * 101 + 130)
+    for nes in (dots, lines):
+        nes.cpu_write(0x2001, 0x00)  # turn rendering off in the middle of line 100
+    assert lines.ppu._scanline == 100
+    assert lines.ppu._cycle == 130
+
+    clock(dots.ppu, 341 * 2)
+    lines.ppu.run(341 * 2)
+    lines.ppu.sync()
+    assert np.array_equal(dots.ppu.frame_buffer, lines.ppu.frame_buffer)
+    assert ppu_state(dots.ppu) == ppu_state(lines.ppu)
+
+
+def test_get_screen():
+    nes = create_nes(scanline_renderer=True, seed=0)
+    ppu = nes.ppu
+    ppu.frame_buffer[:] = 0x30
+    ppu.frame_buffer[10, 20] = 0x16
+    ppu.frame_emphasis[100] = 0b001  # emphasise red
+
+    screen = ppu.get_screen()
+    assert tuple(screen[0, 0]) == ppu.pal_screen[0x30]
+    assert tuple(screen[10, 20]) == ppu.pal_screen[0x16]
+    red, green, blue = ppu.pal_screen[0x30]
+    assert tuple(screen[100, 0]) == (red, round(green * 0.75), round(blue * 0.75))
+
+
+def test_render_output_off_keeps_timing():
+    for seed in range(3):
+        for scanline_renderer in (False, True):
+            dots = create_nes(scanline_renderer=False, seed=seed)
+            quiet = create_nes(scanline_renderer=scanline_renderer, seed=seed)
+            quiet.ppu.render_output = False
+
+            clock(dots.ppu, 341 * 262)
+            quiet.ppu.run(341 * 262)
+            quiet.ppu.sync()
+            assert not quiet.ppu.frame_buffer.any()
+            assert ppu_state(dots.ppu) == ppu_state(quiet.ppu)
+
+
+def test_timing_only_matches_dots():
+    def observable(ppu):
+        return ppu._status.reg, ppu._vram_addr.reg, ppu.nmi, ppu._scanline, ppu._cycle, ppu.frame_count
+
+    for seed in range(2):
+        dots = create_nes(scanline_renderer=False, seed=seed)
+        quick = create_nes(scanline_renderer=False, seed=seed)
+        quick.ppu.timing_only = True
+
+        for _ in range(341 * 262 * 2 // 7 + 1):
+            clock(dots.ppu, 7)
+            quick.ppu.run(7)
+            quick.ppu.sync()
+            assert observable(quick.ppu) == observable(dots.ppu)
+        assert quick.ppu.frame_count == 2
+        assert not quick.ppu.frame_buffer.any()
+
+
+def test_run_is_put_off_until_vblank():
+    nes = create_nes(scanline_renderer=True, seed=0)
+    ppu = nes.ppu
+    ppu.cpu_write(0x0000, 0x80)  # NMI at vblank
+    ppu.run(1)
+    ppu.run(341 * 100)
+    assert ppu._scanline == -1 and ppu._cycle == 1
+
+    ppu.run(341 * 142)
+    assert not ppu.nmi
+    ppu.run(1)
+    assert ppu.nmi
+    assert ppu._scanline == 241 and ppu._cycle == 2
+
+    reference = create_nes(scanline_renderer=False, seed=0)
+    reference.ppu.cpu_write(0x0000, 0x80)
+    clock(reference.ppu, 341 * 242 + 2)
+    assert np.array_equal(ppu.frame_buffer, reference.ppu.frame_buffer)
+    assert ppu_state(ppu) == ppu_state(reference.ppu)
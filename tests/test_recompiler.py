@@ -0,0 +1,127 @@
+import pytest
+
+from bus import Bus
+from cartridge import Cartridge
+from roms import create_rom
+
+
+def create_nes(recompile):
+    nes = Bus(recompile=recompile)
+    nes.insert_cartridge(Cartridge('nestest.nes'))
+    nes.cpu_write(0xFFFC, 0x00)
+    nes.reset()
+    return nes
+
+
+def test_blocks_match_instructions():
+    stepped = create_nes(recompile=False)
+    compiled = create_nes(recompile=True)
+
+    for _ in range(2000):
+        compiled.compiler.step()
+        while stepped.cpu.state.clock_count < compiled.cpu.state.clock_count:
+            stepped.cpu.step()
+
+        assert stepped.cpu.state == compiled.cpu.state
+        assert stepped.cpu.instruction_count == compiled.cpu.instruction_count
+        assert stepped.cpu_ram == compiled.cpu_ram
+
+
+def test_generated_block():
+    nes = create_nes(recompile=True)
+    block = nes.compiler.decode(0xC000)
+    assert [pc for pc, _, _ in block] == [0xC000]  # JMP $C5F5
+
+    source = nes.compiler.generate(block)
+    assert 'state.addr_abs = 0xC5F5' in source
+    assert 'JMP(cpu)' in source
+
+
+def test_ram_blocks_are_invalidated():
+    nes = create_nes(recompile=True)
+    nes.cpu_write(0x0300, 0xE8)  # INX
+    nes.cpu_write(0x0301, 0x60)  # RTS
+    nes.cpu.step()
+
+    nes.cpu.state.pc = 0x0300
+    nes.compiler.step()
+    assert 0x0300 in nes.compiler._windows[0]
+    assert nes.compiler.code_pages[3]
+
+    nes.cpu_write(0x0B01, 0x00)  # mirror of $0301
+    assert 0x0300 not in nes.compiler._windows[0]
+    assert not nes.compiler.code_pages[3]
+
+
+def test_frames_match_instructions(tmp_path):
+    # Sets the colour emphasis through a pointer in the middle of a loop and
+    # moves on what it sets in the NMI handler, so the frame shows when each
+    # write and NMI happened
+    program = bytes([
+        0x78, 0xA2, 0xFF, 0x9A,              # SEI, LDX #$FF, TXS
+        0xA9, 0x80, 0x8D, 0x00, 0x20,        # LDA #$80, STA $2000
+        0xA9, 0x01, 0x85, 0x00,              # LDA #$01, STA $00
+        0xA9, 0x20, 0x85, 0x01,              # LDA #$20, STA $01
+        0xA0, 0x00,                          # LDY #$00
+        0xE8, 0x8A, 0x29, 0xE0, 0x09, 0x0A,  # $C013: INX, TXA, AND #$E0, ORA #$0A
+        0xE6, 0x02, 0xE6, 0x02,              # INC $02, INC $02
+        0x91, 0x00,                          # STA ($00),Y
+        0x4C, 0x13, 0xC0,                    # JMP $C013
+        0xE8, 0xE8, 0xE8, 0x40,              # $C022: INX, INX, INX, RTI
+    ])
+    rom = create_rom(tmp_path / 'emphasis.nes', 0, 1, 1, program=program, vectors=(0xC022, 0xC000, 0xC000))
+
+    screens = []
+    for recompile in (False, True):
+        nes = Bus(recompile=recompile)
+        nes.insert_cartridge(Cartridge(rom))
+        nes.reset()
+        for _ in range(4):
+            nes.run_frame()
+        nes.ppu.sync()
+        screens.append(nes.ppu.get_screen().copy())
+    assert (screens[0] == screens[1]).all()
+
+
+@pytest.mark.parametrize('dma', [
+    bytes([0x8D, 0x14, 0x40]),  # STA $4014
+    bytes([0x9D, 0x00, 0x40]),  # STA $4000,X
+    bytes([0x91, 0x00, 0xEA]),  # STA ($00),Y, NOP
+], ids=['absolute', 'indexed', 'indirect'])
+def test_dma_copies_the_page_as_written_before(tmp_path, dma):
+    program = bytes([
+        0xA9, 0x14, 0x85, 0x00,  # LDA #$14, STA $00
+        0xA9, 0x40, 0x85, 0x01,  # LDA #$40, STA $01
+        0xA2, 0x14, 0xA0, 0x00,  # LDX #$14, LDY #$00
+        0xA9, 0x11,              # LDA #$11
+        0x8D, 0x00, 0x02,        # STA $0200
+        0xA9, 0x02,              # LDA #$02
+    ]) + dma + bytes([
+        0xA9, 0x99,              # LDA #$99
+        0x8D, 0x00, 0x02,        # STA $0200
+        0x4C, 0x1B, 0xC0,        # $C01B: JMP $C01B
+    ])
+    rom = create_rom(tmp_path / 'dma.nes', 0, 1, 1, program=program, vectors=(0xC000, 0xC000, 0xC000))
+
+    for recompile in (False, True):
+        nes = Bus(recompile=recompile)
+        nes.insert_cartridge(Cartridge(rom))
+        nes.reset()
+        while nes.cpu.state.pc != 0xC01B:
+            nes.step()
+        assert nes.cpu_ram[0x0200] == 0x99
+        assert nes.ppu._oam[0] == 0x11
+
+
+def test_frames_end_as_without_compiler():
+    machines = []
+    for recompile in (False, True):
+        nes = Bus(recompile=recompile)
+        nes.insert_cartridge(Cartridge('test_roms/instructions/01-implied.nes'))
+        nes.reset()
+        nes.ppu.timing_only = True
+        machines.append(nes)
+    for _ in range(30):
+        for nes in machines:
+            nes.run_frame()
+        assert machines[1].save_state() == machines[0].save_state()
@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+from bus import Bus
+from cartridge import Cartridge
+from rewind import RewindBuffer, apply_delta, xor_delta
+
+
+def test_xor_delta_round_trip():
+    rnd = random.Random(0)
+    old = bytes(rnd.randrange(256) for _ in range(4096))
+    new = bytearray(old)
+    for i in rnd.sample(range(4096), 50) + list(range(1000, 1100)):
+        new[i] ^= rnd.randrange(1, 256)
+
+    delta = xor_delta(old, bytes(new))
+    assert len(delta) < 500
+    assert xor_delta(old, old) == b''
+
+    state = bytearray(old)
+    apply_delta(state, delta)
+    assert state == new
+    apply_delta(state, delta)
+    assert state == old
+
+
+def test_rewind_restores_recorded_frames():
+    nes = Bus()
+    nes.insert_cartridge(Cartridge('nestest.nes'))
+    nes.reset()
+    rewind = RewindBuffer(nes, capacity=12, keyframe_interval=4)
+
+    states = []
+    for _ in range(20):
+        nes.run_frame()
+        rewind.record()
+        states.append(nes.save_state())
+
+    # The oldest frames are dropped up to a keyframe
+    assert 12 - 4 < len(rewind) <= 12
+    assert rewind.nbytes < sum(len(state) for state in states[-len(rewind):])
+
+    assert rewind.rewind(5) == 5
+    assert nes.save_state() == states[-6]
+    assert rewind.rewind(0) == 0
+    assert nes.save_state() == states[-6]
+
+    # Recording continues from the restored frame
+    nes.run_frame()
+    rewind.record()
+    assert rewind.rewind(1) == 1
+    assert nes.save_state() == states[-6]
+
+    frames = len(rewind)
+    assert rewind.rewind(1000) == frames - 1
+    assert nes.save_state() == states[-6 - (frames - 1)]
+    assert len(rewind) == 1
+
+
+def test_rewind_keeps_to_max_bytes():
+    nes = Bus()
+    nes.insert_cartridge(Cartridge('nestest.nes'))
+    nes.reset()
+    rewind = RewindBuffer(nes, keyframe_interval=4, max_bytes=1)
+
+    states = []
+    for _ in range(10):
+        nes.run_frame()
+        rewind.record()
+        states.append(nes.save_state())
+
+        # Only the frames since the latest keyframe are left
+        assert 1 <= len(rewind) <= 4
+        kept = states[len(states) - len(rewind):]
+        assert rewind.nbytes == len(kept[0]) + sum(len(xor_delta(old, new)) for old, new in zip(kept, kept[1:]))
+
+    frames = len(rewind)
+    assert rewind.rewind(1000) == frames - 1
+    assert nes.save_state() == states[-frames]
+
+
+def test_rewind_needs_a_keyframe_interval():
+    with pytest.raises(ValueError):
+        RewindBuffer(Bus(), capacity=10, keyframe_interval=60)
@@ -0,0 +1,32 @@
+from cartridge import Cartridge
+from roms import create_rom
+from tile_cache import decode_tiles
+
+
+def test_decode_tiles():
+    tile = bytes([0b10000001] * 8 + [0b11000000] * 8)
+    pixels = decode_tiles(tile)
+    assert pixels.shape == (1, 8, 8)
+    assert list(pixels[0, 3]) == [3, 2, 0, 0, 0, 0, 0, 1]
+
+
+def test_chr_ram_write_invalidates_tiles(tmp_path):
+    cart = Cartridge(create_rom(tmp_path / 'chr_ram.nes', 0, 2))
+    assert not cart.tiles.table(1).any()
+
+    cart.ppu_write(0x1010, 0xFF)  # low plane of the first row of tile 1
+    tiles = cart.tiles.table(1)
+    assert list(tiles[1, 0]) == [1] * 8
+    assert not tiles[1, 1:].any()
+    assert not cart.tiles.table(0).any()
+
+
+def test_chr_switch_changes_tables(tmp_path):
+    cart = Cartridge(create_rom(tmp_path / 'gxrom.nes', 66, 2, 4))
+    assert not cart.tiles.table(0).any()
+
+    cart.cpu_write(0x8000, 0x03)  # CHR bank 3, every byte is 0b00000011
+    assert list(cart.tiles.table(0)[0x40, 7]) == [0, 0, 0, 0, 0, 0, 3, 3]
+
+    cart.cpu_write(0x8000, 0x01)
+    assert list(cart.tiles.table(1)[0xFF, 0]) == [0, 0, 0, 0, 0, 0, 0, 3]
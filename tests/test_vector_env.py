@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from env import BUTTON_START, NesEnv
+from vector_env import VectorNesEnv
+
+
+def test_vector_env_matches_single_env():
+    env = NesEnv('nestest.nes', frame_skip=4, downscale=4)
+    env.reset()
+    expected = env.step(BUTTON_START)[0]
+
+    with VectorNesEnv(['nestest.nes'] * 2, frame_skip=4, downscale=4, max_steps=1) as vector_env:
+        observations = vector_env.reset()
+        assert observations.shape == (2, 60, 64)
+        first = observations.copy()
+
+        observations, rewards, dones, infos = vector_env.step([BUTTON_START, 0x00])
+        assert list(rewards) == [0.0, 0.0]
+        assert list(dones) == [True, True]
+        assert infos[0] == {'steps': 1, 'frames': 4}
+        # done environments are reset straight away
+        assert np.array_equal(observations, first)
+
+        with pytest.raises(ValueError):
+            vector_env.step([0x00])
+
+    assert vector_env.closed
+    assert not np.array_equal(expected, first[0])
+
+
+def test_vector_env_observations():
+    env = NesEnv('nestest.nes', frame_skip=4, observation='indexed')
+    env.reset()
+    expected = env.step(0x00)[0]
+
+    with VectorNesEnv(['nestest.nes'] * 2, frame_skip=4, observation='indexed') as vector_env:
+        vector_env.reset()
+        observations = vector_env.step(np.array([0x00, 0x00]))[0]
+        assert np.array_equal(observations[0], expected)
+        assert np.array_equal(observations[1], expected)
+
+
+def test_vector_env_reports_failed_workers():
+    with pytest.raises(RuntimeError, match='FileNotFoundError'):
+        VectorNesEnv(['nestest.nes', 'missing.nes'])